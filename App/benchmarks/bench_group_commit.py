@@ -0,0 +1,75 @@
+"""Durable small writes from many threads: one fsync per write vs GroupCommit sharing flushes.
+
+    python benchmarks/bench_group_commit.py [--threads 32] [--writes 20] [--dir PATH]
+
+Run it on the disk the vault lives on; fsync cost is what is being measured.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.durability import GroupCommit, fsync_path  # noqa: E402
+
+WRITE_SIZE = 4096
+
+
+def _write(path: str) -> None:
+    with open(path, 'wb') as f:
+        f.write(os.urandom(WRITE_SIZE))
+
+
+def serial(directory: str, total: int) -> float:
+    start = time.perf_counter()
+    for n in range(total):
+        path = os.path.join(directory, f'serial-{n}')
+        _write(path)
+        fsync_path(path)
+        fsync_path(directory)
+    return time.perf_counter() - start
+
+
+def grouped(directory: str, threads: int, writes: int) -> GroupCommit:
+    commit = GroupCommit()
+
+    def work(worker: int) -> None:
+        for n in range(writes):
+            path = os.path.join(directory, f'group-{worker}-{n}')
+            _write(path)
+            commit.sync(path, directory)
+
+    workers = [threading.Thread(target=work, args=(worker,)) for worker in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return commit
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--writes', type=int, default=20)
+    parser.add_argument('--dir', default=None, help="directory on the disk to measure (default: a temp dir)")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(dir=args.dir)
+    try:
+        total = args.threads * args.writes
+        elapsed = serial(directory, total)
+        print(f' serial: {total} writes, {total} flushes, {elapsed:.2f} s')
+        start = time.perf_counter()
+        commit = grouped(directory, args.threads, args.writes)
+        elapsed = time.perf_counter() - start
+        print(f'grouped: {commit.requests} writes, {commit.flushes} flushes, {elapsed:.2f} s')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Index open cost on a synthetic vault: legacy JSON snapshot vs the paged binary one.
+
+    python benchmarks/bench_index.py [--entries 100000]
+
+Each snapshot is opened in a fresh interpreter, so RSS growth is not skewed by the other run.
+"""
+import argparse
+import gc
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+logging.getLogger('Logger').disabled = True
+
+from src.core.storage import SecureStorage  # noqa: E402
+from src.core.vault import open_vault  # noqa: E402
+
+PASSWORD = 'benchmark'
+FILES_PER_SCENE = 100
+
+
+def _asset(scene: int, asset: int) -> str:
+    return f'root/project{scene % 10}/scene{scene}/asset_{asset:03d}.png'
+
+
+def build(base_path: str, entries: int) -> None:
+    os.makedirs(base_path)
+    storage = SecureStorage(base_path, PASSWORD)
+    with storage.batch():
+        for n in range(entries):
+            scene, asset = divmod(n, FILES_PER_SCENE)
+            digest = hashlib.sha256(_asset(scene, asset).encode()).hexdigest()
+            storage.add_file(_asset(scene, asset), storage.blob_root, 1000 + asset, digest)
+    storage.compact()
+    storage.close()
+
+
+def write_legacy(base_path: str) -> None:
+    # The snapshot the index was stored as before the binary format: one JSON tree in a single container.
+    storage = SecureStorage(base_path, PASSWORD)
+    tree = json.dumps({"_seq": storage.seq, "root": storage.paths.to_tree()}).encode()
+    with open(storage.index_file, 'wb') as f:
+        f.write(storage.encryptor.encrypt(tree, PASSWORD))
+    storage.close()
+
+
+def measure(base_path: str, lookup: str) -> None:
+    vault = open_vault(base_path, PASSWORD)
+    vault.warm_up()
+    process = psutil.Process()
+    gc.collect()
+    rss = process.memory_info().rss
+    start = time.perf_counter()
+    storage = SecureStorage(base_path, PASSWORD, vault=vault)
+    opened = time.perf_counter() - start
+    start = time.perf_counter()
+    storage.get_file_path(lookup)
+    looked_up = time.perf_counter() - start
+    gc.collect()
+    grown = process.memory_info().rss - rss
+    pages = getattr(getattr(storage.paths, '_source', None), 'pages', None)
+    touched = f'{pages.loads}/{-(-pages.length // pages.page_size)}' if pages is not None else 'all'
+    print(json.dumps({"open_ms": opened * 1000, "lookup_ms": looked_up * 1000, "rss_mib": grown / 2**20,
+                      "index_bytes": os.path.getsize(storage.index_file), "pages": touched}))
+
+
+def _run(base_path: str, lookup: str) -> dict:
+    output = subprocess.run([sys.executable, __file__, '--measure', base_path, lookup], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--measure', nargs=2, metavar=('BASE_PATH', 'LOOKUP'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    workdir = tempfile.mkdtemp()
+    try:
+        binary, legacy = os.path.join(workdir, 'binary'), os.path.join(workdir, 'json')
+        build(binary, args.entries)
+        shutil.copytree(binary, legacy)
+        write_legacy(legacy)
+        lookup = _asset(args.entries // FILES_PER_SCENE // 2, 42 % FILES_PER_SCENE)
+        print(f'{args.entries} entries, looking up {lookup}')
+        for label, base_path in (('json', legacy), ('binary', binary)):
+            result = _run(base_path, lookup)
+            print(f'{label:>6}: open {result["open_ms"]:8.1f} ms  first lookup {result["lookup_ms"]:6.2f} ms  '
+                  f'rss +{result["rss_mib"]:6.1f} MiB  index {result["index_bytes"] / 2**20:5.1f} MiB  '
+                  f'pages {result["pages"]}')
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,7 @@ import time
 import os
 from datetime import datetime
 import inspect
-from typing import Any, Callable, Dict, Optional, Union, Type
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union, Type
 import json
 import contextlib
 import psutil
@@ -12,90 +12,392 @@ import uuid
 import cProfile
 import pstats
 import io
-from collections import defaultdict
-from logging.handlers import RotatingFileHandler
+import re
+import random
+import reprlib
+import queue
+import atexit
+import threading
+import warnings
+import weakref
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Arguments whose name matches are never formatted into a trace line.
+SENSITIVE_ARGUMENT = re.compile(r'password|passphrase|secret|token|key|plaintext|content', re.IGNORECASE)
+REDACTED = '<redacted>'
+
+QUEUE_DROP = 'drop'
+QUEUE_BLOCK = 'block'
+QUEUE_POLICIES = (QUEUE_DROP, QUEUE_BLOCK)
+
+# Variable parts of an error message, replaced so that errors differing only in them share a budget.
+_TEMPLATE_PATTERNS = (
+    (re.compile(r'[^\s\'"]*[\\/][^\s\'"]*'), '<path>'),
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<uuid>'),
+    (re.compile(r'\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}\b'), '<hex>'),
+    (re.compile(r'\d+'), '<n>'),
+)
+MAX_TEMPLATE_LENGTH = 256
+# LogRecord attributes that caller-supplied extra fields may not overwrite.
+RESERVED_RECORD_FIELDS = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+# How often suppressed-error summaries that have come due are written when no new errors arrive.
+SUMMARY_POLL_INTERVAL = 1.0
+
+
+class _ArgumentRepr(reprlib.Repr):
+    # Payloads are described, never formatted, even inside containers: repr() of file contents costs
+    # O(file size) and would copy plaintext into the log.
+    def repr_bytes(self, value: bytes, level: int) -> str:
+        return f"<bytes len={len(value)}>"
+
+    def repr_bytearray(self, value: bytearray, level: int) -> str:
+        return f"<bytearray len={len(value)}>"
+
+    def repr_memoryview(self, value: memoryview, level: int) -> str:
+        return f"<memoryview len={value.nbytes}>"
+
+
+class _BoundedQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue, policy: str, block_timeout: Optional[float]) -> None:
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.policy == QUEUE_BLOCK:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class _DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Blocks rather than failing on a full queue, so stop() always drains what was accepted.
+        self.queue.put(self._sentinel)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        log_data = {
+            'timestamp': self.formatTime(record, self.datefmt),
+            'name': record.name,
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        return json.dumps(log_data)
+
+
+class _ErrorLimiter:
+    # One token bucket per message template, capped at `capacity` templates with the least recently seen evicted.
+    def __init__(self, threshold: int, window: float, capacity: int = 1024,
+                 summary_interval: float = 60.0) -> None:
+        self.threshold = threshold
+        self.window = window
+        self.capacity = capacity
+        self.summary_interval = summary_interval
+        # template -> [tokens, last refill, suppressed since last summary, last summary]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(message: str) -> str:
+        template = message[:MAX_TEMPLATE_LENGTH]
+        for pattern, placeholder in _TEMPLATE_PATTERNS:
+            template = pattern.sub(placeholder, template)
+        return template
+
+    @staticmethod
+    def _summarize(template: str, bucket: list, now: float) -> str:
+        suppressed, bucket[2], bucket[3] = bucket[2], 0, now
+        return f"{suppressed} similar errors suppressed: {template}"
+
+    def admit(self, message: str, now: Optional[float] = None) -> Tuple[bool, List[str]]:
+        now = time.monotonic() if now is None else now
+        template = self.fingerprint(message)
+        notices = []
+        with self._lock:
+            bucket = self._buckets.get(template)
+            if bucket is None:
+                if len(self._buckets) >= self.capacity:
+                    evicted, old = self._buckets.popitem(last=False)
+                    if old[2]:
+                        notices.append(self._summarize(evicted, old, now))
+                bucket = self._buckets[template] = [float(self.threshold), now, 0, now]
+            else:
+                self._buckets.move_to_end(template)
+                bucket[0] = min(float(self.threshold), bucket[0] + (now - bucket[1]) * self.threshold / self.window)
+                bucket[1] = now
+            if bucket[0] >= 1.0:
+                bucket[0] -= 1.0
+                if bucket[2]:
+                    notices.append(self._summarize(template, bucket, now))
+                return True, notices
+            bucket[2] += 1
+            if bucket[2] == 1:
+                bucket[3] = now
+                notices.append(f"Suppressing similar errors for: {template}")
+            elif now - bucket[3] >= self.summary_interval:
+                notices.append(self._summarize(template, bucket, now))
+            return False, notices
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [self._summarize(template, bucket, now) for template, bucket in self._buckets.items()
+                    if bucket[2] and now - bucket[3] >= self.summary_interval]
+
+    def flush(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [self._summarize(template, bucket, now)
+                    for template, bucket in self._buckets.items() if bucket[2]]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class _LogBackend:
+    # Handlers, the rotating file and the async queue are process-wide; Logger instances are facades over them.
+    def __init__(self) -> None:
+        self.logger = logging.getLogger('Logger')
+        self.handlers: tuple = ()
+        self.queue_handler: Optional[_BoundedQueueHandler] = None
+        self.listener: Optional[QueueListener] = None
+        self.log_file_path: Optional[str] = None
+        self.settings: Optional[Tuple[str, bool, int, int]] = None
+        self._lock = threading.RLock()
+        self._facades: "weakref.WeakSet[Logger]" = weakref.WeakSet()
+        self._summary_thread: Optional[threading.Thread] = None
+
+    def register(self, facade: 'Logger') -> None:
+        # One summary thread and one exit hook serve every Logger, and neither keeps a Logger alive.
+        with self._lock:
+            self._facades.add(facade)
+            if self._summary_thread is None:
+                self._summary_thread = threading.Thread(target=self._write_due_summaries,
+                                                        name='log-summaries', daemon=True)
+                self._summary_thread.start()
+                atexit.register(self.flush_suppressed)
+
+    def _write_due_summaries(self) -> None:
+        while True:
+            time.sleep(SUMMARY_POLL_INTERVAL)
+            for facade in list(self._facades):
+                facade.flush_due()
+
+    def flush_suppressed(self) -> None:
+        for facade in list(self._facades):
+            facade.flush_suppressed()
+
+    def setup(self, log_file: str, use_json: bool, max_log_size: int, backup_count: int,
+              async_mode: bool, queue_size: int, queue_policy: str,
+              block_timeout: Optional[float]) -> logging.Logger:
+        with self._lock:
+            if not self.handlers:
+                self.configure(log_file, use_json, max_log_size, backup_count)
+            elif (log_file, use_json, max_log_size, backup_count) != self.settings:
+                warnings.warn(f"Logging is already configured with (log_file, use_json, max_log_size, backup_count)"
+                              f" = {self.settings}; use configure_logging() to change it", RuntimeWarning,
+                              stacklevel=3)
+            if async_mode and self.listener is None:
+                self.start_async(queue_size, queue_policy, block_timeout)
+            return self.logger
+
+    def configure(self, log_file: str = 'app.log', use_json: bool = False,
+                  max_log_size: int = 10*1024*1024, backup_count: int = 5,
+                  level: int = logging.INFO) -> logging.Logger:
+        with self._lock:
+            self.shutdown()
+            for handler in self.handlers:
+                self.logger.removeHandler(handler)
+                handler.close()
+
+            logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+            os.makedirs(logs_dir, exist_ok=True)
+            self.log_file_path = os.path.join(logs_dir, log_file)
+            self.settings = (log_file, use_json, max_log_size, backup_count)
+
+            self.logger.setLevel(level)
+            # The backend has its own handlers; passing records on to a root configured by basicConfig
+            # would write each of them twice.
+            self.logger.propagate = False
+
+            c_handler = logging.StreamHandler()
+            f_handler = RotatingFileHandler(self.log_file_path, maxBytes=max_log_size, backupCount=backup_count)
+            c_handler.setLevel(logging.WARNING)
+            f_handler.setLevel(logging.DEBUG)
+
+            if use_json:
+                c_handler.setFormatter(JsonFormatter('%(asctime)s'))
+                f_handler.setFormatter(JsonFormatter('%(asctime)s'))
+            else:
+                c_handler.setFormatter(logging.Formatter('%(name)s - %(levelname)s - %(message)s'))
+                f_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+            self.logger.addHandler(c_handler)
+            self.logger.addHandler(f_handler)
+            self.handlers = (c_handler, f_handler)
+
+            self.logger.info(f"Logging to file: {self.log_file_path}")
+            return self.logger
+
+    def start_async(self, queue_size: int = 10000, queue_policy: str = QUEUE_DROP,
+                    block_timeout: Optional[float] = None) -> None:
+        if queue_policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy: {queue_policy}")
+        with self._lock:
+            self.shutdown()
+            # Formatting and file I/O move to the listener thread; callers only pay for an enqueue.
+            for handler in self.handlers:
+                self.logger.removeHandler(handler)
+            log_queue = queue.Queue(maxsize=queue_size)
+            self.queue_handler = _BoundedQueueHandler(log_queue, queue_policy, block_timeout)
+            self.listener = _DrainingQueueListener(log_queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+            self.logger.addHandler(self.queue_handler)
+            atexit.register(self.shutdown)
+
+    @property
+    def dropped_records(self) -> int:
+        return self.queue_handler.dropped if self.queue_handler is not None else 0
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self.listener is None:
+                return
+            self.logger.removeHandler(self.queue_handler)
+            listener, self.listener = self.listener, None
+            listener.stop()
+            if self.queue_handler.dropped:
+                record = self.logger.makeRecord(self.logger.name, logging.WARNING, __file__, 0,
+                                                f"{self.queue_handler.dropped} log records were dropped "
+                                                f"because the log queue was full", None, None)
+                listener.handle(record)
+            for handler in listener.handlers:
+                handler.flush()
+                self.logger.addHandler(handler)
+            atexit.unregister(self.shutdown)
+
+
+_backend = _LogBackend()
+
+
+def configure_logging(log_file: str = 'app.log', use_json: bool = False,
+                      max_log_size: int = 10*1024*1024, backup_count: int = 5, async_mode: bool = False,
+                      queue_size: int = 10000, queue_policy: str = QUEUE_DROP,
+                      block_timeout: Optional[float] = None, level: int = logging.INFO) -> logging.Logger:
+    logger = _backend.configure(log_file, use_json, max_log_size, backup_count, level)
+    if async_mode:
+        _backend.start_async(queue_size, queue_policy, block_timeout)
+    return logger
+
 
 class Logger:
     def __init__(self, log_file: str = 'app.log', use_json: bool = False, 
                  max_log_size: int = 10*1024*1024, backup_count: int = 5,
-                 error_threshold: int = 10, error_window: int = 3600):
-        self.logger = self._setup_logger(log_file, use_json, max_log_size, backup_count)
+                 error_threshold: int = 10, error_window: int = 3600, error_capacity: int = 1024,
+                 error_summary_interval: float = 60.0,
+                 trace_level: int = logging.DEBUG, trace_sample_rate: float = 1.0,
+                 max_arg_length: int = 80, async_mode: bool = False, queue_size: int = 10000,
+                 queue_policy: str = QUEUE_DROP, block_timeout: Optional[float] = None):
+        if queue_policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy: {queue_policy}")
+        # The first Logger configures the shared backend; later ones reuse it and only add their own settings.
+        # Changing the file, format or rotation of the backend afterwards goes through configure_logging().
+        self.backend = _backend
+        self.logger = self.backend.setup(log_file, use_json, max_log_size, backup_count,
+                                         async_mode, queue_size, queue_policy, block_timeout)
         self.use_json = use_json
         self.trace_id = None
-        self.error_counts = defaultdict(int)
-        self.error_threshold = error_threshold
-        self.error_window = error_window
-
-    def _setup_logger(self, log_file: str, use_json: bool, max_log_size: int, backup_count: int) -> logging.Logger:
-        logs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
-        os.makedirs(logs_dir, exist_ok=True)
-        log_file_path = os.path.join(logs_dir, log_file)
-
-        logger = logging.getLogger('Logger')
-        logger.setLevel(logging.DEBUG)
-
-        c_handler = logging.StreamHandler()
-        f_handler = RotatingFileHandler(log_file_path, maxBytes=max_log_size, backupCount=backup_count)
-        c_handler.setLevel(logging.WARNING)
-        f_handler.setLevel(logging.DEBUG)
-
-        if use_json:
-            formatter = self.JsonFormatter('%(asctime)s')
-        else:
-            c_format = logging.Formatter('%(name)s - %(levelname)s - %(message)s')
-            f_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            c_handler.setFormatter(c_format)
-            f_handler.setFormatter(f_format)
-
-        c_handler.setFormatter(formatter)
-        f_handler.setFormatter(formatter)
-
-        logger.addHandler(c_handler)
-        logger.addHandler(f_handler)
-
-        logger.info(f"Logging to file: {log_file_path}")
-        return logger
-
-    class JsonFormatter(logging.Formatter):
-        def format(self, record):
-            log_data = {
-                'timestamp': self.formatTime(record, self.datefmt),
-                'name': record.name,
-                'level': record.levelname,
-                'message': record.getMessage(),
-            }
-            return json.dumps(log_data)
+        self.error_limiter = _ErrorLimiter(error_threshold, error_window, error_capacity, error_summary_interval)
+        self.backend.register(self)
+        self.trace_level = trace_level
+        self.trace_sample_rate = trace_sample_rate
+        self._arg_repr = _ArgumentRepr()
+        self._set_max_arg_length(max_arg_length)
 
-    def _log_function(self, func: Callable) -> Callable:
-        @functools.wraps(func)
-        def wrapper(*args: Any, **kwargs: Any) -> Any:
-            sig = inspect.signature(func)
-            bound_args = sig.bind(*args, **kwargs)
-            bound_args.apply_defaults()
+    def _set_max_arg_length(self, max_arg_length: int) -> None:
+        self._arg_repr.maxstring = max_arg_length
+        self._arg_repr.maxother = max_arg_length
+        self._arg_repr.maxlevel = 2
 
-            arg_str = ", ".join(f"{k}={v!r}" for k, v in bound_args.arguments.items())
-            self.logger.info(f"Calling {func.__name__}({arg_str})")
+    def configure_tracing(self, level: Optional[Union[int, str]] = None, sample_rate: Optional[float] = None,
+                          max_arg_length: Optional[int] = None) -> None:
+        if level is not None:
+            self.trace_level = getattr(logging, level.upper()) if isinstance(level, str) else level
+            # The backend logs at INFO, so DEBUG traces stay off until a level is asked for here.
+            if not self.logger.isEnabledFor(self.trace_level):
+                self.logger.setLevel(self.trace_level)
+        if sample_rate is not None:
+            if not 0.0 <= sample_rate <= 1.0:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.trace_sample_rate = sample_rate
+        if max_arg_length is not None:
+            self._set_max_arg_length(max_arg_length)
 
-            start_time = time.time()
+    @property
+    def handlers(self) -> tuple:
+        return self.backend.handlers
 
+    @property
+    def dropped_records(self) -> int:
+        return self.backend.dropped_records
+
+    def flush_due(self) -> None:
+        for notice in self.error_limiter.due():
+            self._log("ERROR", notice)
+
+    def flush_suppressed(self) -> None:
+        for notice in self.error_limiter.flush():
+            self._log("ERROR", notice)
+
+    def shutdown(self) -> None:
+        self.flush_suppressed()
+        self.backend.shutdown()
+
+    JsonFormatter = JsonFormatter
+
+    def _log_function(self, func: Callable) -> Callable:
+        # Everything that depends only on the function is worked out once, at decoration time.
+        signature = inspect.signature(func)
+        redacted = {name for name in signature.parameters if SENSITIVE_ARGUMENT.search(name)}
+        name = func.__qualname__
+        logger = self.logger
+
+        def format_call(args: tuple, kwargs: dict) -> str:
+            try:
+                arguments = signature.bind(*args, **kwargs).arguments
+            except TypeError:
+                return "..."
+            return ", ".join(
+                f"{k}={REDACTED if k in redacted else self._arg_repr.repr(v)}"
+                for k, v in arguments.items() if k not in ('self', 'cls')
+            )
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            level = self.trace_level
+            traced = logger.isEnabledFor(level) and (self.trace_sample_rate >= 1.0
+                                                     or random.random() < self.trace_sample_rate)
+            start_time = time.perf_counter() if traced else 0.0
             try:
                 result = func(*args, **kwargs)
-                self.logger.info(f"{func.__name__} completed successfully")
-                
-                if result is None:
-                    self.logger.debug(f"{func.__name__} returned None")
-                elif isinstance(result, (int, float, str, bool)):
-                    self.logger.debug(f"{func.__name__} returned: {result}")
-                else:
-                    self.logger.debug(f"{func.__name__} returned: {type(result).__name__}")
-                
-                return result
             except Exception as e:
-                self.logger.exception(f"Exception in {func.__name__}: {str(e)}")
+                logger.exception(f"Exception in {name}: {str(e)}")
                 raise
-            finally:
-                end_time = time.time()
-                self.logger.debug(f"{func.__name__} execution time: {end_time - start_time:.4f} seconds")
+            if traced:
+                elapsed = time.perf_counter() - start_time
+                logger.log(level, f"{name}({format_call(args, kwargs)}) -> {type(result).__name__} "
+                                  f"in {elapsed:.6f} seconds")
+            return result
 
         return wrapper
 
@@ -114,8 +416,12 @@ class Logger:
         log_data = {"message": message, "trace_id": self.trace_id}
         if extra:
             log_data.update(extra)
-        
-        getattr(self.logger, level.lower())(json.dumps(log_data) if self.use_json else message, extra=log_data)
+
+        # Caller fields become record attributes too, except those that would clobber LogRecord's own.
+        fields = {key: value for key, value in (extra or {}).items() if key not in RESERVED_RECORD_FIELDS}
+        fields["trace_id"] = self.trace_id
+        self.logger.log(getattr(logging, level), json.dumps(log_data) if self.use_json else message,
+                        extra=fields)
 
     def debug(self, message: str, extra: Dict[str, Any] = None):
         self._log("DEBUG", message, extra)
@@ -127,14 +433,11 @@ class Logger:
         self._log("WARNING", message, extra)
 
     def error(self, message: str, extra: Dict[str, Any] = None):
-        current_time = time.time()
-        error_key = (message, current_time // self.error_window)
-        self.error_counts[error_key] += 1
-        
-        if self.error_counts[error_key] <= self.error_threshold:
+        allowed, notices = self.error_limiter.admit(message)
+        for notice in notices:
+            self._log("ERROR", notice)
+        if allowed:
             self._log("ERROR", message, extra)
-        elif self.error_counts[error_key] == self.error_threshold + 1:
-            self._log("ERROR", f"Suppressing similar errors for: {message}", extra)
 
     def critical(self, message: str, extra: Dict[str, Any] = None):
         self._log("CRITICAL", message, extra)
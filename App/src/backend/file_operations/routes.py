@@ -1,13 +1,27 @@
 import logging
-from flask import Blueprint, request, jsonify
-from .service import FileOperations, SecureFileHandler
+import mimetypes
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from .service import FileOperations
+from src.core.vault import get_active_vault
+from src.core.uploads import UploadOffsetMismatch
+from src.core.utils import read_chunks
 
 file_operations_bp = Blueprint('file_operations', __name__)
 
 logger = logging.getLogger(__name__)
 
-file_handler = SecureFileHandler(base_path='/path/to/files', master_password='your_password')
-file_operations = FileOperations(file_handler)
+MAX_LIST_LIMIT = 1000
+
+_file_operations = None
+
+def get_file_operations() -> FileOperations:
+    global _file_operations
+    vault = get_active_vault()
+    if vault is None or vault.file_handler is None:
+        raise RuntimeError("File system not deployed")
+    if _file_operations is None or _file_operations.file_handler is not vault.file_handler:
+        _file_operations = FileOperations(vault.file_handler)
+    return _file_operations
 
 @file_operations_bp.route('/add', methods=['POST'])
 def add_file():
@@ -15,19 +29,120 @@ def add_file():
     file_id = request.form['file_id']
     logger.info(f"Adding file: {file_path} with id: {file_id}")
     try:
-        file_operations.add_file(file_path, file_id)
+        get_file_operations().add_file(file_path, file_id)
         return jsonify({"status": "File added successfully"}), 200
     except Exception as e:
         logger.error(f"Failed to add file {file_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@file_operations_bp.route('/add_batch', methods=['POST'])
+def add_batch():
+    src_dir = request.form['src_dir']
+    dest_dir = request.form.get('dest_dir', '')
+    logger.info(f"Adding files from directory: {src_dir} to: {dest_dir}")
+    try:
+        count = get_file_operations().add_tree(src_dir, dest_dir)
+        return jsonify({"status": "Files added successfully", "count": count}), 200
+    except FileNotFoundError:
+        logger.error(f"Directory {src_dir} not found")
+        return jsonify({"error": "Directory not found"}), 404
+    except Exception as e:
+        logger.error(f"Failed to add files from {src_dir}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/upload', methods=['POST'])
+def upload_file():
+    # Multipart bodies are spooled to disk by the form parser; a raw body is encrypted as it arrives.
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files['file']
+        file_id = request.form.get('file_id') or upload.filename
+        chunks = read_chunks(upload.stream)
+    else:
+        file_id = request.args.get('file_id')
+        chunks = read_chunks(request.stream)
+    logger.info(f"Uploading file with id: {file_id}")
+    try:
+        if not file_id:
+            return jsonify({"error": "file_id is required"}), 400
+        size = get_file_operations().upload_file(chunks, file_id)
+        return jsonify({"status": "File uploaded successfully", "size": size}), 200
+    except Exception as e:
+        logger.error(f"Failed to upload file {file_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/uploads', methods=['POST'])
+def create_upload():
+    file_id = request.form['file_id']
+    logger.info(f"Starting resumable upload for id: {file_id}")
+    try:
+        return jsonify(get_file_operations().create_upload(file_id)), 201
+    except Exception as e:
+        logger.error(f"Failed to start upload {file_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/uploads/<session_id>', methods=['GET'])
+def upload_status(session_id):
+    try:
+        return jsonify(get_file_operations().upload_status(session_id)), 200
+    except FileNotFoundError:
+        logger.error(f"Upload session {session_id} not found")
+        return jsonify({"error": "Upload session not found"}), 404
+    except Exception as e:
+        logger.error(f"Failed to get upload {session_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/uploads/<session_id>', methods=['PATCH'])
+def write_upload(session_id):
+    logger.info(f"Receiving data for upload: {session_id}")
+    try:
+        offset = int(request.headers['Upload-Offset'])
+    except (KeyError, ValueError):
+        return jsonify({"error": "A numeric Upload-Offset header is required"}), 400
+    try:
+        offset = get_file_operations().write_upload(session_id, read_chunks(request.stream), offset)
+        return jsonify({"session_id": session_id, "offset": offset}), 200
+    except FileNotFoundError:
+        logger.error(f"Upload session {session_id} not found")
+        return jsonify({"error": "Upload session not found"}), 404
+    except UploadOffsetMismatch as mismatch:
+        return jsonify({"error": str(mismatch), "offset": mismatch.expected}), 409
+    except Exception as e:
+        logger.error(f"Failed to write upload {session_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/uploads/<session_id>/complete', methods=['POST'])
+def complete_upload(session_id):
+    logger.info(f"Completing upload: {session_id}")
+    try:
+        result = get_file_operations().complete_upload(session_id)
+        return jsonify(dict(result, status="File uploaded successfully")), 200
+    except FileNotFoundError:
+        logger.error(f"Upload session {session_id} not found")
+        return jsonify({"error": "Upload session not found"}), 404
+    except Exception as e:
+        logger.error(f"Failed to complete upload {session_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/uploads/<session_id>', methods=['DELETE'])
+def abort_upload(session_id):
+    logger.info(f"Aborting upload: {session_id}")
+    try:
+        get_file_operations().abort_upload(session_id)
+        return jsonify({"status": "Upload aborted"}), 200
+    except FileNotFoundError:
+        logger.error(f"Upload session {session_id} not found")
+        return jsonify({"error": "Upload session not found"}), 404
+    except Exception as e:
+        logger.error(f"Failed to abort upload {session_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @file_operations_bp.route('/read', methods=['GET'])
 def read_file():
     file_id = request.args.get('file_id')
     decode = request.args.get('decode', 'false').lower() == 'true'
     logger.info(f"Reading file: {file_id} with decode={decode}")
     try:
-        content = file_operations.read_file(file_id, decode)
+        content = get_file_operations().read_file(file_id, decode)
         return jsonify({"content": content}), 200
     except FileNotFoundError:
         logger.error(f"File {file_id} not found")
@@ -36,12 +151,47 @@ def read_file():
         logger.error(f"Failed to read file {file_id}: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@file_operations_bp.route('/stream', methods=['GET'])
+def stream_file():
+    file_id = request.args.get('file_id')
+    logger.info(f"Streaming file: {file_id} range={request.headers.get('Range')}")
+    try:
+        file_operations = get_file_operations()
+        stat = file_operations.stat_file(file_id)
+        size = stat["size"]
+        headers = {"Accept-Ranges": "bytes", "ETag": f'"{stat["etag"]}"'}
+        if request.if_none_match.contains(stat["etag"]):
+            return Response(status=304, headers=headers)
+
+        start, stop, status = 0, size, 200
+        # A stale If-Range means the client's partial copy is outdated, so the whole file is sent.
+        if (request.range is not None and len(request.range.ranges) == 1
+                and ("If-Range" not in request.headers or request.if_range.etag == stat["etag"])):
+            byte_range = request.range.range_for_length(size)
+            if byte_range is None:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status=416, headers=headers)
+            start, stop = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+
+        headers["Content-Length"] = str(stop - start)
+        mimetype = mimetypes.guess_type(file_id)[0] or "application/octet-stream"
+        blocks = file_operations.stream_file(file_id, start, stop)
+        return Response(stream_with_context(blocks), status=status, headers=headers, mimetype=mimetype)
+    except FileNotFoundError:
+        logger.error(f"File {file_id} not found")
+        return jsonify({"error": "File not found"}), 404
+    except Exception as e:
+        logger.error(f"Failed to stream file {file_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @file_operations_bp.route('/delete', methods=['POST'])
 def delete_file():
     file_id = request.form['file_id']
     logger.info(f"Deleting file: {file_id}")
     try:
-        file_operations.delete_file(file_id)
+        get_file_operations().delete_file(file_id)
         return jsonify({"status": "File deleted successfully"}), 200
     except FileNotFoundError:
         logger.error(f"File {file_id} not found")
@@ -52,10 +202,21 @@ def delete_file():
 
 @file_operations_bp.route('/list', methods=['GET'])
 def list_files():
-    logger.info("Listing all files")
+    dir_name = request.args.get('dir', '')
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort', 'name')
+    logger.info(f"Listing directory: {dir_name or '.'}")
     try:
-        files = file_operations.list_files()
+        depth = int(request.args.get('depth', 1))
+        limit = min(int(request.args.get('limit', 100)), MAX_LIST_LIMIT)
+        files = get_file_operations().list_directory(dir_name, depth, cursor, limit, sort)
         return jsonify(files), 200
+    except FileNotFoundError:
+        logger.error(f"Directory {dir_name} not found")
+        return jsonify({"error": "Directory not found"}), 404
+    except ValueError as ve:
+        logger.error(f"Invalid listing request: {str(ve)}")
+        return jsonify({"error": str(ve)}), 400
     except Exception as e:
         logger.error(f"Failed to list files: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -65,7 +226,7 @@ def create_directory():
     dir_name = request.form['dir_name']
     logger.info(f"Creating directory: {dir_name}")
     try:
-        file_operations.create_directory(dir_name)
+        get_file_operations().create_directory(dir_name)
         return jsonify({"status": "Directory created successfully"}), 200
     except Exception as e:
         logger.error(f"Failed to create directory {dir_name}: {str(e)}")
@@ -77,7 +238,7 @@ def rename_directory():
     new_name = request.form['new_name']
     logger.info(f"Renaming directory from {old_name} to {new_name}")
     try:
-        file_operations.rename_directory(old_name, new_name)
+        get_file_operations().rename_directory(old_name, new_name)
         return jsonify({"status": "Directory renamed successfully"}), 200
     except FileNotFoundError:
         logger.error(f"Directory {old_name} not found")
@@ -91,7 +252,7 @@ def delete_directory():
     dir_name = request.form['dir_name']
     logger.info(f"Deleting directory: {dir_name}")
     try:
-        file_operations.delete_directory(dir_name)
+        get_file_operations().delete_directory(dir_name)
         return jsonify({"status": "Directory deleted successfully"}), 200
     except FileNotFoundError:
         logger.error(f"Directory {dir_name} not found")
@@ -106,7 +267,7 @@ def move_file():
     dest_dir = request.form['dest_dir']
     logger.info(f"Moving file: {file_id} to directory: {dest_dir}")
     try:
-        file_operations.move_file(file_id, dest_dir)
+        get_file_operations().move_file(file_id, dest_dir)
         return jsonify({"status": "File moved successfully"}), 200
     except FileNotFoundError:
         logger.error(f"File {file_id} or directory {dest_dir} not found")
@@ -120,8 +281,8 @@ def change_directory():
     dir_name = request.form['dir_name']
     logger.info(f"Changing directory to: {dir_name}")
     try:
-        file_operations.change_directory(dir_name)
-        return jsonify({"status": "Directory changed successfully", "current_directory": file_operations.get_current_directory()}), 200
+        get_file_operations().change_directory(dir_name)
+        return jsonify({"status": "Directory changed successfully", "current_directory": get_file_operations().get_current_directory()}), 200
     except FileNotFoundError:
         logger.error(f"Directory {dir_name} not found")
         return jsonify({"error": "Directory not found"}), 404
@@ -133,8 +294,25 @@ def change_directory():
 def get_current_directory():
     logger.info("Getting current directory")
     try:
-        current_directory = file_operations.get_current_directory()
+        current_directory = get_file_operations().get_current_directory()
         return jsonify({"current_directory": current_directory}), 200
     except Exception as e:
         logger.error(f"Failed to get current directory: {str(e)}")
         return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/cache_stats', methods=['GET'])
+def get_cache_stats():
+    try:
+        stats = get_file_operations().cache_stats()
+        return jsonify({"enabled": stats is not None, "stats": stats}), 200
+    except Exception as e:
+        logger.error(f"Failed to get cache stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@file_operations_bp.route('/lock_stats', methods=['GET'])
+def get_lock_stats():
+    try:
+        return jsonify(get_file_operations().lock_stats()), 200
+    except Exception as e:
+        logger.error(f"Failed to get lock stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
@@ -17,11 +17,57 @@ class FileOperations:
         self.logger.info(f"Adding file from {file_path} to {dest_path}")
         self.file_handler.add_file(file_path, dest_path)
 
+    def add_tree(self, src_dir: str, dest_dir: str = "") -> int:
+        dest_prefix = self._build_path(dest_dir) if dest_dir else self.current_directory
+        self.logger.info(f"Adding files from {src_dir} to {dest_prefix}")
+        return self.file_handler.add_tree(src_dir, dest_prefix)
+
+    def upload_file(self, chunks, file_id: str) -> int:
+        dest_path = self._build_path(file_id)
+        self.logger.info(f"Uploading file to {dest_path}")
+        return self.file_handler.add_stream(chunks, dest_path)
+
+    def create_upload(self, file_id: str) -> dict:
+        dest_path = self._build_path(file_id)
+        self.logger.info(f"Starting resumable upload to {dest_path}")
+        return self.file_handler.uploads.create(dest_path).status()
+
+    def upload_status(self, session_id: str) -> dict:
+        return self.file_handler.uploads.get(session_id).status()
+
+    def write_upload(self, session_id: str, chunks, offset: int) -> int:
+        self.logger.info(f"Writing to upload {session_id} at offset {offset}")
+        return self.file_handler.uploads.write(session_id, chunks, offset)
+
+    def complete_upload(self, session_id: str) -> dict:
+        self.logger.info(f"Completing upload {session_id}")
+        return self.file_handler.uploads.complete(session_id)
+
+    def abort_upload(self, session_id: str) -> None:
+        self.logger.info(f"Aborting upload {session_id}")
+        self.file_handler.uploads.abort(session_id)
+
     def read_file(self, file_id: str, decode: bool = False) -> str:
         file_path = self._build_path(file_id)
         self.logger.info(f"Reading file {file_path} with decode={decode}")
         return self.file_handler.read_file(file_path, decode)
 
+    def cache_stats(self) -> dict:
+        return self.file_handler.cache_stats()
+
+    def lock_stats(self) -> dict:
+        return self.file_handler.lock_stats()
+
+    def stat_file(self, file_id: str) -> dict:
+        file_path = self._build_path(file_id)
+        self.logger.info(f"Getting size and ETag of {file_path}")
+        return self.file_handler.stat_file(file_path)
+
+    def stream_file(self, file_id: str, start: int, stop: int):
+        file_path = self._build_path(file_id)
+        self.logger.info(f"Streaming bytes {start}-{stop} of {file_path}")
+        return self.file_handler.iter_range(file_path, start, stop)
+
     def delete_file(self, file_id: str) -> None:
         file_path = self._build_path(file_id)
         self.logger.info(f"Deleting file {file_path}")
@@ -31,6 +77,15 @@ class FileOperations:
         self.logger.info("Listing files")
         return self.file_handler.list_files()
 
+    def list_directory(self, dir_name: str = "", depth: int = 1, cursor: str = None,
+                       limit: int = 100, sort: str = "name") -> dict:
+        dir_path = self._build_path(dir_name) if dir_name else self.current_directory
+        self.logger.info(f"Listing directory {dir_path} (depth={depth}, cursor={cursor}, limit={limit}, sort={sort})")
+        if dir_path == "root" and not self.file_handler.directory_exists(dir_path):
+            # A fresh vault has no "root" until something is added under it.
+            return {"directory": dir_path, "entries": [], "next_cursor": None}
+        return self.file_handler.list_directory(dir_path, depth, cursor, limit, sort)
+
     def create_directory(self, dir_name: str) -> None:
         dir_path = self._build_path(dir_name)
         self.logger.info(f"Creating directory {dir_path}")
@@ -1,6 +1,8 @@
 import logging
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from .service import SystemOperations
+from src.core.metrics import CONTENT_TYPE
+from src.core.journal import FSYNC_POLICIES
 
 system_operations_bp = Blueprint('system_operations', __name__)
 
@@ -12,12 +14,41 @@ def deploy_system():
     master_password = request.form['master_password']
     logger.info(f"Deploying system at base path: {base_path}")
     try:
-        file_handler = SystemOperations.deploy(base_path, master_password)
+        cache_bytes = int(request.form.get('cache_bytes', 0))
+        if cache_bytes < 0:
+            raise ValueError
+    except ValueError:
+        logger.error(f"Invalid cache_bytes: {request.form['cache_bytes']}")
+        return jsonify({"error": "Invalid cache_bytes"}), 400
+    settings = {}
+    for name in ('max_workers', 'max_in_flight_jobs', 'compact_threshold'):
+        if name in request.form:
+            try:
+                settings[name] = int(request.form[name])
+                if settings[name] < 1:
+                    raise ValueError
+            except ValueError:
+                logger.error(f"Invalid {name}: {request.form[name]}")
+                return jsonify({"error": f"Invalid {name}"}), 400
+    if 'fsync_policy' in request.form:
+        if request.form['fsync_policy'] not in FSYNC_POLICIES:
+            logger.error(f"Invalid fsync_policy: {request.form['fsync_policy']}")
+            return jsonify({"error": "Invalid fsync_policy"}), 400
+        settings['fsync_policy'] = request.form['fsync_policy']
+    try:
+        file_handler = SystemOperations.deploy(base_path, master_password, cache_bytes, **settings)
         return jsonify({"status": "System deployed successfully"}), 200
     except ValueError as ve:
-        logger.error(f"Failed to deploy system due to invalid path: {str(ve)}")
+        logger.error(f"Failed to deploy system: {str(ve)}")
         return jsonify({"error": str(ve)}), 400
     except Exception as e:
         logger.error(f"Failed to deploy system: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@system_operations_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    try:
+        return Response(SystemOperations.metrics(), content_type=CONTENT_TYPE), 200
+    except Exception as e:
+        logger.error(f"Failed to render metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
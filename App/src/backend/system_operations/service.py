@@ -1,11 +1,17 @@
 import logging
-from core.utils import is_valid_path
-from core.file_handler import SecureFileHandler
-from core.initializer import FileSystemInitializer
+from typing import Optional
+from src.core.utils import is_valid_path
+from src.core.file_handler import SecureFileHandler
+from src.core.content_cache import ContentCache
+from src.core.initializer import FileSystemInitializer
+from src.core.vault import open_vault, set_active_vault
+from src.core import metrics
 
 class SystemOperations:
     @staticmethod
-    def deploy(base_path: str, master_password: str) -> SecureFileHandler:
+    def deploy(base_path: str, master_password: str, cache_bytes: int = 0, max_workers: Optional[int] = None,
+               max_in_flight_jobs: Optional[int] = None, fsync_policy: Optional[str] = None,
+               compact_threshold: Optional[int] = None) -> SecureFileHandler:
         logger = logging.getLogger(__name__)
         logger.info(f"Deploying file system at base path: {base_path}")
 
@@ -13,8 +19,28 @@ class SystemOperations:
             logger.error(f"Invalid base path: {base_path}")
             raise ValueError("Invalid base path")
 
-        initializer = FileSystemInitializer(base_path, master_password)
+        vault = open_vault(base_path, master_password, max_workers, max_in_flight_jobs)
+        initializer = FileSystemInitializer(base_path, master_password, vault=vault)
         initializer.initialize()
 
+        if vault.file_handler is None:
+            content_cache = ContentCache(cache_bytes) if cache_bytes > 0 else None
+            vault.file_handler = SecureFileHandler(base_path, master_password, vault=vault,
+                                                   content_cache=content_cache)
+        else:
+            # A redeploy of an open vault keeps its handler but applies the requested cache budget.
+            current = vault.file_handler.content_cache
+            if cache_bytes <= 0:
+                vault.file_handler.content_cache = None
+            elif current is None or current.max_bytes != cache_bytes:
+                vault.file_handler.content_cache = ContentCache(cache_bytes)
+        # Durability settings left out of the request keep their current values.
+        vault.file_handler.storage.configure_durability(fsync_policy, compact_threshold)
+        set_active_vault(vault)
+
         logger.info("File system initialized successfully")
-        return SecureFileHandler(base_path, master_password)
+        return vault.file_handler
+
+    @staticmethod
+    def metrics() -> str:
+        return metrics.render()
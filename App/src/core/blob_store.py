@@ -0,0 +1,82 @@
+import os
+import re
+import hashlib
+import secrets
+from typing import Iterable, Optional
+from .utils import read_chunks
+from .durability import GroupCommit
+from src.LogSystem.LoggerSystem import Logger
+
+logger = Logger(use_json=True)
+log_class = logger.log_class()
+
+BLOB_DIR = 'blobs'
+DIGEST_SIZE = 32
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+_DIGEST = re.compile(r'^[0-9a-f]{%d}$' % (DIGEST_SIZE * 2))
+
+
+def blob_path(root: str, digest: str) -> str:
+    if not _DIGEST.match(digest):
+        raise ValueError(f"Invalid blob digest: {digest}")
+    shards = [digest[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_LEVELS)]
+    return os.path.join(root, *shards, f'{digest}.enc')
+
+
+@log_class
+class BlobStore:
+    def __init__(self, root: str, hash_key: bytes, commits: Optional[GroupCommit] = None) -> None:
+        self.root = root
+        self.temp_dir = os.path.join(root, 'tmp')
+        self.commits = commits or GroupCommit()
+        self._hash_key = hash_key
+
+    def hasher(self):
+        # Keyed, so a blob name reveals nothing about its plaintext to anyone without the vault key.
+        return hashlib.blake2b(key=self._hash_key, digest_size=DIGEST_SIZE)
+
+    def digest(self, chunks: Iterable[bytes]) -> str:
+        hasher = self.hasher()
+        for chunk in chunks:
+            hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def digest_file(self, file_path: str) -> str:
+        with open(file_path, 'rb') as f:
+            return self.digest(read_chunks(f))
+
+    def path(self, digest: str) -> str:
+        return blob_path(self.root, digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def temp_path(self) -> str:
+        os.makedirs(self.temp_dir, exist_ok=True)
+        return os.path.join(self.temp_dir, f'{secrets.token_hex(16)}.tmp')
+
+    def commit(self, temp_path: str, digest: str) -> str:
+        blob_path = self.path(digest)
+        if os.path.exists(blob_path):
+            os.remove(temp_path)
+            return blob_path
+        # The content must be durable before it is published under its digest, or a crash could leave a
+        # torn blob that every later duplicate would be deduplicated against.
+        self.commits.sync(temp_path)
+        blob_dir = os.path.dirname(blob_path)
+        targets = [blob_dir]
+        if not os.path.isdir(blob_dir):
+            targets.extend([os.path.dirname(blob_dir), self.root])
+            os.makedirs(blob_dir, exist_ok=True)
+        os.replace(temp_path, blob_path)
+        self.commits.sync(*targets)
+        return blob_path
+
+    def remove(self, digest: str) -> bool:
+        blob_path = self.path(digest)
+        if not os.path.exists(blob_path):
+            return False
+        os.remove(blob_path)
+        return True
@@ -0,0 +1,82 @@
+import lzma
+import zlib
+from typing import Callable, Dict
+from .container import CODEC_NONE, ContainerError
+
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+SAMPLE_SIZE = 64 * 1024
+MIN_COMPRESS_SIZE = 256
+COMPRESSION_THRESHOLD = 0.9
+
+
+class _Identity:
+    def compress(self, data: bytes) -> bytes:
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class _LZMADecompressor:
+    def __init__(self) -> None:
+        self._decompressor = lzma.LZMADecompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+    def flush(self) -> bytes:
+        return b''
+
+
+class Codec:
+    def __init__(self, codec_id: int, name: str, compressor: Callable, decompressor: Callable) -> None:
+        self.codec_id = codec_id
+        self.name = name
+        self.compressor = compressor
+        self.decompressor = decompressor
+
+    def compress_block(self, data: bytes) -> bytes:
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress_block(self, data: bytes) -> bytes:
+        decompressor = self.decompressor()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+_CODECS: Dict[int, Codec] = {}
+
+
+def register_codec(codec_id: int, name: str, compressor: Callable, decompressor: Callable) -> Codec:
+    if not 0 <= codec_id <= 255:
+        raise ValueError(f"Codec id must fit in one byte: {codec_id}")
+    codec = Codec(codec_id, name, compressor, decompressor)
+    _CODECS[codec_id] = codec
+    return codec
+
+
+def get_codec(codec_id: int) -> Codec:
+    codec = _CODECS.get(codec_id)
+    if codec is None:
+        raise ContainerError(f"Unsupported codec id: {codec_id}")
+    return codec
+
+
+def choose_codec(sample: bytes) -> int:
+    sample = sample[:SAMPLE_SIZE]
+    if len(sample) < MIN_COMPRESS_SIZE:
+        return CODEC_NONE
+    # A fast level-1 pass over the head of the file is enough to tell media from text.
+    if len(zlib.compress(sample, 1)) <= len(sample) * COMPRESSION_THRESHOLD:
+        return CODEC_ZLIB
+    return CODEC_NONE
+
+
+register_codec(CODEC_NONE, 'none', _Identity, _Identity)
+register_codec(CODEC_ZLIB, 'zlib', lambda: zlib.compressobj(6), zlib.decompressobj)
+register_codec(CODEC_LZMA, 'lzma', lzma.LZMACompressor, _LZMADecompressor)
@@ -0,0 +1,351 @@
+import io
+import os
+import struct
+from typing import Callable, List, Optional, Tuple
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305 # type: ignore
+from .metrics import PHASE_AEAD, PHASE_DISK_IO, count_bytes, phase
+
+MAGIC = b'\x89NMC'
+FORMAT_VERSION = 1
+# Compressed chunks vary in length, so each one is compressed on its own and framed with its sealed length.
+FRAMED_VERSION = 2
+
+CIPHER_CHACHA20_POLY1305 = 1
+
+KEY_WRAP_RSA_OAEP = 1
+KEY_WRAP_VAULT_HKDF = 2
+
+CODEC_NONE = 0
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+MAX_CHUNKS = 2**32
+
+# magic, version, cipher id, key wrap id, codec id, header length, chunk size
+_FIXED_HEADER = struct.Struct('>4sBBBBHI')
+_COUNTER = struct.Struct('>I')
+_FRAME_LENGTH = struct.Struct('>I')
+
+
+class ContainerError(ValueError):
+    pass
+
+
+def is_container(data: bytes) -> bool:
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+class ContainerHeader:
+    def __init__(self, key_wrap: int, key_material: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 nonce_prefix: Optional[bytes] = None, codec: int = CODEC_NONE,
+                 cipher: int = CIPHER_CHACHA20_POLY1305, version: int = FORMAT_VERSION) -> None:
+        if chunk_size <= 0:
+            raise ContainerError("Chunk size must be positive")
+        self.version = version
+        self.cipher = cipher
+        self.key_wrap = key_wrap
+        self.codec = codec
+        self.chunk_size = chunk_size
+        self.nonce_prefix = nonce_prefix or os.urandom(NONCE_PREFIX_SIZE)
+        self.key_material = key_material
+
+    @property
+    def size(self) -> int:
+        return _FIXED_HEADER.size + NONCE_PREFIX_SIZE + len(self.key_material)
+
+    @property
+    def framed(self) -> bool:
+        return self.version == FRAMED_VERSION
+
+    def pack(self) -> bytes:
+        fixed = _FIXED_HEADER.pack(MAGIC, self.version, self.cipher, self.key_wrap,
+                                   self.codec, self.size, self.chunk_size)
+        return fixed + self.nonce_prefix + self.key_material
+
+    @classmethod
+    def header_length(cls, data: bytes) -> Optional[int]:
+        if len(data) < _FIXED_HEADER.size:
+            return None
+        return _FIXED_HEADER.unpack_from(data)[5]
+
+    @classmethod
+    def unpack(cls, data: bytes) -> 'ContainerHeader':
+        if len(data) < _FIXED_HEADER.size:
+            raise ContainerError("Truncated container header")
+        magic, version, cipher, key_wrap, codec, header_len, chunk_size = _FIXED_HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ContainerError("Not an encrypted container")
+        if version not in (FORMAT_VERSION, FRAMED_VERSION):
+            raise ContainerError(f"Unsupported container version: {version}")
+        if cipher != CIPHER_CHACHA20_POLY1305:
+            raise ContainerError(f"Unsupported cipher id: {cipher}")
+        if version == FORMAT_VERSION and codec != CODEC_NONE:
+            raise ContainerError("Compressed containers must be framed")
+        if len(data) < header_len or header_len < _FIXED_HEADER.size + NONCE_PREFIX_SIZE:
+            raise ContainerError("Truncated container header")
+        prefix_end = _FIXED_HEADER.size + NONCE_PREFIX_SIZE
+        return cls(key_wrap, bytes(data[prefix_end:header_len]), chunk_size,
+                   bytes(data[_FIXED_HEADER.size:prefix_end]), codec, cipher, version)
+
+    @classmethod
+    def read_from(cls, file_obj) -> 'ContainerHeader':
+        fixed = file_obj.read(_FIXED_HEADER.size)
+        header_len = cls.header_length(fixed)
+        if header_len is None:
+            raise ContainerError("Truncated container header")
+        return cls.unpack(fixed + file_obj.read(max(header_len - len(fixed), 0)))
+
+
+def chunk_count(header: ContainerHeader, container_length: int) -> int:
+    body = container_length - header.size
+    if body < TAG_SIZE:
+        raise ContainerError("Truncated container: final chunk missing")
+    return max(-(-body // (header.chunk_size + TAG_SIZE)), 1)
+
+
+def plaintext_length(header: ContainerHeader, container_length: int) -> int:
+    return container_length - header.size - chunk_count(header, container_length) * TAG_SIZE
+
+
+def chunk_nonce(prefix: bytes, counter: int, final: bool) -> bytes:
+    if counter >= MAX_CHUNKS:
+        raise ContainerError("Too many chunks for a single container")
+    return prefix + _COUNTER.pack(counter) + (b'\x01' if final else b'\x00')
+
+
+class StreamEncryptor:
+    def __init__(self, key: bytes, header: ContainerHeader, counter: int = 0,
+                 compress: Optional[Callable[[bytes], bytes]] = None) -> None:
+        if header.framed and compress is None:
+            raise ContainerError("A framed container needs a chunk compressor")
+        self.header = header
+        self.counter = counter
+        self._compress = compress if header.framed else None
+        self._aead = ChaCha20Poly1305(key)
+        self._aad = header.pack()
+        self._pending = bytearray()
+        self._finalized = False
+
+    def begin(self) -> bytes:
+        return self._aad
+
+    @property
+    def buffered(self) -> int:
+        return len(self._pending)
+
+    def _seal(self, data: bytes, final: bool) -> bytes:
+        nonce = chunk_nonce(self.header.nonce_prefix, self.counter, final)
+        self.counter += 1
+        payload = bytes(data) if self._compress is None else self._compress(bytes(data))
+        with phase(PHASE_AEAD):
+            sealed = self._aead.encrypt(nonce, payload, self._aad)
+        count_bytes(PHASE_AEAD, 'encrypt', len(payload))
+        if self.header.framed:
+            return _FRAME_LENGTH.pack(len(sealed)) + sealed
+        return sealed
+
+    def update(self, data: bytes) -> bytes:
+        if self._finalized:
+            raise ContainerError("Stream already finalized")
+        self._pending += data
+        chunk_size = self.header.chunk_size
+        # A full chunk is only sealed once more data follows it, so the last chunk always carries the final flag.
+        if len(self._pending) <= chunk_size:
+            return b''
+        view = memoryview(self._pending)
+        out = []
+        offset = 0
+        while len(self._pending) - offset > chunk_size:
+            out.append(self._seal(view[offset:offset + chunk_size], False))
+            offset += chunk_size
+        view.release()
+        del self._pending[:offset]
+        return b''.join(out)
+
+    def finalize(self) -> bytes:
+        if self._finalized:
+            raise ContainerError("Stream already finalized")
+        self._finalized = True
+        sealed = self._seal(self._pending, True)
+        self._pending = bytearray()
+        return sealed
+
+
+class StreamDecryptor:
+    def __init__(self, key: bytes, header: ContainerHeader, counter: int = 0,
+                 decompress: Optional[Callable[[bytes], bytes]] = None) -> None:
+        if header.framed and decompress is None:
+            raise ContainerError("A framed container needs a chunk decompressor")
+        self.header = header
+        self.counter = counter
+        self._decompress = decompress if header.framed else None
+        self._aead = ChaCha20Poly1305(key)
+        self._aad = header.pack()
+        self._pending = bytearray()
+        self._finalized = False
+
+    @property
+    def sealed_chunk_size(self) -> int:
+        return self.header.chunk_size + TAG_SIZE
+
+    def open_chunk(self, index: int, data: bytes, final: bool) -> bytes:
+        nonce = chunk_nonce(self.header.nonce_prefix, index, final)
+        with phase(PHASE_AEAD):
+            plaintext = self._aead.decrypt(nonce, bytes(data), self._aad)
+        count_bytes(PHASE_AEAD, 'decrypt', len(plaintext))
+        return plaintext if self._decompress is None else self._decompress(plaintext)
+
+    def _update_framed(self) -> bytes:
+        view = memoryview(self._pending)
+        out = []
+        offset = 0
+        while len(self._pending) - offset >= _FRAME_LENGTH.size:
+            end = offset + _FRAME_LENGTH.size + _FRAME_LENGTH.unpack_from(self._pending, offset)[0]
+            # As with fixed chunks, a frame is only opened once more data follows it.
+            if len(self._pending) <= end:
+                break
+            out.append(self.open_chunk(self.counter, view[offset + _FRAME_LENGTH.size:end], False))
+            self.counter += 1
+            offset = end
+        view.release()
+        del self._pending[:offset]
+        return b''.join(out)
+
+    def update(self, data: bytes) -> bytes:
+        if self._finalized:
+            raise ContainerError("Stream already finalized")
+        self._pending += data
+        if self.header.framed:
+            return self._update_framed()
+        sealed_size = self.sealed_chunk_size
+        if len(self._pending) <= sealed_size:
+            return b''
+        view = memoryview(self._pending)
+        out = []
+        offset = 0
+        while len(self._pending) - offset > sealed_size:
+            out.append(self.open_chunk(self.counter, view[offset:offset + sealed_size], False))
+            self.counter += 1
+            offset += sealed_size
+        view.release()
+        del self._pending[:offset]
+        return b''.join(out)
+
+    def finalize(self) -> bytes:
+        if self._finalized:
+            raise ContainerError("Stream already finalized")
+        self._finalized = True
+        sealed = self._pending
+        if self.header.framed:
+            if (len(sealed) < _FRAME_LENGTH.size
+                    or _FRAME_LENGTH.unpack_from(sealed)[0] != len(sealed) - _FRAME_LENGTH.size):
+                raise ContainerError("Truncated container: final chunk missing")
+            sealed = sealed[_FRAME_LENGTH.size:]
+        if len(sealed) < TAG_SIZE:
+            raise ContainerError("Truncated container: final chunk missing")
+        plaintext = self.open_chunk(self.counter, sealed, True)
+        self.counter += 1
+        self._pending = bytearray()
+        return plaintext
+
+
+class ContainerReader(io.RawIOBase):
+    def __init__(self, file_obj, decryptor: StreamDecryptor, container_length: int,
+                 size: Optional[int] = None) -> None:
+        super().__init__()
+        self._file = file_obj
+        self._decryptor = decryptor
+        self._position = 0
+        self._cached_index = -1
+        self._cached = b''
+        self._frames = None
+        if decryptor.header.framed:
+            self._frames = self._scan_frames(container_length)
+            self._chunk_count = len(self._frames)
+            self._size = size
+        else:
+            self._chunk_count = chunk_count(decryptor.header, container_length)
+            self._size = plaintext_length(decryptor.header, container_length)
+
+    def _scan_frames(self, container_length: int) -> List[Tuple[int, int]]:
+        # Only the length prefixes are read; no chunk is decrypted until a read reaches it.
+        frames = []
+        offset = self._decryptor.header.size
+        while offset < container_length:
+            self._file.seek(offset)
+            prefix = self._file.read(_FRAME_LENGTH.size)
+            if len(prefix) < _FRAME_LENGTH.size:
+                raise ContainerError("Truncated container frame")
+            length = _FRAME_LENGTH.unpack(prefix)[0]
+            offset += _FRAME_LENGTH.size
+            if length < TAG_SIZE or offset + length > container_length:
+                raise ContainerError("Truncated container frame")
+            frames.append((offset, length))
+            offset += length
+        if not frames:
+            raise ContainerError("Truncated container: final chunk missing")
+        return frames
+
+    @property
+    def size(self) -> int:
+        if self._size is None:
+            # Every framed chunk but the last holds exactly one chunk of plaintext.
+            last = self._chunk_count - 1
+            self._size = last * self.chunk_size + len(self.chunk(last))
+        return self._size
+
+    @property
+    def chunk_size(self) -> int:
+        return self._decryptor.header.chunk_size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        elif whence != io.SEEK_SET:
+            raise ValueError(f"Invalid whence: {whence}")
+        if offset < 0:
+            raise ValueError(f"Negative seek position: {offset}")
+        self._position = offset
+        return offset
+
+    def chunk(self, index: int) -> bytes:
+        if index != self._cached_index:
+            if self._frames is not None:
+                offset, sealed_size = self._frames[index]
+            else:
+                sealed_size = self._decryptor.sealed_chunk_size
+                offset = self._decryptor.header.size + index * sealed_size
+            with phase(PHASE_DISK_IO):
+                self._file.seek(offset)
+                sealed = self._file.read(sealed_size)
+            count_bytes(PHASE_DISK_IO, 'read', len(sealed))
+            self._cached = self._decryptor.open_chunk(index, sealed, index == self._chunk_count - 1)
+            self._cached_index = index
+        return self._cached
+
+    def readinto(self, buffer) -> int:
+        if self._position >= self.size:
+            return 0
+        index, start = divmod(self._position, self._decryptor.header.chunk_size)
+        data = self.chunk(index)[start:start + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._file.close()
+            self._cached = b''
+        super().close()
@@ -0,0 +1,95 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from .key_cache import wipe
+from .path_index import normalize_path
+
+
+class ContentCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None,
+                 wipe_on_evict: bool = False) -> None:
+        if max_bytes <= 0:
+            raise ValueError("Cache budget must be positive")
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.wipe_on_evict = wipe_on_evict
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._entries: "OrderedDict[str, Tuple[bytearray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: str) -> Optional[bytes]:
+        path = normalize_path(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                self._evict(path)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return bytes(entry[0])
+
+    def put(self, path: str, content: bytes, generation: Optional[int] = None) -> bool:
+        path = normalize_path(path)
+        with self._lock:
+            # A read that raced with an invalidation must not bring the old content back.
+            if generation is not None and generation != self.generation:
+                return False
+            if len(content) > self.max_bytes:
+                return False
+            if path in self._entries:
+                self._evict(path, counted=False)
+            self._entries[path] = (bytearray(content), time.monotonic())
+            self.size += len(content)
+            while self.size > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+            return True
+
+    def _evict(self, path: str, counted: bool = True) -> None:
+        buffer, _ = self._entries.pop(path)
+        self.size -= len(buffer)
+        if counted:
+            self.evictions += 1
+        if self.wipe_on_evict:
+            wipe(buffer)
+
+    def invalidate(self, path: str) -> None:
+        path = normalize_path(path)
+        with self._lock:
+            self.generation += 1
+            if path in self._entries:
+                self._evict(path, counted=False)
+
+    def invalidate_prefix(self, dir_path: str) -> None:
+        prefix = normalize_path(dir_path)
+        with self._lock:
+            self.generation += 1
+            for path in [p for p in self._entries if not prefix or p == prefix or p.startswith(f"{prefix}/")]:
+                self._evict(path, counted=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            for path in list(self._entries):
+                self._evict(path, counted=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,105 @@
+import os
+import secrets
+import threading
+import contextlib
+from typing import Dict, Iterator, List, Optional
+from .metrics import PHASE_DISK_IO, phase
+
+
+def fsync_directory(path: str) -> None:
+    # Windows cannot open a directory for fsync; NTFS journals the rename itself.
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with phase(PHASE_DISK_IO):
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_path(path: str) -> None:
+    if os.path.isdir(path):
+        fsync_directory(path)
+        return
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        with phase(PHASE_DISK_IO):
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextlib.contextmanager
+def atomic_write(path: str) -> Iterator:
+    temp_path = f'{path}.{secrets.token_hex(8)}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            yield f
+            with phase(PHASE_DISK_IO):
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    fsync_directory(os.path.dirname(path) or os.curdir)
+
+
+class GroupCommit:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.flushes = 0
+        self._cond = threading.Condition()
+        self._pending: Dict[str, None] = {}
+        self._next = 1
+        self._durable = 0
+        self._flushing = False
+        self._failures: Dict[int, OSError] = {}
+        self._waiters: Dict[int, int] = {}
+
+    def _leave(self, batch: int) -> Optional[OSError]:
+        # The last caller of a batch to return takes its failure out, so failures do not pile up.
+        remaining = self._waiters[batch] - 1
+        if remaining:
+            self._waiters[batch] = remaining
+            return self._failures.get(batch)
+        del self._waiters[batch]
+        return self._failures.pop(batch, None)
+
+    def sync(self, *paths: str) -> None:
+        with self._cond:
+            self._pending.update(dict.fromkeys(paths))
+            self.requests += 1
+            batch = self._next
+            self._waiters[batch] = self._waiters.get(batch, 0) + 1
+            # Whoever finds no flush in progress flushes everything queued so far, including other callers' paths.
+            while self._durable < batch and self._flushing:
+                self._cond.wait()
+            if self._durable >= batch:
+                failure = self._leave(batch)
+                if failure is not None:
+                    raise failure
+                return
+            self._flushing = True
+            targets: List[str] = list(self._pending)
+            self._pending = {}
+            self._next += 1
+
+        error = None
+        try:
+            for path in targets:
+                fsync_path(path)
+        except OSError as e:
+            error = e
+        with self._cond:
+            self._durable = batch
+            self._flushing = False
+            self.flushes += 1
+            if error is not None:
+                self._failures[batch] = error
+            self._leave(batch)
+            self._cond.notify_all()
+        if error is not None:
+            raise error
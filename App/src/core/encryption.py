@@ -1,25 +1,111 @@
+import io
 import os
+import itertools
 import base64
+from typing import Iterable, Iterator, Optional, Tuple
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305 # type: ignore
 from cryptography.hazmat.primitives.asymmetric import rsa, padding # type: ignore
 from cryptography.hazmat.primitives import hashes, serialization # type: ignore
 from cryptography.hazmat.primitives.kdf.scrypt import Scrypt # type: ignore
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF # type: ignore
+from cryptography.exceptions import InvalidTag # type: ignore
 from cryptography.hazmat.backends import default_backend # type: ignore
 from src.LogSystem.LoggerSystem import Logger
+from .key_cache import SessionKeyCache
+from .container import (ContainerError, ContainerHeader, ContainerReader, StreamDecryptor, StreamEncryptor,
+                        CODEC_NONE, DEFAULT_CHUNK_SIZE, FORMAT_VERSION, FRAMED_VERSION, KEY_WRAP_RSA_OAEP,
+                        KEY_WRAP_VAULT_HKDF, MAGIC, is_container)
+from .codecs import SAMPLE_SIZE, choose_codec, get_codec
+from .durability import atomic_write
+from .metrics import PHASE_AEAD, PHASE_KDF, PHASE_RSA, count_bytes, instrument, phase
+import hmac
 import secrets
 
 logger = Logger(use_json=True)
 log_class = logger.log_class()
 
+VAULT_KEY_MAGIC = b'\x89NMK'
+VAULT_KEY_VERSION = 1
+VAULT_KEY_SALT_SIZE = 16
+FILE_ID_SIZE = 16
+FILE_KEY_INFO = b'NovelMind file key v1:'
+SUBKEY_INFO = b'NovelMind subkey v1:'
+
+class VaultKeyError(ValueError):
+    pass
+
+
+_OAEP = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+
+# Key material is only handled by module-level helpers so that log_class never formats it into a log line.
+def _rsa_wrap(rsa_key, symmetric_key: bytes) -> bytes:
+    with phase(PHASE_RSA):
+        return rsa_key.public_key().encrypt(bytes(symmetric_key), _OAEP)
+
+
+def _rsa_unwrap(rsa_key, encrypted_symmetric_key: bytes) -> bytes:
+    with phase(PHASE_RSA):
+        return rsa_key.decrypt(encrypted_symmetric_key, _OAEP)
+
+
+def _seal_vault_key(rsa_key, vault_key: bytes, kek: bytes, salt: bytes) -> bytes:
+    # The KEK salt is stored in the sealed file, so replacing that one file switches key and salt together.
+    header = VAULT_KEY_MAGIC + bytes([VAULT_KEY_VERSION]) + salt
+    nonce = secrets.token_bytes(12)
+    return header + nonce + ChaCha20Poly1305(kek).encrypt(nonce, _rsa_wrap(rsa_key, vault_key), header)
+
+
+def _vault_key_header(sealed: bytes) -> Tuple[bytes, bytes]:
+    prefix = VAULT_KEY_MAGIC + bytes([VAULT_KEY_VERSION])
+    if not sealed.startswith(prefix):
+        raise ValueError("Unrecognized vault key file")
+    header = sealed[:len(prefix) + VAULT_KEY_SALT_SIZE]
+    return header, header[len(prefix):]
+
+
+def _open_vault_key(rsa_key, sealed: bytes, header: bytes, kek: bytes) -> bytes:
+    nonce = sealed[len(header):len(header) + 12]
+    try:
+        wrapped = ChaCha20Poly1305(kek).decrypt(nonce, sealed[len(header) + 12:], header)
+    except InvalidTag:
+        raise ValueError("Invalid password")
+    return _rsa_unwrap(rsa_key, wrapped)
+
+
+def _hkdf(vault_key: bytes, info: bytes) -> bytes:
+    with phase(PHASE_KDF):
+        return HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=info,
+            backend=default_backend()
+        ).derive(bytes(vault_key))
+
+
+def _derive_file_key(vault_key: bytes, file_id: bytes) -> bytes:
+    return _hkdf(vault_key, FILE_KEY_INFO + file_id)
+
 @log_class
+@instrument('encryptor')
 class AdvancedEncryptor:
-    def __init__(self, key_file: str = None, salt_file: str = None, rsa_key_file: str = None):
+    def __init__(self, key_file: str = None, salt_file: str = None, rsa_key_file: str = None,
+                 vault_key_file: str = None):
         self.key_file = key_file or 'master_key.key'
         self.salt_file = salt_file or 'salt.key'
         self.rsa_key_file = rsa_key_file or 'rsa_key.pem'
+        self.vault_key_file = vault_key_file or 'vault_key.enc'
+        # Only a key set generated from scratch may create its vault key on first use.
+        self.created = not os.path.exists(self.salt_file)
         self.master_key = self._load_or_generate_key(self.key_file)
         self.salt = self._load_or_generate_key(self.salt_file)
         self.rsa_key = self._load_or_generate_rsa_key()
+        self.key_cache = SessionKeyCache()
 
     def _load_or_generate_key(self, file_path: str) -> bytes:
         if os.path.exists(file_path):
@@ -40,11 +126,12 @@ class AdvancedEncryptor:
                     backend=default_backend()
                 )
         else:
-            key = rsa.generate_private_key(
-                public_exponent=65537,
-                key_size=4096,
-                backend=default_backend()
-            )
+            with phase(PHASE_RSA):
+                key = rsa.generate_private_key(
+                    public_exponent=65537,
+                    key_size=4096,
+                    backend=default_backend()
+                )
             pem = key.private_bytes(
                 encoding=serialization.Encoding.PEM,
                 format=serialization.PrivateFormat.PKCS8,
@@ -54,60 +141,89 @@ class AdvancedEncryptor:
                 f.write(pem)
             return key
 
-    def _derive_key(self, password: str) -> bytes:
+    def _derive_key(self, password: str, salt: Optional[bytes] = None) -> bytes:
+        salt = self.salt if salt is None else salt
+        cached = self.key_cache.get(password, salt)
+        if cached is not None:
+            return cached
         kdf = Scrypt(
-            salt=self.salt,
+            salt=salt,
             length=32,
             n=2**16,
             r=8,
             p=1,
             backend=default_backend()
         )
-        return kdf.derive(password.encode())
+        with phase(PHASE_KDF):
+            key = kdf.derive(password.encode())
+        return self.key_cache.put(password, salt, key)
 
-    def encrypt(self, data: bytes, password: str) -> bytes:
-        try:
-            symmetric_key = self._derive_key(password)
-            chacha = ChaCha20Poly1305(symmetric_key)
-            nonce = secrets.token_bytes(12)
-            encrypted_data = chacha.encrypt(nonce, data, None)
-
-            public_key = self.rsa_key.public_key()
-            encrypted_symmetric_key = public_key.encrypt(
-                symmetric_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+    def _vault_key(self, password: str) -> bytes:
+        cached = self.key_cache.get(password, self.salt, purpose='vault')
+        if cached is not None:
+            return cached
+        if not os.path.exists(self.vault_key_file):
+            if not self.created:
+                # Every vault-keyed file depends on this key, so a new one would silently orphan them.
+                raise VaultKeyError(f"Vault key not found: {self.vault_key_file}")
+            self.create_vault_key(password)
+        with open(self.vault_key_file, 'rb') as f:
+            sealed = f.read()
+        header, salt = _vault_key_header(sealed)
+        vault_key = _open_vault_key(self.rsa_key, sealed, header, self._derive_key(password, salt))
+        return self.key_cache.put(password, self.salt, vault_key, purpose='vault')
 
-            return base64.urlsafe_b64encode(nonce + encrypted_symmetric_key + encrypted_data)
-        except Exception as e:
-            logger.error(f"Encryption failed: {str(e)}")
-            raise
+    def create_vault_key(self, password: str) -> None:
+        if os.path.exists(self.vault_key_file):
+            raise VaultKeyError(f"Vault key already exists: {self.vault_key_file}")
+        salt = secrets.token_bytes(VAULT_KEY_SALT_SIZE)
+        with atomic_write(self.vault_key_file) as f:
+            f.write(_seal_vault_key(self.rsa_key, secrets.token_bytes(32), self._derive_key(password, salt), salt))
+        self.created = False
+
+    def derive_subkey(self, password: str, purpose: str) -> bytes:
+        return _hkdf(self._vault_key(password), SUBKEY_INFO + purpose.encode())
+
+    def unlock(self, password: str) -> None:
+        self.key_cache.unlock()
+        self._vault_key(password)
+
+    def lock(self) -> None:
+        self.key_cache.lock()
+
+    @property
+    def is_locked(self) -> bool:
+        return self.key_cache.locked
+
+    def encrypt(self, data: bytes, password: str) -> bytes:
+        return b''.join(self.encrypt_stream([data], password))
 
     def decrypt(self, encrypted_data: bytes, password: str) -> bytes:
+        if not is_container(encrypted_data):
+            return self._decrypt_legacy(encrypted_data, password)
+        return b''.join(self.decrypt_stream([encrypted_data], password))
+
+    def is_legacy_format(self, encrypted_data: bytes) -> bool:
+        if not is_container(encrypted_data):
+            return True
+        return ContainerHeader.unpack(encrypted_data).key_wrap != KEY_WRAP_VAULT_HKDF
+
+    def _decrypt_legacy(self, encrypted_data: bytes, password: str) -> bytes:
         try:
             decoded_data = base64.urlsafe_b64decode(encrypted_data)
             nonce = decoded_data[:12]
             encrypted_symmetric_key = decoded_data[12:524]
             ciphertext = decoded_data[524:]
 
-            symmetric_key = self.rsa_key.decrypt(
-                encrypted_symmetric_key,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            symmetric_key = _rsa_unwrap(self.rsa_key, encrypted_symmetric_key)
 
             chacha = ChaCha20Poly1305(symmetric_key)
-            decrypted_data = chacha.decrypt(nonce, ciphertext, None)
+            with phase(PHASE_AEAD):
+                decrypted_data = chacha.decrypt(nonce, ciphertext, None)
+            count_bytes(PHASE_AEAD, 'decrypt', len(decrypted_data))
 
             derived_key = self._derive_key(password)
-            if derived_key != symmetric_key:
+            if not hmac.compare_digest(derived_key, symmetric_key):
                 raise ValueError("Invalid password")
 
             return decrypted_data
@@ -115,16 +231,122 @@ class AdvancedEncryptor:
             logger.error(f"Decryption failed: {str(e)}")
             raise
 
-    def rotate_keys(self):
-        self.master_key = secrets.token_bytes(32)
-        with open(self.key_file, 'wb') as f:
-            f.write(self.master_key)
-        
-        self.salt = secrets.token_bytes(16)
-        with open(self.salt_file, 'wb') as f:
-            f.write(self.salt)
-        
-        self.rsa_key = self._load_or_generate_rsa_key()
+    def begin_stream(self, password: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     codec: int = CODEC_NONE) -> StreamEncryptor:
+        file_id = secrets.token_bytes(FILE_ID_SIZE)
+        # Compressed chunks are compressed one at a time, so a range read only inflates the chunks it covers.
+        version = FORMAT_VERSION if codec == CODEC_NONE else FRAMED_VERSION
+        header = ContainerHeader(KEY_WRAP_VAULT_HKDF, file_id, chunk_size, codec=codec, version=version)
+        compress = get_codec(codec).compress_block if header.framed else None
+        return StreamEncryptor(_derive_file_key(self._vault_key(password), file_id), header, compress=compress)
+
+    def resume_stream(self, header: ContainerHeader, counter: int, password: str) -> StreamEncryptor:
+        if (header.key_wrap != KEY_WRAP_VAULT_HKDF or len(header.key_material) != FILE_ID_SIZE
+                or header.framed):
+            raise ContainerError("Only uncompressed vault-keyed containers can be resumed")
+        return StreamEncryptor(_derive_file_key(self._vault_key(password), header.key_material), header, counter)
+
+    def encrypt_stream(self, chunks: Iterable[bytes], password: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       codec: Optional[int] = None) -> Iterator[bytes]:
+        try:
+            chunks = iter(chunks)
+            if codec is None:
+                head, sampled = [], 0
+                for chunk in chunks:
+                    head.append(chunk)
+                    sampled += len(chunk)
+                    if sampled >= SAMPLE_SIZE:
+                        break
+                codec = choose_codec(b''.join(head))
+                chunks = itertools.chain(head, chunks)
+            stream = self.begin_stream(password, chunk_size, codec)
+            yield stream.begin()
+            for chunk in chunks:
+                sealed = stream.update(chunk)
+                if sealed:
+                    yield sealed
+            yield stream.finalize()
+        except Exception as e:
+            logger.error(f"Stream encryption failed: {str(e)}")
+            raise
+
+    def _open_stream(self, header: ContainerHeader, password: str) -> StreamDecryptor:
+        decompress = get_codec(header.codec).decompress_block if header.framed else None
+        if header.key_wrap == KEY_WRAP_VAULT_HKDF:
+            if len(header.key_material) != FILE_ID_SIZE:
+                raise ContainerError("Invalid file id in container header")
+            return StreamDecryptor(_derive_file_key(self._vault_key(password), header.key_material), header,
+                                   decompress=decompress)
+        if header.key_wrap == KEY_WRAP_RSA_OAEP:
+            symmetric_key = _rsa_unwrap(self.rsa_key, header.key_material)
+            derived_key = self._derive_key(password)
+            if not hmac.compare_digest(derived_key, symmetric_key):
+                raise ValueError("Invalid password")
+            return StreamDecryptor(symmetric_key, header, decompress=decompress)
+        raise ContainerError(f"Unsupported key wrap id: {header.key_wrap}")
+
+    def decrypt_stream(self, chunks: Iterable[bytes], password: str) -> Iterator[bytes]:
+        try:
+            chunks = iter(chunks)
+            buffered = bytearray()
+            header_len = None
+            for chunk in chunks:
+                buffered += chunk
+                if len(buffered) >= len(MAGIC) and not is_container(buffered):
+                    break
+                header_len = ContainerHeader.header_length(buffered)
+                if header_len is not None and len(buffered) >= header_len:
+                    break
+
+            if not is_container(buffered):
+                # Single-shot base64 files written before the container are decrypted in one piece.
+                for chunk in chunks:
+                    buffered += chunk
+                yield self._decrypt_legacy(bytes(buffered), password)
+                return
+
+            header = ContainerHeader.unpack(buffered)
+            stream = self._open_stream(header, password)
+            rest = buffered[header.size:]
+            del buffered
+            for chunk in itertools.chain([rest], chunks):
+                plaintext = stream.update(chunk)
+                if plaintext:
+                    yield plaintext
+            yield stream.finalize()
+        except Exception as e:
+            logger.error(f"Stream decryption failed: {str(e)}")
+            raise
+
+    def open_reader(self, file_obj, password: str, size: Optional[int] = None) -> io.RawIOBase:
+        file_obj.seek(0, os.SEEK_END)
+        container_length = file_obj.tell()
+        file_obj.seek(0)
+        if not is_container(file_obj.read(len(MAGIC))):
+            file_obj.seek(0)
+            plaintext = self._decrypt_legacy(file_obj.read(), password)
+            file_obj.close()
+            return io.BytesIO(plaintext)
+
+        file_obj.seek(0)
+        header = ContainerHeader.read_from(file_obj)
+        return ContainerReader(file_obj, self._open_stream(header, password), container_length, size)
+
+    def rotate_keys(self, password: str):
+        vault_key = self._vault_key(password)
+
+        # The vault key is re-sealed under a fresh KEK salt in one atomic replace, so a crash leaves either
+        # the old or the new sealed key. salt.key is left alone: files from before the vault key derive their
+        # key from it directly.
+        salt = secrets.token_bytes(VAULT_KEY_SALT_SIZE)
+        with atomic_write(self.vault_key_file) as f:
+            f.write(_seal_vault_key(self.rsa_key, vault_key, self._derive_key(password, salt), salt))
+        self.key_cache.clear()
+
+        master_key = secrets.token_bytes(32)
+        with atomic_write(self.key_file) as f:
+            f.write(master_key)
+        self.master_key = master_key
 
     def export_public_key(self) -> bytes:
         return self.rsa_key.public_key().public_bytes(
@@ -1,44 +1,326 @@
+import io
 import os
 import base64
-from typing import Optional, List, Dict
-from .encryption import AdvancedEncryptor
+import hashlib
+import secrets
+import threading
+from typing import Optional, List, Dict, Iterable, Iterator, Tuple
 from .storage import SecureStorage
+from .journal import FSYNC_INTERVAL
+from .container import CODEC_NONE, ContainerHeader, MAGIC, is_container, plaintext_length
+from .vault import VaultContext, open_vault
+from .workers import CryptoWorkerPool, ProgressCallback
+from .uploads import UploadManager
+from .blob_store import BlobStore, BLOB_DIR
+from .content_cache import ContentCache
+from .utils import read_chunks, write_chunks
+from .durability import atomic_write
+from .metrics import instrument
 from src.LogSystem.LoggerSystem import Logger
 
 logger = Logger(use_json=True)
 log_class = logger.log_class()
 
 @log_class
+@instrument('file_handler')
 class SecureFileHandler:
-    def __init__(self, base_path: str, master_password: str) -> None:
+    def __init__(self, base_path: str, master_password: str, vault: Optional[VaultContext] = None,
+                 content_cache: Optional[ContentCache] = None, fsync_policy: str = FSYNC_INTERVAL,
+                 fsync_interval: float = 1.0, compact_threshold: int = 1000) -> None:
         self.base_path = base_path
-        self.encryptor = AdvancedEncryptor()
-        self.storage = SecureStorage(base_path, master_password)
+        self.vault = vault or open_vault(base_path, master_password)
+        self.encryptor = self.vault.encryptor
+        self.storage = SecureStorage(base_path, master_password, vault=self.vault, fsync_policy=fsync_policy,
+                                     fsync_interval=fsync_interval, compact_threshold=compact_threshold)
         self.master_password = master_password
+        self.blobs = BlobStore(self.vault.path(BLOB_DIR),
+                               self.encryptor.derive_subkey(master_password, 'content address'),
+                               self.vault.commits)
+        self.uploads = UploadManager(self)
+        self.content_cache = content_cache
+        # Blobs an in-flight add has written or deduplicated against, but not yet linked into the index.
+        self._pins: Dict[str, int] = {}
+        self._pin_lock = threading.Lock()
+
+    @property
+    def workers(self) -> CryptoWorkerPool:
+        # Read through the vault, so a redeploy with new pool settings reaches an open handler.
+        return self.vault.workers
+
+    def _write_temp_blob(self, chunks: Iterable[bytes]) -> Tuple[str, int, str]:
+        temp_path = self.blobs.temp_path()
+        hasher = self.blobs.hasher()
+        size = 0
+
+        def counted():
+            nonlocal size
+            for chunk in chunks:
+                size += len(chunk)
+                hasher.update(chunk)
+                yield chunk
+
+        try:
+            with open(temp_path, 'wb') as dst:
+                write_chunks(dst, self.encryptor.encrypt_stream(counted(), self.master_password))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return temp_path, size, hasher.hexdigest()
+
+    def _pin(self, digest: str) -> None:
+        with self._pin_lock:
+            self._pins[digest] = self._pins.get(digest, 0) + 1
+
+    def _unpin(self, *digests: str) -> None:
+        with self._pin_lock:
+            for digest in digests:
+                count = self._pins[digest] - 1
+                if count:
+                    self._pins[digest] = count
+                else:
+                    del self._pins[digest]
+
+    def _commit_blob(self, temp_path: str, digest: str) -> None:
+        self._pin(digest)
+        try:
+            self.blobs.commit(temp_path, digest)
+        except BaseException:
+            self._unpin(digest)
+            raise
+
+    def _encrypt_to_blob(self, file_path: str) -> Tuple[str, int]:
+        # Returns with the blob pinned; _link unpins it once the index references it.
+        # Hashing first lets a duplicate skip encryption entirely.
+        digest = self.blobs.digest_file(file_path)
+        size = os.path.getsize(file_path)
+        self._pin(digest)
+        if self.blobs.exists(digest):
+            return digest, size
+        self._unpin(digest)
+        with open(file_path, 'rb') as src:
+            temp_path, size, digest = self._write_temp_blob(read_chunks(src))
+        self._commit_blob(temp_path, digest)
+        return digest, size
+
+    def _link(self, dest_path: str, digest: str, size: int) -> None:
+        try:
+            self.storage.add_file(dest_path, self.blobs.path(digest), size, digest)
+        finally:
+            self._unpin(digest)
+        self._invalidate(dest_path)
+
+    def _remove_unreferenced(self, digests: Iterable[str]) -> None:
+        for digest in digests:
+            # Pins and removals share a lock, so a blob an in-flight add has just deduplicated against survives.
+            with self._pin_lock:
+                if digest not in self._pins and self.storage.refcount(digest) == 0:
+                    self.blobs.remove(digest)
+
+    def _collect_garbage(self) -> None:
+        self._remove_unreferenced(self.storage.pop_orphans())
+
+    def store_blob(self, temp_path: str, dest_path: str, size: int) -> None:
+        digest = self.blobs.digest(self._decrypt_blob(temp_path))
+        self._commit_blob(temp_path, digest)
+        self._link(dest_path, digest, size)
+        self._collect_garbage()
+
+    def add_stream(self, chunks: Iterable[bytes], dest_path: str) -> int:
+        temp_path, size, digest = self._write_temp_blob(chunks)
+        self._commit_blob(temp_path, digest)
+        self._link(dest_path, digest, size)
+        self._collect_garbage()
+        return size
 
     def add_file(self, file_path: str, dest_path: str) -> None:
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-        
-        encrypted_content = self.encryptor.encrypt(file_content, self.master_password)
-        file_id = os.path.basename(dest_path)
-        encrypted_file_path = os.path.join(self.base_path, f'{file_id}.enc')
-        
-        with open(encrypted_file_path, 'wb') as f:
-            f.write(encrypted_content)
-        
-        self.storage.add_file(dest_path, encrypted_file_path)
+        self._link(dest_path, *self._encrypt_to_blob(file_path))
+        self._collect_garbage()
 
-    def read_file(self, file_path: str, decode: bool = False) -> str:
+    def add_tree(self, src_dir: str, dest_prefix: str, progress: Optional[ProgressCallback] = None) -> int:
+        if not os.path.isdir(src_dir):
+            # os.walk yields nothing for a missing directory, which would otherwise add an empty batch.
+            raise FileNotFoundError(f"Directory not found: {src_dir}")
+        jobs = []
+        for root, dirs, files in os.walk(src_dir):
+            dirs.sort()
+            relative = os.path.relpath(root, src_dir)
+            parts = [] if relative == os.curdir else relative.split(os.sep)
+            for name in sorted(files):
+                jobs.append((os.path.join(root, name), '/'.join([dest_prefix.rstrip('/')] + parts + [name])))
+
+        pinned = []
+
+        def encrypt(job):
+            digest, size = self._encrypt_to_blob(job[0])
+            pinned.append(digest)
+            return digest, size
+
+        try:
+            try:
+                # Blobs are written before the batch starts, so the index is only locked while they are linked.
+                blobs = list(self.workers.imap(encrypt, jobs, cost=lambda job: os.path.getsize(job[0]),
+                                               progress=progress))
+                with self.storage.batch():
+                    for (_, dest_path), (digest, size) in zip(jobs, blobs):
+                        self.storage.add_file(dest_path, self.blobs.path(digest), size, digest)
+            finally:
+                self._unpin(*pinned)
+        except Exception:
+            # The rolled-back index no longer references blobs written for this batch.
+            self._remove_unreferenced(set(pinned))
+            raise
+        self._invalidate_tree(dest_prefix)
+        self._collect_garbage()
+        return len(jobs)
+
+    def _decrypt_blob(self, encrypted_file_path: str) -> Iterator[bytes]:
+        with open(encrypted_file_path, 'rb') as f:
+            yield from self.encryptor.decrypt_stream(read_chunks(f), self.master_password)
+
+    def iter_file(self, file_path: str) -> Iterator[bytes]:
+        return self._decrypt_blob(self._lookup_blob(file_path))
+
+    def _lookup_blob(self, file_path: str) -> str:
         encrypted_file_path = self.storage.get_file_path(file_path)
         if not encrypted_file_path:
             raise FileNotFoundError(f"File not found: {file_path}")
+        return encrypted_file_path
 
+    def stat_file(self, file_path: str) -> Dict:
+        entry = self.storage.get_entry(file_path)
+        if entry is None:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        encrypted_file_path = entry.path
         with open(encrypted_file_path, 'rb') as f:
-            encrypted_content = f.read()
-        
-        decrypted_content = self.encryptor.decrypt(encrypted_content, self.master_password)
-        
+            if is_container(f.read(len(MAGIC))):
+                f.seek(0)
+                header = ContainerHeader.read_from(f)
+                if entry.blob is not None:
+                    etag = entry.blob[:32]
+                else:
+                    # Every re-encryption picks a fresh file id and nonce prefix, so the header identifies the content.
+                    etag = hashlib.sha256(header.pack()).hexdigest()[:32]
+                if header.codec == CODEC_NONE:
+                    size = plaintext_length(header, os.fstat(f.fileno()).st_size)
+                elif entry.size is not None:
+                    size = entry.size
+                else:
+                    size = sum(len(block) for block in self._decrypt_blob(encrypted_file_path))
+            else:
+                stat = os.fstat(f.fileno())
+                etag = f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+                size = sum(len(block) for block in self._decrypt_blob(encrypted_file_path))
+        return {"size": size, "etag": etag}
+
+    def open_encrypted(self, file_path: str) -> io.RawIOBase:
+        entry = self.storage.get_entry(file_path)
+        if entry is None:
+            raise FileNotFoundError(f"File not found: {file_path}")
+        f = open(entry.path, 'rb')
+        try:
+            return self.encryptor.open_reader(f, self.master_password, entry.size)
+        except BaseException:
+            f.close()
+            raise
+
+    def iter_range(self, file_path: str, start: int, stop: int) -> Iterator[bytes]:
+        reader = self.open_encrypted(file_path)
+
+        def blocks():
+            with reader:
+                reader.seek(start)
+                remaining = stop - start
+                # Each read returns at most the rest of one chunk, so only overlapping chunks are decrypted.
+                while remaining > 0:
+                    block = reader.read(remaining)
+                    if not block:
+                        break
+                    remaining -= len(block)
+                    yield block
+
+        return blocks()
+
+    def read_range(self, file_path: str, offset: int, length: int) -> bytes:
+        if offset < 0 or length < 0:
+            raise ValueError("offset and length must not be negative")
+        return b''.join(self.iter_range(file_path, offset, offset + length))
+
+    def export_file(self, file_path: str, target_path: str) -> None:
+        with open(target_path, 'wb') as f:
+            write_chunks(f, self.iter_file(file_path))
+
+    def read_many(self, file_paths: Iterable[str],
+                  progress: Optional[ProgressCallback] = None) -> Iterator[Tuple[str, bytes]]:
+        jobs = []
+        for file_path in file_paths:
+            encrypted_file_path = self.storage.get_file_path(file_path)
+            if not encrypted_file_path:
+                raise FileNotFoundError(f"File not found: {file_path}")
+            jobs.append((file_path, encrypted_file_path))
+
+        return self.workers.imap(lambda job: (job[0], b''.join(self._decrypt_blob(job[1]))), jobs,
+                                 cost=lambda job: os.path.getsize(job[1]), progress=progress)
+
+    def _export_blob(self, encrypted_file_path: str, target_path: str) -> None:
+        os.makedirs(os.path.dirname(target_path) or os.curdir, exist_ok=True)
+        with open(target_path, 'wb') as f:
+            write_chunks(f, self._decrypt_blob(encrypted_file_path))
+
+    def export_tree(self, dir_path: str, target_dir: str, progress: Optional[ProgressCallback] = None) -> int:
+        prefix = dir_path.strip('/')
+        jobs = []
+        for file_path, encrypted_file_path in self.storage.iter_files(dir_path):
+            relative = file_path[len(prefix):].lstrip('/') if prefix else file_path
+            jobs.append((encrypted_file_path, os.path.join(target_dir, *relative.split('/'))))
+
+        self.workers.run(lambda job: self._export_blob(*job), jobs,
+                         cost=lambda job: os.path.getsize(job[0]), progress=progress)
+        return len(jobs)
+
+    def _reencrypt_blob(self, encrypted_file_path: str) -> None:
+        with atomic_write(encrypted_file_path) as f:
+            write_chunks(f, self.encryptor.encrypt_stream(self._decrypt_blob(encrypted_file_path),
+                                                          self.master_password))
+
+    def reencrypt_tree(self, dir_path: str = "", progress: Optional[ProgressCallback] = None) -> int:
+        encrypted_paths = sorted({path for _, path in self.storage.iter_files(dir_path)})
+        self.workers.run(self._reencrypt_blob, encrypted_paths, cost=os.path.getsize, progress=progress)
+        return len(encrypted_paths)
+
+    # Each of these reads content_cache once, since a redeploy may swap the cache out while they run.
+    def _invalidate(self, *file_paths: str) -> None:
+        cache = self.content_cache
+        if cache is not None:
+            for file_path in file_paths:
+                cache.invalidate(file_path)
+
+    def _invalidate_tree(self, dir_path: str) -> None:
+        cache = self.content_cache
+        if cache is not None:
+            cache.invalidate_prefix(dir_path)
+
+    def _read_content(self, file_path: str) -> bytes:
+        cache = self.content_cache
+        if cache is None:
+            return b''.join(self.iter_file(file_path))
+        content = cache.get(file_path)
+        if content is None:
+            generation = cache.generation
+            content = b''.join(self.iter_file(file_path))
+            cache.put(file_path, content, generation)
+        return content
+
+    def cache_stats(self) -> Optional[Dict]:
+        cache = self.content_cache
+        return cache.stats() if cache is not None else None
+
+    def lock_stats(self) -> Dict:
+        return self.storage.lock_stats()
+
+    def read_file(self, file_path: str, decode: bool = False) -> str:
+        decrypted_content = self._read_content(file_path)
+
         if decode:
             try:
                 return decrypted_content.decode('utf-8')
@@ -48,27 +330,43 @@ class SecureFileHandler:
             return decrypted_content
 
     def delete_file(self, file_path: str) -> None:
-        encrypted_file_path = self.storage.get_file_path(file_path)
-        if not encrypted_file_path:
+        entry = self.storage.get_entry(file_path)
+        if entry is None:
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        os.remove(encrypted_file_path)
         self.storage.remove_file(file_path)
+        self._invalidate(file_path)
+        if entry.blob is None:
+            # Files added before the blob store own their blob outright.
+            if os.path.exists(entry.path):
+                os.remove(entry.path)
+        self._collect_garbage()
 
     def list_files(self) -> Dict:
         return self.storage.get_file_structure()
 
+    def list_directory(self, dir_path: str, depth: int = 1, cursor: Optional[str] = None,
+                       limit: int = 100, sort: str = 'name') -> Dict:
+        return self.storage.list_directory(dir_path, depth, cursor, limit, sort)
+
     def create_directory(self, dir_path: str) -> None:
         self.storage.create_directory(dir_path)
 
     def rename_directory(self, old_path: str, new_path: str) -> None:
         self.storage.rename_directory(old_path, new_path)
+        self._invalidate_tree(old_path)
+        self._invalidate_tree(new_path)
+        self._collect_garbage()
 
     def delete_directory(self, dir_path: str) -> None:
         self.storage.delete_directory(dir_path)
+        self._invalidate_tree(dir_path)
+        self._collect_garbage()
 
     def move_file(self, src_path: str, dest_path: str) -> None:
         self.storage.move_file(src_path, dest_path)
+        self._invalidate(src_path, dest_path)
+        self._collect_garbage()
 
     def directory_exists(self, dir_path: str) -> bool:
         return self.storage.directory_exists(dir_path)
\ No newline at end of file
@@ -0,0 +1,193 @@
+import sys
+import struct
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from .blob_store import DIGEST_SIZE, blob_path
+from .container import ContainerReader
+from .path_index import DIRECTORY, DIRECTORY_ENTRY, FILE, Entry, PathIndex
+
+INDEX_MAGIC = b'NMIX'
+INDEX_VERSION = 1
+PAGE_SIZE = 16 * 1024
+CACHE_PAGES = 1024
+
+# magic, version, snapshot sequence, string count, node count
+_HEADER = struct.Struct('>4sBQII')
+# kind, flags, name id, first child (directories) or path id (files), child count, size, raw blob digest
+_NODE = struct.Struct(f'>BBIIIQ{DIGEST_SIZE}s')
+_OFFSET = struct.Struct('>I')
+
+_KIND_DIRECTORY = 0
+_KIND_FILE = 1
+
+HAS_SIZE = 0x01
+HAS_BLOB = 0x02
+HAS_PATH = 0x04
+
+_NO_BLOB = bytes(DIGEST_SIZE)
+_SCAN_NODES = 4096
+
+
+class PageCache:
+    def __init__(self, read_page: Callable[[int], bytes], page_size: int, length: int,
+                 max_pages: int = CACHE_PAGES) -> None:
+        self.page_size = page_size
+        self.length = length
+        self.max_pages = max_pages
+        self.loads = 0
+        self._read_page = read_page
+        self._pages: "OrderedDict[int, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def page(self, index: int, cache: bool = True) -> bytes:
+        with self._lock:
+            page = self._pages.get(index)
+            if page is not None:
+                self._pages.move_to_end(index)
+                return page
+            # The underlying reader has a single file position, so page loads are serialized too.
+            page = self._read_page(index)
+            self.loads += 1
+            if cache:
+                self._pages[index] = page
+                if len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+            return page
+
+    def read(self, offset: int, length: int, cache: bool = True) -> bytes:
+        if offset + length > self.length:
+            raise ValueError("Index snapshot is truncated")
+        index, start = divmod(offset, self.page_size)
+        if start + length <= self.page_size:
+            return self.page(index, cache)[start:start + length]
+        parts = []
+        while length > 0:
+            part = self.page(index, cache)[start:start + length]
+            parts.append(part)
+            length -= len(part)
+            index, start = index + 1, 0
+        return b''.join(parts)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+
+
+class NodeTable:
+    ROOT_ID = 0
+
+    def __init__(self, pages: PageCache, blob_root: str) -> None:
+        if pages.length < _HEADER.size:
+            raise ValueError("Index snapshot is truncated")
+        magic, version, self.seq, string_count, node_count = _HEADER.unpack(pages.read(0, _HEADER.size))
+        if magic != INDEX_MAGIC:
+            raise ValueError("Not a binary index snapshot")
+        if version != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version: {version}")
+        self.pages = pages
+        self._blob_root = blob_root
+        self._node_count = node_count
+        self._nodes_offset = _HEADER.size
+        self._offsets_offset = self._nodes_offset + node_count * _NODE.size
+        self._strings_offset = self._offsets_offset + (string_count + 1) * _OFFSET.size
+        if node_count < 1 or pages.length < self._strings_offset:
+            raise ValueError("Index snapshot is truncated")
+        self._strings: List[Optional[str]] = [None] * string_count
+
+    def _string(self, string_id: int) -> str:
+        value = self._strings[string_id]
+        if value is None:
+            start, end = struct.unpack('>II', self.pages.read(self._offsets_offset + string_id * _OFFSET.size,
+                                                              2 * _OFFSET.size))
+            value = sys.intern(str(self.pages.read(self._strings_offset + start, end - start), 'utf-8'))
+            self._strings[string_id] = value
+        return value
+
+    def _node(self, node_id: int) -> Tuple[int, int, int, int, int, int, bytes]:
+        return _NODE.unpack(self.pages.read(self._nodes_offset + node_id * _NODE.size, _NODE.size))
+
+    def _entry(self, flags: int, first: int, size: int, digest: bytes) -> Entry:
+        blob = digest.hex() if flags & HAS_BLOB else None
+        path = self._string(first) if flags & HAS_PATH else blob_path(self._blob_root, blob)
+        return Entry(FILE, path, size if flags & HAS_SIZE else None, blob)
+
+    def children(self, node_id: int) -> Iterator[Tuple[str, Entry, Optional[int]]]:
+        kind, _, _, first, count, _, _ = self._node(node_id)
+        if kind != _KIND_DIRECTORY or first + count > self._node_count:
+            raise ValueError(f"Corrupt index node: {node_id}")
+        for child_id in range(first, first + count):
+            kind, flags, name_id, child_first, _, size, digest = self._node(child_id)
+            if kind == _KIND_DIRECTORY:
+                yield self._string(name_id), DIRECTORY_ENTRY, child_id
+            else:
+                yield self._string(name_id), self._entry(flags, child_first, size, digest), None
+
+    def iter_blobs(self) -> Iterator[str]:
+        # A full scan bypasses the page cache so it does not evict the pages lookups are using.
+        for first in range(0, self._node_count, _SCAN_NODES):
+            count = min(_SCAN_NODES, self._node_count - first)
+            nodes = self.pages.read(self._nodes_offset + first * _NODE.size, count * _NODE.size, cache=False)
+            for _, flags, _, _, _, _, digest in _NODE.iter_unpack(nodes):
+                if flags & HAS_BLOB:
+                    yield digest.hex()
+
+
+def load(source: Union[bytes, ContainerReader], blob_root: str) -> Tuple[int, PathIndex]:
+    if isinstance(source, ContainerReader):
+        # Each container chunk is sealed on its own, so a page is decrypted only when a lookup reaches it.
+        pages = PageCache(source.chunk, source.chunk_size, source.size)
+    else:
+        data = memoryview(source)
+        pages = PageCache(lambda index: data[index * PAGE_SIZE:(index + 1) * PAGE_SIZE], PAGE_SIZE, len(data))
+    table = NodeTable(pages, blob_root)
+    return table.seq, PathIndex(table)
+
+
+def dump(index: PathIndex, seq: int, blob_root: str) -> bytes:
+    string_ids: Dict[str, int] = {'': 0}
+    strings = ['']
+
+    def intern(value: str) -> int:
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    # Nodes are laid out breadth-first, so every directory's children occupy one contiguous run.
+    nodes = [[_KIND_DIRECTORY, 0, 0, 0, 0, 0, _NO_BLOB]]
+    dir_ids = deque([0])
+    for children in index.iter_bfs():
+        parent = nodes[dir_ids.popleft()]
+        parent[3], parent[4] = len(nodes), len(children)
+        for name, entry in children:
+            if entry.kind == DIRECTORY:
+                dir_ids.append(len(nodes))
+                nodes.append([_KIND_DIRECTORY, 0, intern(name), 0, 0, 0, _NO_BLOB])
+                continue
+            flags = 0
+            first = 0
+            digest = _NO_BLOB
+            if entry.size is not None:
+                flags |= HAS_SIZE
+            if entry.blob is not None:
+                flags |= HAS_BLOB
+                digest = bytes.fromhex(entry.blob)
+                if len(digest) != DIGEST_SIZE:
+                    raise ValueError(f"Invalid blob digest: {entry.blob}")
+            # Blob paths are derived from the digest on load, so only legacy files carry one.
+            if entry.blob is None or entry.path != blob_path(blob_root, entry.blob):
+                flags |= HAS_PATH
+                first = intern(entry.path)
+            nodes.append([_KIND_FILE, flags, intern(name), first, 0, entry.size or 0, digest])
+
+    encoded = [value.encode('utf-8') for value in strings]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    parts = [_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, seq, len(strings), len(nodes))]
+    parts.extend(_NODE.pack(*node) for node in nodes)
+    parts.append(struct.pack(f'>{len(offsets)}I', *offsets))
+    parts.extend(encoded)
+    return b''.join(parts)
@@ -1,6 +1,8 @@
 import os
-from .encryption import AdvancedEncryptor
+from typing import Optional
 from .utils import create_directory_if_not_exists
+from .vault import VaultContext, open_vault
+from .durability import atomic_write
 from src.LogSystem.LoggerSystem import Logger
 
 logger = Logger(use_json=True)
@@ -8,10 +10,11 @@ log_class = logger.log_class()
 
 @log_class
 class FileSystemInitializer:
-    def __init__(self, base_path: str, master_password: str) -> None:
+    def __init__(self, base_path: str, master_password: str, vault: Optional[VaultContext] = None) -> None:
 
         self.base_path = base_path
         self.master_password = master_password
+        self.vault = vault or open_vault(base_path, master_password)
 
     def initialize(self) -> None:
         create_directory_if_not_exists(self.base_path)
@@ -19,22 +22,39 @@ class FileSystemInitializer:
         self._create_empty_index()
 
     def _initialize_encryption(self) -> None:
-        encryptor = AdvancedEncryptor()
-        key_file = os.path.join(self.base_path, 'master_key.key')
-        salt_file = os.path.join(self.base_path, 'salt.key')
-
-        if not os.path.exists(key_file):
-            with open(key_file, 'wb') as f:
-                f.write(encryptor.master_key)
+        # Loads or generates every key file under base_path once and unlocks the vault key for the session.
+        encryptor = self.vault.encryptor
+        if not os.path.exists(encryptor.vault_key_file) and not self._has_vault_keyed_index():
+            # Vaults from before the vault key only hold RSA-wrapped files, so upgrading them creates one.
+            # The legacy index proves the password first; a vault key sealed under a wrong one would lock
+            # the right one out.
+            self._check_legacy_password()
+            encryptor.create_vault_key(self.master_password)
+        self.vault.warm_up()
+
+    def _has_vault_keyed_index(self) -> bool:
+        index_file = self.vault.path('index.enc')
+        if not os.path.exists(index_file):
+            return False
+        with open(index_file, 'rb') as f:
+            return not self.vault.encryptor.is_legacy_format(f.read(4096))
 
-        if not os.path.exists(salt_file):
-            with open(salt_file, 'wb') as f:
-                f.write(encryptor.salt)
+    def _check_legacy_password(self) -> None:
+        index_file = self.vault.path('index.enc')
+        if not os.path.exists(index_file):
+            return
+        with open(index_file, 'rb') as f:
+            encrypted_index = f.read()
+        try:
+            self.vault.encryptor.decrypt(encrypted_index, self.master_password)
+        except ValueError:
+            if not self.vault.unlocked:
+                self.vault.forget()
+            raise
 
     def _create_empty_index(self) -> None:
-        index_file = os.path.join(self.base_path, 'index.enc')
+        index_file = self.vault.path('index.enc')
         if not os.path.exists(index_file):
-            encryptor = AdvancedEncryptor()
-            empty_index = encryptor.encrypt(b'{}', self.master_password)
-            with open(index_file, 'wb') as f:
+            empty_index = self.vault.encryptor.encrypt(b'{}', self.master_password)
+            with atomic_write(index_file) as f:
                 f.write(empty_index)
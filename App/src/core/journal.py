@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import struct
+import secrets
+from typing import Any, Dict, Iterator, List, Optional
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305 # type: ignore
+from cryptography.exceptions import InvalidTag # type: ignore
+from .durability import GroupCommit, fsync_directory
+from .metrics import PHASE_DISK_IO, count_bytes, phase
+
+JOURNAL_MAGIC = b'\x89NMJ'
+JOURNAL_VERSION = 1
+JOURNAL_ID_SIZE = 16
+NONCE_SIZE = 12
+
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+FSYNC_POLICIES = (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER)
+
+_HEADER_SIZE = len(JOURNAL_MAGIC) + 1 + JOURNAL_ID_SIZE
+_LENGTH = struct.Struct('>I')
+
+
+class JournalError(ValueError):
+    pass
+
+
+class IndexJournal:
+    def __init__(self, path: str, key: bytes, fsync_policy: str = FSYNC_INTERVAL,
+                 fsync_interval: float = 1.0, commits: Optional[GroupCommit] = None) -> None:
+        if fsync_policy not in FSYNC_POLICIES:
+            raise JournalError(f"Unknown fsync policy: {fsync_policy}")
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.record_count = 0
+        self._commits = commits
+        self._aead = ChaCha20Poly1305(key)
+        self._header: Optional[bytes] = None
+        self._file = None
+        self._last_fsync = time.monotonic()
+        self._dirty = False
+
+    def _new_header(self) -> bytes:
+        return JOURNAL_MAGIC + bytes([JOURNAL_VERSION]) + secrets.token_bytes(JOURNAL_ID_SIZE)
+
+    def _check_header(self, header: bytes) -> None:
+        if len(header) < _HEADER_SIZE or header[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+            raise JournalError("Not an index journal")
+        if header[len(JOURNAL_MAGIC)] != JOURNAL_VERSION:
+            raise JournalError(f"Unsupported journal version: {header[len(JOURNAL_MAGIC)]}")
+
+    def replay(self) -> Iterator[Dict[str, Any]]:
+        self.record_count = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER_SIZE:
+            # A crash while creating the journal leaves a partial header and no records.
+            self._truncate(0)
+            return
+        self._check_header(data)
+        self._header = data[:_HEADER_SIZE]
+
+        offset = _HEADER_SIZE
+        while offset < len(data):
+            end = offset + _LENGTH.size
+            if end > len(data):
+                self._truncate(offset)
+                return
+            (length,) = _LENGTH.unpack_from(data, offset)
+            record_end = end + length
+            if record_end > len(data) or length < NONCE_SIZE:
+                self._truncate(offset)
+                return
+            try:
+                payload = self._aead.decrypt(data[end:end + NONCE_SIZE], data[end + NONCE_SIZE:record_end],
+                                             self._header + data[offset:end])
+            except InvalidTag:
+                if record_end == len(data):
+                    self._truncate(offset)
+                    return
+                raise JournalError(f"Corrupted journal record at offset {offset}")
+            self.record_count += 1
+            offset = record_end
+            yield json.loads(payload)
+
+    def _truncate(self, offset: int) -> None:
+        self.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+        if offset == 0:
+            self._header = None
+
+    def _open(self):
+        if self._file is None:
+            if self._header is None:
+                self._header = self._new_header()
+                with open(self.path, 'wb') as f:
+                    f.write(self._header)
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._file = open(self.path, 'ab')
+        return self._file
+
+    def _seal(self, record: Dict[str, Any]) -> bytes:
+        payload = json.dumps(record, separators=(',', ':')).encode()
+        nonce = secrets.token_bytes(NONCE_SIZE)
+        length = _LENGTH.pack(NONCE_SIZE + len(payload) + 16)
+        return length + nonce + self._aead.encrypt(nonce, payload, self._header + length)
+
+    def append(self, record: Dict[str, Any]) -> None:
+        self.append_many([record])
+
+    def append_many(self, records: List[Dict[str, Any]], sync: bool = True) -> None:
+        if not records:
+            return
+        f = self._open()
+        data = b''.join(self._seal(record) for record in records)
+        with phase(PHASE_DISK_IO):
+            f.write(data)
+            f.flush()
+        count_bytes(PHASE_DISK_IO, 'write', len(data))
+        self.record_count += len(records)
+        self._dirty = True
+        if sync:
+            self.apply_policy()
+
+    def apply_policy(self) -> None:
+        if self.fsync_policy == FSYNC_ALWAYS:
+            self.sync()
+        elif self.fsync_policy == FSYNC_INTERVAL and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        # With group commit the flag cannot be trusted: another thread may have cleared it while its fsync,
+        # which does not yet cover our record, is still in flight.
+        f = self._file
+        if f is not None and (self._dirty or self._commits is not None):
+            self._dirty = False
+            if self._commits is not None:
+                # Concurrent appends share one fsync with each other and with blob commits.
+                self._commits.sync(self.path)
+            else:
+                with phase(PHASE_DISK_IO):
+                    os.fsync(f.fileno())
+        self._last_fsync = time.monotonic()
+
+    def reset(self) -> None:
+        self.close()
+        self._header = self._new_header()
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(self._header)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        fsync_directory(os.path.dirname(self.path) or os.curdir)
+        self.record_count = 0
+
+    def close(self) -> None:
+        if self._file is not None:
+            if self.fsync_policy != FSYNC_NEVER:
+                self.sync()
+            self._file.close()
+            self._file = None
@@ -0,0 +1,93 @@
+import ctypes
+import ctypes.util
+import hashlib
+import hmac
+import secrets
+import threading
+from typing import Dict, Optional
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+except (OSError, TypeError):
+    _libc = None
+
+
+def _buffer_address(buffer: bytearray) -> int:
+    return ctypes.addressof((ctypes.c_char * len(buffer)).from_buffer(buffer))
+
+
+def _lock_memory(buffer: bytearray) -> bool:
+    if _libc is None or not hasattr(_libc, 'mlock') or not buffer:
+        return False
+    return _libc.mlock(ctypes.c_void_p(_buffer_address(buffer)), ctypes.c_size_t(len(buffer))) == 0
+
+
+def _unlock_memory(buffer: bytearray) -> None:
+    if _libc is None or not hasattr(_libc, 'munlock') or not buffer:
+        return
+    _libc.munlock(ctypes.c_void_p(_buffer_address(buffer)), ctypes.c_size_t(len(buffer)))
+
+
+def wipe(buffer: bytearray) -> None:
+    buffer[:] = bytes(len(buffer))
+
+
+class SessionKeyCache:
+    def __init__(self) -> None:
+        self._secret = secrets.token_bytes(32)
+        self._keys: Dict[bytes, bytearray] = {}
+        self._pinned: Dict[bytes, bool] = {}
+        self._lock = threading.Lock()
+        self._locked = False
+
+    @property
+    def locked(self) -> bool:
+        return self._locked
+
+    def _slot(self, password: str, salt: bytes, purpose: str) -> bytes:
+        # The password itself is never used as a dict key; only a MAC under a per-process secret.
+        message = purpose.encode() + b'\x00' + salt + b'\x00' + password.encode()
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    # Callers get an immutable copy: the cached buffer is wiped in place by clear() and lock(), possibly while
+    # another thread is still using the key.
+    def get(self, password: str, salt: bytes, purpose: str = 'kek') -> Optional[bytes]:
+        if self._locked:
+            return None
+        with self._lock:
+            buffer = self._keys.get(self._slot(password, salt, purpose))
+            return bytes(buffer) if buffer is not None else None
+
+    def put(self, password: str, salt: bytes, key: bytes, purpose: str = 'kek') -> bytes:
+        if self._locked:
+            return bytes(key)
+        buffer = bytearray(key)
+        slot = self._slot(password, salt, purpose)
+        with self._lock:
+            previous = self._keys.pop(slot, None)
+            if previous is not None:
+                self._release(slot, previous)
+            self._keys[slot] = buffer
+            self._pinned[slot] = _lock_memory(buffer)
+        return bytes(key)
+
+    def _release(self, slot: bytes, buffer: bytearray) -> None:
+        wipe(buffer)
+        if self._pinned.pop(slot, False):
+            _unlock_memory(buffer)
+
+    def clear(self) -> None:
+        with self._lock:
+            for slot, buffer in self._keys.items():
+                self._release(slot, buffer)
+            self._keys.clear()
+
+    def lock(self) -> None:
+        self._locked = True
+        self.clear()
+
+    def unlock(self) -> None:
+        self._locked = False
+
+    def __len__(self) -> int:
+        return len(self._keys)
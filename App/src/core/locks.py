@@ -0,0 +1,123 @@
+import time
+import functools
+import threading
+import contextlib
+from typing import Any, Callable, Dict
+
+
+class RWLock:
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers: Dict[int, int] = {}
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._stats = {
+            "read_acquires": 0,
+            "write_acquires": 0,
+            "read_contended": 0,
+            "write_contended": 0,
+            "read_wait_seconds": 0.0,
+            "write_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def _record_wait(self, kind: str, started: float) -> None:
+        waited = time.perf_counter() - started
+        self._stats[f"{kind}_contended"] += 1
+        self._stats[f"{kind}_wait_seconds"] += waited
+        self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+
+    def acquire_read(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            self._stats["read_acquires"] += 1
+            # Re-entrant reads and reads under our own write lock must not queue behind waiting writers.
+            if self._writer != me and me not in self._readers:
+                if self._writer is not None or self._waiting_writers:
+                    started = time.perf_counter()
+                    while self._writer is not None or self._waiting_writers:
+                        self._cond.wait()
+                    self._record_wait("read", started)
+            self._readers[me] = self._readers.get(me, 0) + 1
+
+    def release_read(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            count = self._readers[me] - 1
+            if count:
+                self._readers[me] = count
+            else:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self) -> None:
+        me = threading.get_ident()
+        with self._cond:
+            self._stats["write_acquires"] += 1
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Cannot upgrade a read lock to a write lock")
+            if self._writer is not None or self._readers:
+                started = time.perf_counter()
+                self._waiting_writers += 1
+                try:
+                    while self._writer is not None or self._readers:
+                        self._cond.wait()
+                finally:
+                    self._waiting_writers -= 1
+                self._record_wait("write", started)
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self) -> None:
+        with self._cond:
+            if self._writer != threading.get_ident():
+                raise RuntimeError("Write lock released by a thread that does not hold it")
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["active_readers"] = sum(self._readers.values())
+            stats["writer_active"] = self._writer is not None
+            stats["waiting_writers"] = self._waiting_writers
+            return stats
+
+
+def read_locked(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.reading():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def write_locked(method: Callable) -> Callable:
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock.writing():
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,252 @@
+import abc
+import time
+import types
+import bisect
+import inspect
+import functools
+import threading
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Type
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+PHASE_KDF = 'kdf'
+PHASE_RSA = 'rsa'
+PHASE_AEAD = 'aead'
+PHASE_DISK_IO = 'disk_io'
+PHASE_INDEX_SAVE = 'index_save'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self) -> None:
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_start')
+
+    def __init__(self, histogram: '_HistogramChild') -> None:
+        self._histogram = histogram
+
+    def __enter__(self) -> '_Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Tuple[float, ...]) -> None:
+        self.bounds = bounds
+        # The last slot counts observations above every finite bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        slot = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[slot] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class _Metric(abc.ABC):
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _new_child(self):
+        ...
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _samples(self, values: Tuple[str, ...], child) -> List[str]:
+        ...
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def _samples(self, values: Tuple[str, ...], child: _CounterChild) -> List[str]:
+        return [f'{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}']
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def _samples(self, values: Tuple[str, ...], child: _HistogramChild) -> List[str]:
+        with child._lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered differently")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+OPERATION_SECONDS = REGISTRY.histogram('novelmind_operation_seconds',
+                                       'Latency of encryptor, storage and file handler operations.',
+                                       ('component', 'operation'))
+OPERATION_ERRORS = REGISTRY.counter('novelmind_operation_errors_total',
+                                    'Operations that raised an exception.', ('component', 'operation'))
+PHASE_SECONDS = REGISTRY.histogram('novelmind_phase_seconds',
+                                   'Time spent in key derivation, RSA, AEAD, disk I/O and index saves.', ('phase',))
+BYTES_PROCESSED = REGISTRY.counter('novelmind_bytes_total', 'Bytes processed by phase and direction.',
+                                   ('phase', 'direction'))
+
+
+def phase(name: str) -> _Timer:
+    return PHASE_SECONDS.labels(name).time()
+
+
+def count_bytes(phase_name: str, direction: str, amount: int) -> None:
+    BYTES_PROCESSED.labels(phase_name, direction).inc(amount)
+
+
+def _timed_iteration(generator: Iterator, start: float, histogram: _HistogramChild,
+                     errors: _CounterChild) -> Iterator:
+    try:
+        yield from generator
+    except Exception:
+        errors.inc()
+        raise
+    finally:
+        histogram.observe(time.perf_counter() - start)
+
+
+def _timed(component: str, name: str, method: Callable) -> Callable:
+    histogram = OPERATION_SECONDS.labels(component, name)
+    errors = OPERATION_ERRORS.labels(component, name)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            histogram.observe(time.perf_counter() - start)
+            raise
+        if isinstance(result, types.GeneratorType):
+            # A generator does its work while it is consumed, so the whole iteration is timed.
+            return _timed_iteration(result, start, histogram, errors)
+        histogram.observe(time.perf_counter() - start)
+        return result
+    return wrapper
+
+
+def instrument(component: str) -> Callable[[Type], Type]:
+    def decorator(cls: Type) -> Type:
+        for name, method in inspect.getmembers(cls, inspect.isfunction):
+            if not name.startswith('_'):
+                setattr(cls, name, _timed(component, name, method))
+        return cls
+    return decorator
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,63 @@
+import os
+import sys
+import getpass
+import argparse
+from typing import Optional
+from .encryption import AdvancedEncryptor
+from .initializer import FileSystemInitializer
+from .vault import open_vault
+from .workers import CryptoWorkerPool, ProgressCallback
+from .durability import atomic_write
+from src.LogSystem.LoggerSystem import Logger
+
+logger = Logger(use_json=True)
+log_class = logger.log_class()
+
+@log_class
+class LegacyFormatMigrator:
+    def __init__(self, encryptor: AdvancedEncryptor, master_password: str,
+                 workers: Optional[CryptoWorkerPool] = None) -> None:
+        self.encryptor = encryptor
+        self.master_password = master_password
+        self.workers = workers or CryptoWorkerPool()
+
+    def migrate_file(self, encrypted_file_path: str) -> bool:
+        with open(encrypted_file_path, 'rb') as f:
+            encrypted_data = f.read()
+        if not self.encryptor.is_legacy_format(encrypted_data):
+            return False
+
+        plaintext = self.encryptor.decrypt(encrypted_data, self.master_password)
+        with atomic_write(encrypted_file_path) as f:
+            f.write(self.encryptor.encrypt(plaintext, self.master_password))
+        return True
+
+    def migrate_directory(self, base_path: str, progress: Optional[ProgressCallback] = None) -> int:
+        vault_key_file = os.path.abspath(self.encryptor.vault_key_file)
+        paths = []
+        for root, _, files in os.walk(base_path):
+            paths.extend(os.path.join(root, name) for name in files if name.endswith('.enc'))
+        paths = [path for path in paths if os.path.abspath(path) != vault_key_file]
+        return sum(self.workers.run(self.migrate_file, paths, cost=os.path.getsize, progress=progress))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Rewrite legacy .enc files into the current vault-keyed binary container format.")
+    parser.add_argument('base_path')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.base_path, 'index.enc')):
+        parser.error(f"Not a vault: {args.base_path}")
+
+    password = getpass.getpass("Master password: ")
+    # The vault's own key set, upgraded with a vault key if it predates one, so the rewritten files and the
+    # excluded key file are both the vault's rather than whatever sits in the working directory.
+    vault = open_vault(args.base_path, password)
+    FileSystemInitializer(args.base_path, password, vault=vault).initialize()
+    migrator = LegacyFormatMigrator(vault.encryptor, password, vault.workers)
+    print(f"Migrated {migrator.migrate_directory(args.base_path)} files")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+import sys
+import threading
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+ROOT = ''
+DIRECTORY = 'directory'
+FILE = 'file'
+
+
+def normalize_path(path: str) -> str:
+    return '/'.join(part for part in path.split('/') if part)
+
+
+def parent_of(path: str) -> str:
+    return path.rpartition('/')[0]
+
+
+def name_of(path: str) -> str:
+    return path.rpartition('/')[2]
+
+
+def join_path(dir_path: str, name: str) -> str:
+    return f"{dir_path}/{name}" if dir_path else name
+
+
+class Entry:
+    __slots__ = ('kind', 'path', 'size', 'blob')
+
+    def __init__(self, kind: str, path: Optional[str] = None, size: Optional[int] = None,
+                 blob: Optional[str] = None) -> None:
+        self.kind = kind
+        self.path = path
+        self.size = size
+        self.blob = blob
+
+    @property
+    def is_directory(self) -> bool:
+        return self.kind == DIRECTORY
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"type": self.kind}
+        if self.path is not None:
+            data["path"] = self.path
+        if self.size is not None:
+            data["size"] = self.size
+        if self.blob is not None:
+            data["blob"] = self.blob
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Entry':
+        if data["type"] == DIRECTORY:
+            return DIRECTORY_ENTRY
+        return cls(FILE, data.get("path"), data.get("size"), data.get("blob"))
+
+
+DIRECTORY_ENTRY = Entry(DIRECTORY)
+
+
+class PathIndex:
+    def __init__(self, source=None) -> None:
+        self._entries: Dict[str, Entry] = {ROOT: DIRECTORY_ENTRY}
+        self._children: Dict[str, Dict[str, None]] = {}
+        # Directories whose children still live only in the binary snapshot, keyed by path.
+        self._pending: Dict[str, int] = {}
+        self._source = source
+        self._load_lock = threading.Lock()
+        if source is None:
+            self._children[ROOT] = {}
+        else:
+            self._pending[ROOT] = source.ROOT_ID
+
+    @classmethod
+    def from_tree(cls, root: Dict[str, Any]) -> 'PathIndex':
+        index = cls()
+        stack = [(ROOT, root)]
+        while stack:
+            path, node = stack.pop()
+            children = index._children[path]
+            for name, info in node.get("contents", {}).items():
+                name = sys.intern(name)
+                child_path = join_path(path, name)
+                children[name] = None
+                index._entries[child_path] = Entry.from_dict(info)
+                if info["type"] == DIRECTORY:
+                    index._children[child_path] = {}
+                    stack.append((child_path, info))
+        return index
+
+    def _child_items(self, dir_path: str, node_id: Optional[int]) -> Iterator[Tuple[str, Entry, Optional[int]]]:
+        # Unloaded subtrees are read straight from the snapshot without being materialized.
+        if node_id is not None:
+            yield from self._source.children(node_id)
+            return
+        for name in self._children.get(dir_path, ()):
+            child_path = join_path(dir_path, name)
+            yield name, self._entries[child_path], self._pending.get(child_path)
+
+    def _walk_all(self, path: str) -> Iterator[Tuple[str, Entry]]:
+        stack = [(path, self._pending.get(path))]
+        while stack:
+            dir_path, node_id = stack.pop()
+            for name, entry, child_id in self._child_items(dir_path, node_id):
+                child_path = join_path(dir_path, name)
+                yield child_path, entry
+                if entry.kind == DIRECTORY:
+                    stack.append((child_path, child_id))
+
+    def _load(self, dir_path: str) -> None:
+        if dir_path not in self._pending:
+            return
+        # Readers share the storage lock, so two lookups may race to materialize the same directory.
+        with self._load_lock:
+            node_id = self._pending.get(dir_path)
+            if node_id is None:
+                return
+            children = {}
+            for name, entry, child_id in self._source.children(node_id):
+                children[name] = None
+                child_path = join_path(dir_path, name)
+                self._entries[child_path] = entry
+                if child_id is not None:
+                    self._pending[child_path] = child_id
+            self._children[dir_path] = children
+            # Dropped last, so a concurrent reader sees either the pending node or the complete listing.
+            del self._pending[dir_path]
+
+    def _reach(self, path: str) -> None:
+        if not self._pending or path in self._entries:
+            return
+        parent = parent_of(path)
+        if path == ROOT:
+            return
+        self._reach(parent)
+        entry = self._entries.get(parent)
+        if entry is not None and entry.kind == DIRECTORY:
+            self._load(parent)
+
+    def to_tree(self, path: str = ROOT) -> Dict[str, Any]:
+        path = normalize_path(path)
+        self._reach(path)
+        root = dict(self._entries[path].to_dict(), contents={})
+        nodes = {path: root}
+        for child_path, entry in self._walk_all(path):
+            if entry.kind == DIRECTORY:
+                child = {"type": DIRECTORY, "contents": {}}
+                nodes[child_path] = child
+            else:
+                child = entry.to_dict()
+            nodes[parent_of(child_path)]["contents"][name_of(child_path)] = child
+        return root
+
+    def iter_bfs(self) -> Iterator[List[Tuple[str, Entry]]]:
+        queue = deque([(ROOT, self._pending.get(ROOT))])
+        while queue:
+            dir_path, node_id = queue.popleft()
+            children = []
+            for name, entry, child_id in self._child_items(dir_path, node_id):
+                children.append((name, entry))
+                if entry.kind == DIRECTORY:
+                    queue.append((join_path(dir_path, name), child_id))
+            yield children
+
+    def iter_blobs(self) -> Iterator[str]:
+        if ROOT in self._pending:
+            yield from self._source.iter_blobs()
+            return
+        for _, entry in self._walk_all(ROOT):
+            if entry.blob is not None:
+                yield entry.blob
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self._walk_all(ROOT))
+
+    def __contains__(self, path: str) -> bool:
+        return self.get(path) is not None
+
+    def get(self, path: str) -> Optional[Entry]:
+        path = normalize_path(path)
+        self._reach(path)
+        return self._entries.get(path)
+
+    def is_directory(self, path: str) -> bool:
+        entry = self.get(path)
+        return entry is not None and entry.kind == DIRECTORY
+
+    def is_file(self, path: str) -> bool:
+        entry = self.get(path)
+        return entry is not None and entry.kind == FILE
+
+    def children(self, path: str) -> List[Tuple[str, Entry]]:
+        path = normalize_path(path)
+        self._reach(path)
+        self._load(path)
+        return [(name, self._entries[join_path(path, name)]) for name in self._children.get(path, ())]
+
+    def make_directories(self, path: str) -> bool:
+        path = normalize_path(path)
+        entry = self.get(path)
+        if entry is not None:
+            if entry.kind != DIRECTORY:
+                raise NotADirectoryError(f"Not a directory: {path}")
+            return False
+        self.make_directories(parent_of(path))
+        self._link(path, DIRECTORY_ENTRY)
+        self._children[path] = {}
+        return True
+
+    def set_file(self, path: str, entry: Entry) -> None:
+        path = normalize_path(path)
+        self.make_directories(parent_of(path))
+        if self.get(path) is not None:
+            self.remove(path)
+        self._link(path, entry)
+
+    def _link(self, path: str, entry: Entry) -> None:
+        parent = parent_of(path)
+        self._load(parent)
+        self._entries[path] = entry
+        self._children[parent][sys.intern(name_of(path))] = None
+
+    def remove(self, path: str) -> Optional[Entry]:
+        path = normalize_path(path)
+        if path == ROOT:
+            raise ValueError("Cannot remove the root directory")
+        self._reach(path)
+        entry = self._entries.pop(path, None)
+        if entry is None:
+            return None
+        del self._children[parent_of(path)][name_of(path)]
+        if entry.kind == DIRECTORY:
+            for child_path in list(self._walk_from(path)):
+                self._entries.pop(child_path, None)
+                self._children.pop(child_path, None)
+                self._pending.pop(child_path, None)
+            self._children.pop(path, None)
+            self._pending.pop(path, None)
+        return entry
+
+    def move(self, src_path: str, dest_path: str) -> None:
+        src_path = normalize_path(src_path)
+        dest_path = normalize_path(dest_path)
+        if src_path == dest_path:
+            return
+        if dest_path.startswith(f"{src_path}/") or src_path.startswith(f"{dest_path}/"):
+            raise ValueError(f"Cannot move {src_path} to {dest_path}")
+        entry = self.get(src_path)
+        self.make_directories(parent_of(dest_path))
+        if self.get(dest_path) is not None:
+            self.remove(dest_path)
+        del self._children[parent_of(src_path)][name_of(src_path)]
+        del self._entries[src_path]
+        self._link(dest_path, entry)
+        if entry.kind == DIRECTORY:
+            # Only the moved subtree is re-keyed; lookups elsewhere are untouched.
+            descendants = list(self._walk_from(src_path))
+            for mapping in (self._children, self._pending):
+                if src_path in mapping:
+                    mapping[dest_path] = mapping.pop(src_path)
+            for old_path in descendants:
+                new_path = dest_path + old_path[len(src_path):]
+                self._entries[new_path] = self._entries.pop(old_path)
+                for mapping in (self._children, self._pending):
+                    if old_path in mapping:
+                        mapping[new_path] = mapping.pop(old_path)
+
+    def _walk_from(self, path: str) -> Iterator[str]:
+        # Materialized descendants only; an unloaded directory is yielded but not entered.
+        stack = [path]
+        while stack:
+            dir_path = stack.pop()
+            for name in self._children.get(dir_path, ()):
+                child_path = join_path(dir_path, name)
+                yield child_path
+                if child_path in self._children:
+                    stack.append(child_path)
+
+    def walk_files(self, path: str = ROOT) -> Iterator[Tuple[str, Entry]]:
+        path = normalize_path(path)
+        if not self.is_directory(path):
+            return
+        for child_path, entry in list(self._walk_all(path)):
+            if entry.kind == FILE:
+                yield child_path, entry
@@ -1,137 +1,378 @@
 import os
 import json
-from typing import Dict, Any
-from .encryption import AdvancedEncryptor
+import mmap
+import threading
+import contextlib
+from collections import Counter
+from typing import Dict, Any, Iterator, List, Optional, Set, Tuple
+from .vault import VaultContext, open_vault
+from .journal import IndexJournal, JournalError, FSYNC_INTERVAL, FSYNC_POLICIES
+from .path_index import DIRECTORY, FILE, Entry, PathIndex, normalize_path
+from .blob_store import BLOB_DIR
+from .container import CODEC_NONE, ContainerReader
+from .durability import atomic_write
+from .locks import RWLock, read_locked, write_locked
+from .metrics import PHASE_INDEX_SAVE, instrument, phase
+from .utils import write_chunks
+from . import index_format
 from src.LogSystem.LoggerSystem import Logger
 
 logger = Logger(use_json=True)
 log_class = logger.log_class()
 
 @log_class
+@instrument('storage')
 class SecureStorage:
-    def __init__(self, base_path: str, master_password: str) -> None:
+    _OPERATIONS = ('add_file', 'remove_file', 'create_directory', 'rename_directory',
+                   'delete_directory', 'move_file')
+
+    def __init__(self, base_path: str, master_password: str, vault: Optional[VaultContext] = None,
+                 fsync_policy: str = FSYNC_INTERVAL, fsync_interval: float = 1.0,
+                 compact_threshold: int = 1000) -> None:
         self.base_path = base_path
-        self.index_file = os.path.join(base_path, 'index.enc')
-        self.encryptor = AdvancedEncryptor()
+        self.vault = vault or open_vault(base_path, master_password)
+        self.index_file = self.vault.path('index.enc')
+        self.blob_root = self.vault.path(BLOB_DIR)
+        self.encryptor = self.vault.encryptor
         self.master_password = master_password
-        self.index = self._load_index()
-        if "root" not in self.index:
-            self.index["root"] = {"type": "directory", "contents": {}}
-
-    def _load_index(self) -> Dict[str, Any]:
-        if os.path.exists(self.index_file):
-            with open(self.index_file, 'rb') as f:
-                encrypted_data = f.read()
-            decrypted_data = self.encryptor.decrypt(encrypted_data, self.master_password)
-            return json.loads(decrypted_data)
-        return {}
+        self.compact_threshold = compact_threshold
+        # Lookups share the lock; every index mutation, compaction and batch holds it exclusively.
+        self.lock = RWLock()
+        self.journal = IndexJournal(
+            self.vault.path('index.journal'),
+            self.encryptor.derive_subkey(master_password, 'index journal'),
+            fsync_policy=fsync_policy,
+            fsync_interval=fsync_interval,
+            commits=self.vault.commits
+        )
+        self.seq = 0
+        # Operations staged by the calling thread's open batch, if any.
+        self._batches = threading.local()
+        self._index_reader: Optional[ContainerReader] = None
+        self._refcounts: Optional[Dict[str, int]] = None
+        self.orphans: Set[str] = set()
+        self.paths = self._load_index()
+
+    def _open_snapshot(self) -> Tuple[int, PathIndex]:
+        if not os.path.exists(self.index_file):
+            return 0, PathIndex()
+        with open(self.index_file, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        reader = self.encryptor.open_reader(mapped, self.master_password)
+        if (isinstance(reader, ContainerReader)
+                and reader.read(len(index_format.INDEX_MAGIC)) == index_format.INDEX_MAGIC):
+            # The snapshot stays mapped; its pages are decrypted as lookups reach them.
+            self._index_reader = reader
+            return index_format.load(reader, self.blob_root)
+        reader.seek(0)
+        decrypted_data = reader.read()
+        reader.close()
+        if decrypted_data.startswith(index_format.INDEX_MAGIC):
+            return index_format.load(decrypted_data, self.blob_root)
+        # Vaults written before the binary format are converted on their next compaction.
+        index = json.loads(decrypted_data)
+        return index.get("_seq", 0), PathIndex.from_tree(index.get("root", {}))
+
+    def _close_snapshot(self) -> None:
+        if self._index_reader is not None:
+            self._index_reader.close()
+            self._index_reader = None
+
+    def _load_index(self) -> PathIndex:
+        self._close_snapshot()
+        self.seq, self.paths = self._open_snapshot()
+        # Refcounts are derived from the entries rather than stored, so they can never drift from the index.
+        # Counting them needs every page, so it waits until a mutation first releases a blob.
+        self._refcounts = None
+        self.orphans = set()
+
+        # Records at or below the snapshot sequence were already folded in by a compaction.
+        for record in self.journal.replay():
+            if record["seq"] > self.seq:
+                self._apply(record["op"], record["args"])
+                self.seq = record["seq"]
+        return self.paths
 
     def _save_index(self) -> None:
-        index_data = json.dumps(self.index).encode()
-        encrypted_data = self.encryptor.encrypt(index_data, self.master_password)
-        with open(self.index_file, 'wb') as f:
-            f.write(encrypted_data)
-
-    def add_file(self, file_path: str, encrypted_path: str) -> None:
-        parts = file_path.split('/')
-        current = self.index["root"]["contents"]
-        for part in parts[:-1]:
-            if part:
-                if part not in current:
-                    current[part] = {"type": "directory", "contents": {}}
-                current = current[part]["contents"]
-        current[parts[-1]] = {"type": "file", "path": encrypted_path}
+        with phase(PHASE_INDEX_SAVE):
+            index_data = index_format.dump(self.paths, self.seq, self.blob_root)
+            unmapped = False
+            try:
+                with atomic_write(self.index_file) as f:
+                    write_chunks(f, self.encryptor.encrypt_stream([index_data], self.master_password,
+                                                                  index_format.PAGE_SIZE, codec=CODEC_NONE))
+                    # The old snapshot is unmapped before it is replaced; the reopened one holds the same state.
+                    self._close_snapshot()
+                    unmapped = True
+            except BaseException:
+                if unmapped:
+                    self._load_index()
+                raise
+            self.seq, self.paths = self._open_snapshot()
+
+    def _apply(self, op: str, args: List[Any]) -> bool:
+        if op not in self._OPERATIONS:
+            raise ValueError(f"Unknown index operation: {op}")
+        return getattr(self, f'_{op}')(*args)
+
+    def _commit(self, op: str, *args: Any) -> None:
+        staged = getattr(self._batches, 'operations', None)
+        if staged is not None:
+            staged.append((op, list(args)))
+            return
+        with self.lock.writing():
+            if not self._apply(op, list(args)):
+                return
+            self.seq += 1
+            record = {"seq": self.seq, "op": op, "args": list(args)}
+            self.journal.append_many([record], sync=False)
+            if self.journal.record_count >= self.compact_threshold:
+                self.compact()
+                return
+        # The fsync waits outside the lock, so concurrent writers share one flush instead of queueing for it.
+        self.journal.apply_policy()
+
+    @contextlib.contextmanager
+    def batch(self):
+        # The body only stages operations and runs without the lock, so slow work inside a batch does not
+        # block readers. Staged operations are invisible to lookups until the batch exits, when they are
+        # applied and journaled together under one write lock, or not at all.
+        if getattr(self._batches, 'operations', None) is not None:
+            yield self
+            return
+        self._batches.operations = staged = []
+        try:
+            yield self
+        finally:
+            self._batches.operations = None
+        if staged:
+            self._apply_batch(staged)
+
+    def _apply_batch(self, staged: List[Tuple[str, List[Any]]]) -> None:
+        with self.lock.writing():
+            orphans = set(self.orphans)
+            records = []
+            try:
+                for op, args in staged:
+                    if self._apply(op, args):
+                        self.seq += 1
+                        records.append({"seq": self.seq, "op": op, "args": args})
+            except Exception:
+                # Nothing of the batch is journaled yet, so rebuilding from disk rolls back what was applied.
+                self.paths = self._load_index()
+                self.orphans |= orphans
+                raise
+            if not records:
+                return
+            if self.journal.record_count + len(records) >= self.compact_threshold:
+                self.compact()
+            else:
+                self.journal.append_many(records)
+
+    @write_locked
+    def compact(self) -> None:
         self._save_index()
+        self.journal.reset()
 
-    def get_file_path(self, file_path: str) -> str:
-        parts = file_path.split('/')
-        current = self.index["root"]["contents"]
-        for part in parts[:-1]:
-            if part:
-                if part not in current or current[part]["type"] != "directory":
-                    return None
-                current = current[part]["contents"]
-        if parts[-1] in current and current[parts[-1]]["type"] == "file":
-            return current[parts[-1]]["path"]
-        return None
+    @write_locked
+    def configure_durability(self, fsync_policy: Optional[str] = None,
+                             compact_threshold: Optional[int] = None) -> None:
+        if fsync_policy is not None:
+            if fsync_policy not in FSYNC_POLICIES:
+                raise JournalError(f"Unknown fsync policy: {fsync_policy}")
+            self.journal.fsync_policy = fsync_policy
+        if compact_threshold is not None:
+            self.compact_threshold = compact_threshold
 
-    def remove_file(self, file_path: str) -> None:
-        parts = file_path.split('/')
-        current = self.index["root"]["contents"]
-        for part in parts[:-1]:
-            if part:
-                if part not in current or current[part]["type"] != "directory":
-                    return
-                current = current[part]["contents"]
-        if parts[-1] in current and current[parts[-1]]["type"] == "file":
-            del current[parts[-1]]
-            self._save_index()
+    @write_locked
+    def sync(self) -> None:
+        self.journal.sync()
 
-    def get_file_structure(self) -> Dict[str, Any]:
-        return self.index["root"]
+    @write_locked
+    def close(self) -> None:
+        self.journal.close()
+        self._close_snapshot()
+
+    def add_file(self, file_path: str, encrypted_path: str, size: Optional[int] = None,
+                 blob: Optional[str] = None) -> None:
+        self._commit('add_file', file_path, encrypted_path, size, blob)
+
+    def remove_file(self, file_path: str) -> None:
+        self._commit('remove_file', file_path)
 
     def create_directory(self, dir_path: str) -> None:
-        parts = dir_path.split('/')
-        current = self.index["root"]["contents"]
-        for part in parts:
-            if part:
-                if part not in current:
-                    current[part] = {"type": "directory", "contents": {}}
-                current = current[part]["contents"]
-        self._save_index()
+        self._commit('create_directory', dir_path)
 
     def rename_directory(self, old_path: str, new_path: str) -> None:
-        old_parts = old_path.split('/')
-        new_parts = new_path.split('/')
-        old_parent = self.index["root"]["contents"]
-        new_parent = self.index["root"]["contents"]
-        for part in old_parts[:-1]:
-            if part:
-                old_parent = old_parent[part]["contents"]
-        for part in new_parts[:-1]:
-            if part:
-                if part not in new_parent:
-                    new_parent[part] = {"type": "directory", "contents": {}}
-                new_parent = new_parent[part]["contents"]
-        if old_parts[-1] in old_parent and old_parent[old_parts[-1]]["type"] == "directory":
-            new_parent[new_parts[-1]] = old_parent.pop(old_parts[-1])
-            self._save_index()
+        self._commit('rename_directory', old_path, new_path)
 
     def delete_directory(self, dir_path: str) -> None:
-        parts = dir_path.split('/')
-        current = self.index["root"]["contents"]
-        for part in parts[:-1]:
-            if part:
-                if part not in current or current[part]["type"] != "directory":
-                    return
-                current = current[part]["contents"]
-        if parts[-1] in current and current[parts[-1]]["type"] == "directory":
-            del current[parts[-1]]
-            self._save_index()
+        self._commit('delete_directory', dir_path)
 
     def move_file(self, src_path: str, dest_path: str) -> None:
-        src_parts = src_path.split('/')
-        dest_parts = dest_path.split('/')
-        src_parent = self.index["root"]["contents"]
-        dest_parent = self.index["root"]["contents"]
-        for part in src_parts[:-1]:
-            if part:
-                src_parent = src_parent[part]["contents"]
-        for part in dest_parts[:-1]:
-            if part:
-                if part not in dest_parent:
-                    dest_parent[part] = {"type": "directory", "contents": {}}
-                dest_parent = dest_parent[part]["contents"]
-        if src_parts[-1] in src_parent and src_parent[src_parts[-1]]["type"] == "file":
-            dest_parent[dest_parts[-1]] = src_parent.pop(src_parts[-1])
-            self._save_index()
+        self._commit('move_file', src_path, dest_path)
+
+    @property
+    def refcounts(self) -> Dict[str, int]:
+        if self._refcounts is None:
+            self._refcounts = dict(Counter(self.paths.iter_blobs()))
+        return self._refcounts
+
+    def _retain(self, entry: Entry) -> None:
+        blob = entry.blob
+        if blob is None or self._refcounts is None:
+            return
+        self.refcounts[blob] = self.refcounts.get(blob, 0) + 1
+        self.orphans.discard(blob)
+
+    def _release(self, entry: Optional[Entry]) -> None:
+        blob = entry.blob if entry is not None else None
+        if blob is None:
+            return
+        if self._refcounts is None:
+            # Entries are released after they leave the index, so a later count already reflects this one.
+            self.orphans.add(blob)
+            return
+        if blob not in self.refcounts:
+            return
+        self.refcounts[blob] -= 1
+        if self.refcounts[blob] <= 0:
+            del self.refcounts[blob]
+            self.orphans.add(blob)
+
+    def _files_under(self, path: str) -> List[Entry]:
+        if self.paths.is_file(path):
+            return [self.paths.get(path)]
+        return [entry for _, entry in self.paths.walk_files(path)]
+
+    @read_locked
+    def refcount(self, blob: str) -> int:
+        return self.refcounts.get(blob, 0)
+
+    @write_locked
+    def pop_orphans(self) -> Set[str]:
+        orphans, self.orphans = self.orphans, set()
+        return {blob for blob in orphans if self.refcount(blob) == 0}
+
+    def _add_file(self, file_path: str, encrypted_path: str, size: Optional[int] = None,
+                  blob: Optional[str] = None) -> bool:
+        entry = Entry(FILE, encrypted_path, size, blob)
+        replaced = self._files_under(file_path)
+        self.paths.set_file(file_path, entry)
+        self._retain(entry)
+        for old_entry in replaced:
+            self._release(old_entry)
+        return True
+
+    @read_locked
+    def get_entry(self, file_path: str) -> Optional[Entry]:
+        entry = self.paths.get(file_path)
+        if entry is not None and entry.kind == FILE:
+            return entry
+        return None
+
+    @read_locked
+    def get_file_path(self, file_path: str) -> str:
+        entry = self.get_entry(file_path)
+        return entry.path if entry is not None else None
+
+    def _remove_file(self, file_path: str) -> bool:
+        if not self.paths.is_file(file_path):
+            return False
+        self._release(self.paths.remove(file_path))
+        return True
+
+    def iter_files(self, dir_path: str = "") -> Iterator[Tuple[str, str]]:
+        # Collected under the lock rather than yielded, so a slow consumer never holds readers' lock open.
+        with self.lock.reading():
+            files = [(path, entry.path) for path, entry in self.paths.walk_files(dir_path)]
+        return iter(files)
+
+    def lock_stats(self) -> Dict[str, Any]:
+        return self.lock.stats()
+
+    @read_locked
+    def get_file_structure(self) -> Dict[str, Any]:
+        return self.paths.to_tree()
+
+    _SORT_KEYS = {
+        'name': lambda item: item[0],
+        'size': lambda item: (item[1].size or 0, item[0]),
+        'type': lambda item: (item[1].kind != DIRECTORY, item[0]),
+    }
+
+    @read_locked
+    def list_directory(self, dir_path: str, depth: int = 1, cursor: Optional[str] = None,
+                       limit: int = 100, sort: str = 'name') -> Dict[str, Any]:
+        if not self.paths.is_directory(dir_path):
+            raise FileNotFoundError(f"Directory not found: {dir_path}")
+        reverse = sort.startswith('-')
+        sort_key = self._SORT_KEYS.get(sort.lstrip('-'))
+        if sort_key is None:
+            raise ValueError(f"Unknown sort order: {sort}")
+        if depth < 1 or limit < 1:
+            raise ValueError("depth and limit must be positive")
+        try:
+            offset = int(cursor) if cursor else 0
+        except ValueError:
+            raise ValueError(f"Invalid cursor: {cursor}")
+
+        base = normalize_path(dir_path)
+        entries = []
+        # Depth-first, lazily expanded: only as many directories as the requested page needs are read.
+        stack = [(base, "", 1)]
+        position = 0
+        while stack and len(entries) <= limit:
+            path, relative, level = stack.pop()
+            children = sorted(self.paths.children(path), key=sort_key, reverse=reverse)
+            subdirs = []
+            for name, entry in children:
+                child_relative = f"{relative}/{name}" if relative else name
+                if position >= offset and len(entries) <= limit:
+                    entries.append({
+                        "name": name,
+                        "path": child_relative,
+                        "type": entry.kind,
+                        "size": entry.size,
+                    })
+                position += 1
+                if entry.kind == DIRECTORY and level < depth:
+                    subdirs.append((f"{path}/{name}" if path else name, child_relative, level + 1))
+            stack.extend(reversed(subdirs))
+
+        next_cursor = str(offset + limit) if len(entries) > limit else None
+        return {"directory": dir_path, "entries": entries[:limit], "next_cursor": next_cursor}
+
+    def _create_directory(self, dir_path: str) -> bool:
+        return self.paths.make_directories(dir_path)
+
+    def _rename_directory(self, old_path: str, new_path: str) -> bool:
+        if not normalize_path(old_path) or not self.paths.is_directory(old_path):
+            return False
+        replaced = self._files_under(new_path) if normalize_path(old_path) != normalize_path(new_path) else []
+        self.paths.move(old_path, new_path)
+        for entry in replaced:
+            self._release(entry)
+        return True
+
+    def _delete_directory(self, dir_path: str) -> bool:
+        if not normalize_path(dir_path) or not self.paths.is_directory(dir_path):
+            return False
+        released = self._files_under(dir_path)
+        self.paths.remove(dir_path)
+        for entry in released:
+            self._release(entry)
+        return True
+
+    def _move_file(self, src_path: str, dest_path: str) -> bool:
+        if not self.paths.is_file(src_path):
+            return False
+        replaced = self._files_under(dest_path) if normalize_path(src_path) != normalize_path(dest_path) else []
+        self.paths.move(src_path, dest_path)
+        for entry in replaced:
+            self._release(entry)
+        return True
 
+    @read_locked
     def directory_exists(self, dir_path: str) -> bool:
-        parts = dir_path.split('/')
-        current = self.index["root"]["contents"]
-        for part in parts:
-            if part:
-                if part not in current or current[part]["type"] != "directory":
-                    return False
-                current = current[part]["contents"]
-        return True
\ No newline at end of file
+        return self.paths.is_directory(dir_path)
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import secrets
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+from .durability import atomic_write
+from .container import ContainerHeader, StreamEncryptor, DEFAULT_CHUNK_SIZE, TAG_SIZE
+from src.LogSystem.LoggerSystem import Logger
+
+logger = Logger(use_json=True)
+log_class = logger.log_class()
+
+UPLOAD_DIR = 'uploads'
+DEFAULT_SESSION_TTL = 24 * 60 * 60
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class UploadOffsetMismatch(ValueError):
+    def __init__(self, expected: int) -> None:
+        super().__init__(f"Upload offset mismatch, expected {expected}")
+        self.expected = expected
+
+
+@log_class
+class UploadSession:
+    def __init__(self, session_id: str, dest_path: str, part_path: str, stream: StreamEncryptor,
+                 size: Optional[int] = None) -> None:
+        self.session_id = session_id
+        self.dest_path = dest_path
+        self.part_path = part_path
+        self.stream = stream
+        # Set once the final chunk is written; the session then only waits to be stored.
+        self.size = size
+        self.closed = False
+        self.lock = threading.RLock()
+
+    @property
+    def offset(self) -> int:
+        if self.size is not None:
+            return self.size
+        return self.stream.counter * self.stream.header.chunk_size + self.stream.buffered
+
+    @property
+    def chunk_size(self) -> int:
+        return self.stream.header.chunk_size
+
+    def status(self) -> Dict[str, Any]:
+        return {"session_id": self.session_id, "offset": self.offset, "chunk_size": self.chunk_size}
+
+    def write(self, chunks: Iterable[bytes], offset: int) -> int:
+        with self.lock:
+            if self.closed or self.size is not None:
+                raise FileNotFoundError(f"Upload session closed: {self.session_id}")
+            if offset != self.offset:
+                raise UploadOffsetMismatch(self.offset)
+            with open(self.part_path, 'ab') as f:
+                try:
+                    for chunk in chunks:
+                        sealed = self.stream.update(chunk)
+                        if sealed:
+                            f.write(sealed)
+                finally:
+                    # Whatever was sealed before a dropped connection stays committed.
+                    f.flush()
+                    os.fsync(f.fileno())
+            return self.offset
+
+    def finish(self) -> int:
+        with self.lock:
+            if self.closed:
+                raise FileNotFoundError(f"Upload session closed: {self.session_id}")
+            if self.size is None:
+                size = self.offset
+                with open(self.part_path, 'ab') as f:
+                    f.write(self.stream.finalize())
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.size = size
+            return self.size
+
+
+@log_class
+class UploadManager:
+    def __init__(self, file_handler, session_ttl: float = DEFAULT_SESSION_TTL) -> None:
+        self.file_handler = file_handler
+        self.upload_dir = os.path.join(file_handler.base_path, UPLOAD_DIR)
+        self.session_ttl = session_ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, session_id: str) -> Tuple[str, str]:
+        if not _SESSION_ID.match(session_id or ''):
+            raise FileNotFoundError(f"Upload session not found: {session_id}")
+        base = os.path.join(self.upload_dir, session_id)
+        return f'{base}.state', f'{base}.part'
+
+    def create(self, dest_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> UploadSession:
+        self.expire()
+        os.makedirs(self.upload_dir, exist_ok=True)
+        encryptor = self.file_handler.encryptor
+        password = self.file_handler.master_password
+        session_id = secrets.token_urlsafe(18)
+        _, part_path = self._paths(session_id)
+
+        stream = encryptor.begin_stream(password, chunk_size)
+        with open(part_path, 'wb') as f:
+            f.write(stream.begin())
+            f.flush()
+            os.fsync(f.fileno())
+        self._save_state(session_id, {"path": dest_path})
+
+        session = UploadSession(session_id, dest_path, part_path, stream)
+        with self._lock:
+            self._sessions[session_id] = session
+        return session
+
+    def _save_state(self, session_id: str, state: Dict[str, Any]) -> None:
+        # The destination path is as sensitive as the index, so the session state is encrypted too.
+        state_path, _ = self._paths(session_id)
+        with atomic_write(state_path) as f:
+            f.write(self.file_handler.encryptor.encrypt(json.dumps(state).encode(),
+                                                        self.file_handler.master_password))
+
+    def _restore(self, session_id: str) -> UploadSession:
+        state_path, part_path = self._paths(session_id)
+        if not (os.path.exists(state_path) and os.path.exists(part_path)):
+            raise FileNotFoundError(f"Upload session not found: {session_id}")
+        encryptor = self.file_handler.encryptor
+        password = self.file_handler.master_password
+        with open(state_path, 'rb') as f:
+            state = json.loads(encryptor.decrypt(f.read(), password))
+
+        with open(part_path, 'r+b') as f:
+            header = ContainerHeader.read_from(f)
+            sealed_size = header.chunk_size + TAG_SIZE
+            length = os.fstat(f.fileno()).st_size - header.size
+            final_chunk = state.get("final_chunk")
+            if final_chunk is not None:
+                size = state["size"]
+                if length == final_chunk * sealed_size + size - final_chunk * header.chunk_size + TAG_SIZE:
+                    return UploadSession(session_id, state["path"], part_path,
+                                         encryptor.resume_stream(header, final_chunk + 1, password), size)
+            counter = length // sealed_size
+            # A chunk torn by a crash is dropped; the client resumes from the last complete one.
+            f.truncate(header.size + counter * sealed_size)
+        if final_chunk is not None:
+            # The final chunk never made it to disk, so its plaintext has to be sent again.
+            self._save_state(session_id, {"path": state["path"]})
+        return UploadSession(session_id, state["path"], part_path,
+                             encryptor.resume_stream(header, counter, password))
+
+    def get(self, session_id: str) -> UploadSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._restore(session_id)
+                self._sessions[session_id] = session
+            return session
+
+    def write(self, session_id: str, chunks: Iterable[bytes], offset: int) -> int:
+        return self.get(session_id).write(chunks, offset)
+
+    def complete(self, session_id: str) -> Dict[str, Any]:
+        session = self.get(session_id)
+        with session.lock:
+            if session.closed:
+                raise FileNotFoundError(f"Upload session closed: {session_id}")
+            if session.size is None:
+                # A full-size final chunk looks like any other sealed chunk, so a restored part can only tell
+                # it apart if its index is recorded before it is written.
+                self._save_state(session_id, {"path": session.dest_path, "size": session.offset,
+                                              "final_chunk": session.stream.counter})
+            size = session.finish()
+            self.file_handler.store_blob(session.part_path, session.dest_path, size)
+            # Closed only once stored, so a failed store can be retried with the same session.
+            session.closed = True
+        self._discard(session_id)
+        return {"path": session.dest_path, "size": size}
+
+    def abort(self, session_id: str) -> None:
+        session = self.get(session_id)
+        with session.lock:
+            session.closed = True
+        self._discard(session_id)
+
+    def _discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        for path in self._paths(session_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def expire(self) -> int:
+        if not os.path.isdir(self.upload_dir):
+            return 0
+        cutoff = time.time() - self.session_ttl
+        expired = 0
+        for name in os.listdir(self.upload_dir):
+            session_id, ext = os.path.splitext(name)
+            path = os.path.join(self.upload_dir, name)
+            if (ext == '.part' and _SESSION_ID.match(session_id) and session_id not in self._sessions
+                    and os.path.getmtime(path) < cutoff):
+                self._discard(session_id)
+                expired += 1
+        return expired
@@ -1,4 +1,6 @@
 import os
+from typing import Iterable, Iterator
+from .metrics import PHASE_DISK_IO, count_bytes, phase
 
 def create_directory_if_not_exists(path: str) -> None:
     if not os.path.exists(path):
@@ -8,3 +10,24 @@ def is_valid_path(path: str) -> bool:
     if not path:
         return False
     return os.path.exists(path) and os.path.isdir(path)
+
+
+def read_chunks(file_obj, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    while True:
+        with phase(PHASE_DISK_IO):
+            chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        count_bytes(PHASE_DISK_IO, 'read', len(chunk))
+        yield chunk
+
+
+def write_chunks(file_obj, chunks: Iterable[bytes]) -> int:
+    written = 0
+    for chunk in chunks:
+        with phase(PHASE_DISK_IO):
+            file_obj.write(chunk)
+        # Counted as it goes, so bytes already on disk are reported even if a later chunk fails.
+        count_bytes(PHASE_DISK_IO, 'write', len(chunk))
+        written += len(chunk)
+    return written
@@ -0,0 +1,118 @@
+import os
+import hmac
+import threading
+from typing import Any, Dict, Optional
+from .encryption import AdvancedEncryptor
+from .workers import CryptoWorkerPool
+from .durability import GroupCommit, atomic_write
+from src.LogSystem.LoggerSystem import Logger
+
+logger = Logger(use_json=True)
+log_class = logger.log_class()
+
+# Key files a vault from before the vault key may have left in the process working directory.
+LEGACY_KEY_FILES = ('master_key.key', 'salt.key', 'rsa_key.pem')
+
+@log_class
+class VaultContext:
+    def __init__(self, base_path: str, master_password: str, workers: Optional[CryptoWorkerPool] = None) -> None:
+        self.base_path = base_path
+        self.master_password = master_password
+        self.workers = workers or CryptoWorkerPool()
+        self.commits = GroupCommit()
+        self.file_handler: Optional[Any] = None
+        self.unlocked = False
+        self._encryptor: Optional[AdvancedEncryptor] = None
+        self._lock = threading.Lock()
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.base_path, *parts)
+
+    def _adopt_legacy_keys(self) -> None:
+        # Key files used to live in the process working directory, and older initializers only copied some of
+        # them into the vault. A vault from before the vault key gets each one it lacks, so its files keep
+        # decrypting instead of meeting a freshly generated key.
+        if not os.path.exists(self.path('index.enc')) or os.path.exists(self.path('vault_key.enc')):
+            return
+        legacy_dir = os.getcwd()
+        if os.path.abspath(legacy_dir) == os.path.abspath(self.base_path):
+            return
+        for name in LEGACY_KEY_FILES:
+            legacy_path = os.path.join(legacy_dir, name)
+            if os.path.exists(legacy_path) and not os.path.exists(self.path(name)):
+                with open(legacy_path, 'rb') as src, atomic_write(self.path(name)) as dst:
+                    dst.write(src.read())
+                logger.info(f"Copied legacy key file {legacy_path} into {self.base_path}")
+
+    @property
+    def encryptor(self) -> AdvancedEncryptor:
+        if self._encryptor is None:
+            with self._lock:
+                if self._encryptor is None:
+                    self._adopt_legacy_keys()
+                    self._encryptor = AdvancedEncryptor(
+                        key_file=self.path('master_key.key'),
+                        salt_file=self.path('salt.key'),
+                        rsa_key_file=self.path('rsa_key.pem'),
+                        vault_key_file=self.path('vault_key.enc')
+                    )
+        return self._encryptor
+
+    def warm_up(self) -> None:
+        try:
+            self.encryptor.unlock(self.master_password)
+        except ValueError:
+            # A context whose password never unlocked the vault must not lock the right password out.
+            if not self.unlocked:
+                self.forget()
+            raise
+        self.unlocked = True
+
+    def forget(self) -> None:
+        # The next open_vault for this path builds a new context instead of returning this one.
+        key = os.path.abspath(self.base_path)
+        with _vaults_lock:
+            if _vaults.get(key) is self:
+                del _vaults[key]
+
+    def configure_workers(self, max_workers: Optional[int] = None, max_in_flight_jobs: Optional[int] = None) -> None:
+        workers = CryptoWorkerPool(max_workers, max_in_flight_jobs=max_in_flight_jobs)
+        if (workers.max_workers, workers.max_in_flight_jobs) == (self.workers.max_workers,
+                                                                 self.workers.max_in_flight_jobs):
+            return
+        # Bulk operations already running keep the pool they started on; its threads exit once it is unused.
+        self.workers = workers
+
+    def check_password(self, master_password: str) -> bool:
+        return hmac.compare_digest(self.master_password.encode(), master_password.encode())
+
+
+_vaults: Dict[str, VaultContext] = {}
+_vaults_lock = threading.Lock()
+_active_vault: Optional[VaultContext] = None
+
+
+def open_vault(base_path: str, master_password: str, max_workers: Optional[int] = None,
+               max_in_flight_jobs: Optional[int] = None) -> VaultContext:
+    key = os.path.abspath(base_path)
+    with _vaults_lock:
+        vault = _vaults.get(key)
+        if vault is None:
+            vault = VaultContext(base_path, master_password,
+                                 CryptoWorkerPool(max_workers, max_in_flight_jobs=max_in_flight_jobs))
+            _vaults[key] = vault
+        elif not vault.check_password(master_password):
+            # The open context keeps serving its sessions; a wrong password must not replace it.
+            raise ValueError("Invalid password")
+        elif max_workers is not None or max_in_flight_jobs is not None:
+            vault.configure_workers(max_workers, max_in_flight_jobs)
+        return vault
+
+
+def set_active_vault(vault: Optional[VaultContext]) -> None:
+    global _active_vault
+    _active_vault = vault
+
+
+def get_active_vault() -> Optional[VaultContext]:
+    return _active_vault
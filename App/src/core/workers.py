@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+
+ProgressCallback = Callable[[int, int, int, int], None]
+
+
+class CryptoWorkerPool:
+    def __init__(self, max_workers: Optional[int] = None, max_in_flight_bytes: int = 256 * 1024 * 1024,
+                 max_in_flight_jobs: Optional[int] = None) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.max_in_flight_jobs = max_in_flight_jobs or self.max_workers * 2
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='crypto-worker')
+            return self._executor
+
+    def imap(self, fn: Callable[[Any], Any], items: Iterable[Any],
+             cost: Optional[Callable[[Any], int]] = None,
+             progress: Optional[ProgressCallback] = None) -> Iterator[Any]:
+        items = list(items)
+        costs = [cost(item) if cost else 0 for item in items]
+        total, bytes_total = len(items), sum(costs)
+        done = bytes_done = in_flight = 0
+        executor = self._get_executor()
+        pending = deque()
+
+        def finish():
+            nonlocal done, bytes_done, in_flight
+            job_cost, future = pending.popleft()
+            result = future.result()
+            in_flight -= job_cost
+            done += 1
+            bytes_done += job_cost
+            if progress is not None:
+                progress(done, total, bytes_done, bytes_total)
+            return result
+
+        try:
+            for item, job_cost in zip(items, costs):
+                # Back-pressure: hand back finished results before letting more bytes into flight.
+                while pending and (len(pending) >= self.max_in_flight_jobs
+                                   or in_flight + job_cost > self.max_in_flight_bytes):
+                    yield finish()
+                pending.append((job_cost, executor.submit(fn, item)))
+                in_flight += job_cost
+            while pending:
+                yield finish()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            for _, future in pending:
+                if not future.cancelled():
+                    future.exception()
+
+    def run(self, fn: Callable[[Any], Any], items: Iterable[Any],
+            cost: Optional[Callable[[Any], int]] = None,
+            progress: Optional[ProgressCallback] = None) -> List[Any]:
+        return list(self.imap(fn, items, cost, progress))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
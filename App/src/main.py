@@ -1,6 +1,6 @@
 import customtkinter as ctk
 import tkinter as tk
-from tkinter import messagebox, filedialog
+from tkinter import messagebox, filedialog, ttk
 import base64
 import tempfile
 import threading
@@ -49,6 +49,8 @@ class PasswordDialog(ctk.CTk):
         return self.password
 
 class FileManagerGUI(ctk.CTk):
+    PAGE_SIZE = 200
+
     def __init__(self):
         super().__init__()
 
@@ -57,6 +59,8 @@ class FileManagerGUI(ctk.CTk):
 
         self.file_ops = None
         self.current_dir = ""
+        self.unloaded_dirs = {}
+        self.more_items = {}
 
         self.create_widgets()
 
@@ -79,8 +83,13 @@ class FileManagerGUI(ctk.CTk):
         self.deploy_button = ctk.CTkButton(top_frame, text="Deploy File System", command=self.deploy_file_system)
         self.deploy_button.grid(row=0, column=1, padx=5, pady=5)
 
-        self.file_list = ctk.CTkTextbox(main_frame, wrap="none")
+        self.file_list = ttk.Treeview(main_frame, columns=("size",))
+        self.file_list.heading("#0", text="Name")
+        self.file_list.heading("size", text="Size")
+        self.file_list.column("size", width=120, anchor="e", stretch=False)
         self.file_list.grid(row=1, column=0, padx=5, pady=5, sticky="nsew")
+        self.file_list.bind("<<TreeviewOpen>>", self.on_directory_open)
+        self.file_list.bind("<Double-1>", self.on_item_activate)
 
         bottom_frame = ctk.CTkFrame(main_frame)
         bottom_frame.grid(row=2, column=0, padx=5, pady=5, sticky="ew")
@@ -127,20 +136,44 @@ class FileManagerGUI(ctk.CTk):
     def update_file_list(self):
         def task():
             self.current_dir_label.configure(text=f"Current Directory: {self.current_dir}")
-            self.file_list.delete("1.0", tk.END)
+            self.file_list.delete(*self.file_list.get_children())
+            self.unloaded_dirs.clear()
+            self.more_items.clear()
             if self.file_ops:
-                file_structure = self.file_ops.list_files()
-                self.print_file_structure(file_structure)
+                self.load_directory("", "")
 
         threading.Thread(target=task).start()
 
-    def print_file_structure(self, structure, indent=""):
-        for name, info in structure["contents"].items():
-            if info["type"] == "directory":
-                self.file_list.insert(tk.END, f"{indent}{name}/\n")
-                self.print_file_structure(info, indent + "  ")
+    def load_directory(self, parent_item, dir_name, cursor=None):
+        listing = self.file_ops.list_directory(dir_name, cursor=cursor, limit=self.PAGE_SIZE)
+        for entry in listing["entries"]:
+            if entry["type"] == "directory":
+                item = self.file_list.insert(parent_item, tk.END, text=f"{entry['name']}/", values=("",))
+                # Placeholder child so the node can be expanded before its contents are fetched.
+                self.file_list.insert(item, tk.END, text="...")
+                self.unloaded_dirs[item] = f"{dir_name}/{entry['path']}" if dir_name else entry["path"]
             else:
-                self.file_list.insert(tk.END, f"{indent}{name}\n")
+                size = entry["size"] if entry["size"] is not None else ""
+                self.file_list.insert(parent_item, tk.END, text=entry["name"], values=(size,))
+        if listing["next_cursor"]:
+            item = self.file_list.insert(parent_item, tk.END, text="Load more...")
+            self.more_items[item] = (parent_item, dir_name, listing["next_cursor"])
+
+    def on_directory_open(self, event):
+        item = self.file_list.focus()
+        dir_name = self.unloaded_dirs.pop(item, None)
+        if dir_name is None:
+            return
+        self.file_list.delete(*self.file_list.get_children(item))
+        threading.Thread(target=self.load_directory, args=(item, dir_name)).start()
+
+    def on_item_activate(self, event):
+        item = self.file_list.identify_row(event.y)
+        page = self.more_items.pop(item, None)
+        if page is None:
+            return
+        self.file_list.delete(item)
+        threading.Thread(target=self.load_directory, args=page).start()
 
     def add_file(self):
         def task():
@@ -0,0 +1,71 @@
+import base64
+import json
+import os
+import shutil
+import sys
+
+import pytest
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.join(APP_DIR, 'src', 'backend')]
+
+from src.core.encryption import AdvancedEncryptor  # noqa: E402
+from src.core.file_handler import SecureFileHandler  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+@pytest.fixture
+def vault_dir(tmp_path):
+    path = tmp_path / 'vault'
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import app
+    return app.app.test_client()
+
+
+@pytest.fixture
+def file_handler(vault_dir):
+    handler = SecureFileHandler(vault_dir, PASSWORD)
+    yield handler
+    handler.storage.close()
+
+
+def legacy_seal(key_dir: str, data: bytes, password: str) -> bytes:
+    """Encrypts the way the original AdvancedEncryptor did: an RSA-wrapped scrypt key, base64 encoded."""
+    with open(os.path.join(key_dir, 'salt.key'), 'rb') as f:
+        key = Scrypt(salt=f.read(), length=32, n=2**16, r=8, p=1).derive(password.encode())
+    with open(os.path.join(key_dir, 'rsa_key.pem'), 'rb') as f:
+        rsa_key = serialization.load_pem_private_key(f.read(), password=None)
+    oaep = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+    nonce = os.urandom(12)
+    return base64.urlsafe_b64encode(nonce + rsa_key.public_key().encrypt(key, oaep)
+                                    + ChaCha20Poly1305(key).encrypt(nonce, data, None))
+
+
+@pytest.fixture
+def baseline_vault(tmp_path, monkeypatch):
+    """A vault as the original code left it: every key in the working directory, only the master key and
+    salt copied into the vault, and a JSON index pointing at base64 files."""
+    cwd = tmp_path / 'cwd'
+    cwd.mkdir()
+    monkeypatch.chdir(cwd)
+    AdvancedEncryptor()
+    vault_dir = tmp_path / 'baseline-vault'
+    vault_dir.mkdir()
+    for name in ('master_key.key', 'salt.key'):
+        shutil.copy(cwd / name, vault_dir / name)
+    note = vault_dir / 'note.txt.enc'
+    note.write_bytes(legacy_seal(str(cwd), b'hello', PASSWORD))
+    index = {"root": {"type": "directory", "contents": {"note.txt": {"type": "file", "path": str(note)}}}}
+    (vault_dir / 'index.enc').write_bytes(legacy_seal(str(cwd), json.dumps(index).encode(), PASSWORD))
+    return str(vault_dir)
@@ -0,0 +1,90 @@
+import os
+import random
+import threading
+
+import pytest
+
+from src.core.storage import SecureStorage
+
+PASSWORD = 'correct horse battery staple'
+THREADS = 16
+REQUESTS = 25
+
+
+@pytest.fixture
+def client(vault_dir, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import app
+    client = app.app.test_client()
+    response = client.post('/system_operations/deploy', data={'base_path': vault_dir, 'master_password': PASSWORD})
+    assert response.status_code == 200
+    return client
+
+
+def _hammer(client, seed, errors):
+    rnd = random.Random(seed)
+    for request in range(REQUESTS):
+        file_id = f't{seed}/f{rnd.randint(0, 4)}.bin'
+        try:
+            choice = rnd.random()
+            if choice < 0.3:
+                body = f'{seed}-{request}'.encode() * rnd.randint(1, 50)
+                response = client.post(f'/file_operations/upload?file_id={file_id}', data=body,
+                                       content_type='application/octet-stream')
+                assert response.status_code == 200, response.get_json()
+            elif choice < 0.4:
+                response = client.post('/file_operations/delete', data={'file_id': file_id})
+                assert response.status_code in (200, 404, 500), response.status_code
+            else:
+                response = client.get(f'/file_operations/list?dir=t{rnd.randint(0, THREADS - 1)}&limit=10')
+                assert response.status_code in (200, 404, 500), response.status_code
+                with client.get(f'/file_operations/stream?file_id={file_id}') as response:
+                    assert response.status_code in (200, 404), response.status_code
+                    response.get_data()
+        except Exception as exc:
+            errors.append(repr(exc))
+
+
+def test_concurrent_requests_keep_index_consistent(client, vault_dir):
+    import app
+    errors = []
+    workers = [threading.Thread(target=_hammer, args=(app.app.test_client(), seed, errors))
+               for seed in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert errors == []
+
+    storage = SecureStorage(vault_dir, PASSWORD)
+    try:
+        assert all(os.path.exists(blob) for _, blob in storage.iter_files())
+        on_disk = sum(len(files) for root, _, files in os.walk(os.path.join(vault_dir, 'blobs'))
+                      if os.path.basename(root) != 'tmp')
+        assert on_disk == len(storage.refcounts)
+    finally:
+        storage.close()
+
+
+def test_batch_body_does_not_block_readers(vault_dir):
+    storage = SecureStorage(vault_dir, PASSWORD)
+    storage.add_file('root/a.txt', 'blob-a')
+    staged, read = threading.Event(), threading.Event()
+
+    def reader():
+        staged.wait()
+        assert storage.get_entry('root/a.txt') is not None
+        assert storage.get_entry('root/b.txt') is None
+        read.set()
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        with storage.batch():
+            storage.add_file('root/b.txt', 'blob-b')
+            staged.set()
+            assert read.wait(5)
+        assert storage.get_entry('root/b.txt') is not None
+    finally:
+        thread.join()
+        storage.close()
@@ -0,0 +1,137 @@
+import io
+import os
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from src.core.codecs import CODEC_ZLIB, get_codec
+from src.core.container import (ContainerError, ContainerHeader, ContainerReader, FRAMED_VERSION,
+                                KEY_WRAP_VAULT_HKDF, StreamDecryptor, StreamEncryptor)
+
+KEY = bytes(32)
+CHUNK_SIZE = 1024
+PLAINTEXT = b''.join(b'line %06d of a compressible file\n' % i for i in range(4000))
+
+
+def _container(data: bytes) -> bytes:
+    stream = StreamEncryptor(KEY, ContainerHeader(KEY_WRAP_VAULT_HKDF, os.urandom(16), CHUNK_SIZE))
+    return stream.begin() + stream.update(data) + stream.finalize()
+
+
+def _framed_container(data: bytes) -> bytes:
+    header = ContainerHeader(KEY_WRAP_VAULT_HKDF, os.urandom(16), CHUNK_SIZE, codec=CODEC_ZLIB,
+                             version=FRAMED_VERSION)
+    stream = StreamEncryptor(KEY, header, compress=get_codec(CODEC_ZLIB).compress_block)
+    return stream.begin() + stream.update(data) + stream.finalize()
+
+
+def _decryptor(container: bytes) -> StreamDecryptor:
+    header = ContainerHeader.unpack(container)
+    return StreamDecryptor(KEY, header, decompress=get_codec(header.codec).decompress_block)
+
+
+def _read(reader, length: int) -> bytes:
+    parts = []
+    while length > 0:
+        part = reader.read(length)
+        if not part:
+            break
+        parts.append(part)
+        length -= len(part)
+    return b''.join(parts)
+
+
+class _CountingDecryptor(StreamDecryptor):
+    opened = 0
+
+    def open_chunk(self, index, data, final):
+        self.opened += 1
+        return super().open_chunk(index, data, final)
+
+
+@pytest.mark.parametrize('length', [0, 1, CHUNK_SIZE, 3 * CHUNK_SIZE, 3 * CHUNK_SIZE + 17])
+@pytest.mark.parametrize('feed', [1, 1000, 10**6])
+def test_stream_round_trip(length, feed):
+    container = _container(PLAINTEXT[:length])
+    header = ContainerHeader.unpack(container)
+    body = container[header.size:]
+    assert len(body) == length + max(1, -(-length // CHUNK_SIZE)) * 16
+    stream = _decryptor(container)
+    out = [stream.update(body[i:i + feed]) for i in range(0, len(body), feed)]
+    assert b''.join(out) + stream.finalize() == PLAINTEXT[:length]
+
+
+def test_range_read_only_opens_overlapping_chunks():
+    plaintext = PLAINTEXT[:10 * CHUNK_SIZE + 300]
+    container = _container(plaintext)
+    decryptor = _CountingDecryptor(KEY, ContainerHeader.unpack(container))
+    reader = ContainerReader(io.BytesIO(container), decryptor, len(container))
+    assert reader.size == len(plaintext)
+    reader.seek(4 * CHUNK_SIZE - 10)
+    assert _read(reader, 20) == plaintext[4 * CHUNK_SIZE - 10:4 * CHUNK_SIZE + 10]
+    assert decryptor.opened == 2
+
+
+@pytest.mark.parametrize('tamper', ['drop_final_chunk', 'swap_chunks', 'flip_bit'])
+def test_tampering_is_detected(tamper):
+    container = bytearray(_container(PLAINTEXT[:3 * CHUNK_SIZE + 5]))
+    header = ContainerHeader.unpack(bytes(container))
+    sealed = CHUNK_SIZE + 16
+    first, second = header.size, header.size + sealed
+    if tamper == 'drop_final_chunk':
+        del container[header.size + 3 * sealed:]
+    elif tamper == 'swap_chunks':
+        container[first:second + sealed] = container[second:second + sealed] + container[first:second]
+    else:
+        container[second + 5] ^= 1
+    stream = _decryptor(bytes(container))
+    with pytest.raises((InvalidTag, ContainerError)):
+        stream.update(bytes(container[header.size:]))
+        stream.finalize()
+
+
+@pytest.mark.parametrize('feed', [1, 7, 4096, 10**6])
+def test_framed_stream_round_trip(feed):
+    container = _framed_container(PLAINTEXT)
+    assert len(container) < len(PLAINTEXT) // 4
+    header = ContainerHeader.unpack(container)
+    stream = _decryptor(container)
+    body = container[header.size:]
+    out = [stream.update(body[i:i + feed]) for i in range(0, len(body), feed)]
+    assert b''.join(out) + stream.finalize() == PLAINTEXT
+
+
+def test_framed_range_read_only_opens_overlapping_chunks():
+    container = _framed_container(PLAINTEXT)
+    header = ContainerHeader.unpack(container)
+    decryptor = _CountingDecryptor(KEY, header, decompress=get_codec(header.codec).decompress_block)
+    reader = ContainerReader(io.BytesIO(container), decryptor, len(container), len(PLAINTEXT))
+    offset = len(PLAINTEXT) - 3 * CHUNK_SIZE + 100
+    reader.seek(offset)
+    assert _read(reader, CHUNK_SIZE) == PLAINTEXT[offset:offset + CHUNK_SIZE]
+    assert decryptor.opened == 2
+    reader.seek(10)
+    assert _read(reader, 20) == PLAINTEXT[10:30]
+    assert decryptor.opened == 3
+
+
+def test_framed_size_without_hint():
+    container = _framed_container(PLAINTEXT[:CHUNK_SIZE * 3 + 5])
+    reader = ContainerReader(io.BytesIO(container), _decryptor(container), len(container))
+    assert reader.size == CHUNK_SIZE * 3 + 5
+    assert reader.read() == PLAINTEXT[:CHUNK_SIZE * 3 + 5]
+
+
+def test_framed_truncation_is_detected():
+    container = _framed_container(PLAINTEXT)
+    header = ContainerHeader.unpack(container)
+    stream = _decryptor(container)
+    stream.update(container[header.size:-1])
+    with pytest.raises(ContainerError):
+        stream.finalize()
+
+
+def test_compressed_version_one_is_rejected():
+    header = ContainerHeader(KEY_WRAP_VAULT_HKDF, os.urandom(16), CHUNK_SIZE, codec=CODEC_ZLIB)
+    with pytest.raises(ContainerError):
+        ContainerHeader.unpack(header.pack())
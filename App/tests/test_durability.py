@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+
+from src.core import durability
+from src.core.durability import GroupCommit
+from src.core.file_handler import SecureFileHandler
+from src.core.journal import FSYNC_ALWAYS
+from src.core.storage import SecureStorage
+
+PASSWORD = 'correct horse battery staple'
+
+
+def test_failed_flush_reaches_every_waiter_once(tmp_path, monkeypatch):
+    entered, release = threading.Event(), threading.Event()
+
+    def failing_fsync(path):
+        entered.set()
+        release.wait(5)
+        raise OSError(f"fsync failed: {path}")
+
+    monkeypatch.setattr(durability, 'fsync_path', failing_fsync)
+    commit = GroupCommit()
+    errors = []
+
+    def sync(name):
+        try:
+            commit.sync(str(tmp_path / name))
+        except OSError as e:
+            errors.append(e)
+
+    first = threading.Thread(target=sync, args=('first',))
+    first.start()
+    assert entered.wait(5)
+    # These queue up behind the stalled flush and share the next one.
+    others = [threading.Thread(target=sync, args=(f'other-{i}',)) for i in range(4)]
+    for thread in others:
+        thread.start()
+    while commit.requests < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in [first] + others:
+        thread.join()
+
+    assert len(errors) == 5
+    assert commit.flushes == 2
+    assert commit._failures == {} and commit._waiters == {}
+
+    monkeypatch.setattr(durability, 'fsync_path', lambda path: None)
+    commit.sync(str(tmp_path / 'later'))
+
+
+def _add(handler, tmp_path, *names):
+    for name in names:
+        source = tmp_path / name
+        source.write_bytes(name.encode())
+        handler.add_file(str(source), f'root/{name}')
+
+
+def test_journal_replays_uncompacted_mutations(vault_dir, tmp_path):
+    handler = SecureFileHandler(vault_dir, PASSWORD, fsync_policy=FSYNC_ALWAYS)
+    _add(handler, tmp_path, 'a.txt', 'b.txt')
+    handler.delete_file('root/a.txt')
+    assert handler.storage.journal.record_count == 3
+
+    # A second storage over the same files sees the state a restart after a crash would.
+    reopened = SecureStorage(vault_dir, PASSWORD)
+    assert reopened.seq == handler.storage.seq
+    assert reopened.get_entry('root/a.txt') is None
+    assert reopened.get_entry('root/b.txt').size == len('b.txt')
+    reopened.close()
+    handler.storage.close()
+
+
+def test_torn_journal_tail_is_truncated(vault_dir, tmp_path):
+    handler = SecureFileHandler(vault_dir, PASSWORD, fsync_policy=FSYNC_ALWAYS)
+    _add(handler, tmp_path, 'a.txt')
+    journal_path = handler.storage.journal.path
+    intact = os.path.getsize(journal_path)
+    _add(handler, tmp_path, 'b.txt')
+    handler.storage.close()
+    with open(journal_path, 'r+b') as f:
+        f.truncate(os.path.getsize(journal_path) - 5)
+
+    reopened = SecureStorage(vault_dir, PASSWORD)
+    assert reopened.get_entry('root/a.txt') is not None
+    assert reopened.get_entry('root/b.txt') is None
+    assert os.path.getsize(journal_path) == intact
+    reopened.close()
+
+
+def test_handler_passes_compact_threshold_to_storage(vault_dir, tmp_path):
+    handler = SecureFileHandler(vault_dir, PASSWORD, compact_threshold=2)
+    _add(handler, tmp_path, 'a.txt', 'b.txt')
+    assert handler.storage.journal.record_count == 0
+    assert SecureStorage(vault_dir, PASSWORD).get_entry('root/b.txt') is not None
+    handler.storage.close()
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from conftest import legacy_seal
+from src.core.container import (DEFAULT_CHUNK_SIZE, FORMAT_VERSION, FRAMED_VERSION, KEY_WRAP_RSA_OAEP,
+                                TAG_SIZE, ContainerHeader, StreamEncryptor, is_container)
+from src.core.encryption import AdvancedEncryptor, VaultKeyError, _rsa_wrap
+
+PASSWORD = 'correct horse battery staple'
+
+
+def _encryptor(directory: str) -> AdvancedEncryptor:
+    return AdvancedEncryptor(key_file=os.path.join(directory, 'master_key.key'),
+                             salt_file=os.path.join(directory, 'salt.key'),
+                             rsa_key_file=os.path.join(directory, 'rsa_key.pem'),
+                             vault_key_file=os.path.join(directory, 'vault_key.enc'))
+
+
+def _rsa_oaep_container(encryptor: AdvancedEncryptor, data: bytes) -> bytes:
+    symmetric_key = encryptor._derive_key(PASSWORD)
+    header = ContainerHeader(KEY_WRAP_RSA_OAEP, _rsa_wrap(encryptor.rsa_key, symmetric_key), 1024)
+    stream = StreamEncryptor(symmetric_key, header)
+    return stream.begin() + stream.update(data) + stream.finalize()
+
+
+def test_rotate_keys_keeps_every_format_readable(tmp_path):
+    directory = str(tmp_path)
+    encryptor = _encryptor(directory)
+    plaintexts = [os.urandom(5000), b'the same line again\n' * 2000, b'rsa container', b'base64']
+    sealed = [encryptor.encrypt(plaintexts[0], PASSWORD), encryptor.encrypt(plaintexts[1], PASSWORD),
+              _rsa_oaep_container(encryptor, plaintexts[2]), legacy_seal(directory, plaintexts[3], PASSWORD)]
+    assert [ContainerHeader.unpack(data).version for data in sealed[:2]] == [FORMAT_VERSION, FRAMED_VERSION]
+    sealed_vault_key = open(encryptor.vault_key_file, 'rb').read()
+
+    encryptor.rotate_keys(PASSWORD)
+    assert open(encryptor.vault_key_file, 'rb').read() != sealed_vault_key
+    reopened = _encryptor(directory)
+    assert [reopened.decrypt(data, PASSWORD) for data in sealed] == plaintexts
+    with pytest.raises(ValueError):
+        _encryptor(directory).unlock('wrong password')
+
+
+def test_missing_vault_key_is_not_recreated(tmp_path):
+    encryptor = _encryptor(str(tmp_path))
+    sealed = encryptor.encrypt(b'payload', PASSWORD)
+    os.remove(encryptor.vault_key_file)
+    reopened = _encryptor(str(tmp_path))
+    with pytest.raises(VaultKeyError):
+        reopened.decrypt(sealed, PASSWORD)
+    assert not os.path.exists(reopened.vault_key_file)
+
+
+def test_cached_keys_survive_cache_clear(tmp_path):
+    encryptor = _encryptor(str(tmp_path))
+    vault_key = encryptor._vault_key(PASSWORD)
+    kek = encryptor._derive_key(PASSWORD)
+    copy = bytes(vault_key)
+    encryptor.lock()
+    assert vault_key == copy and any(vault_key) and any(kek)
+
+
+def test_containers_are_raw_binary_and_stream_in_pieces(tmp_path):
+    encryptor = _encryptor(str(tmp_path))
+    plaintext = os.urandom(3 * DEFAULT_CHUNK_SIZE + 11)
+    sealed = encryptor.encrypt(plaintext, PASSWORD)
+    assert is_container(sealed) and not encryptor.is_legacy_format(sealed)
+    header = ContainerHeader.unpack(sealed)
+    assert len(sealed) == header.size + len(plaintext) + 4 * TAG_SIZE
+
+    pieces = [sealed[i:i + 1000] for i in range(0, len(sealed), 1000)]
+    assert b''.join(encryptor.decrypt_stream(pieces, PASSWORD)) == plaintext
+    streamed = b''.join(encryptor.encrypt_stream([plaintext[:10], plaintext[10:]], PASSWORD))
+    assert encryptor.decrypt(streamed, PASSWORD) == plaintext
+    with pytest.raises(ValueError):
+        _encryptor(str(tmp_path)).decrypt(sealed, 'wrong password')
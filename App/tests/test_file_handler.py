@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from src.core.storage import SecureStorage
+
+PASSWORD = 'correct horse battery staple'
+DATA = os.urandom(3 * 64 * 1024 + 123)
+
+
+def _blob_files(vault_dir):
+    return [name for _, _, files in os.walk(os.path.join(vault_dir, 'blobs')) for name in files
+            if name.endswith('.enc')]
+
+
+@pytest.mark.parametrize('offset, length', [(0, 10), (64 * 1024 - 5, 10), (100, 3 * 64 * 1024),
+                                            (len(DATA) - 7, 100), (len(DATA) + 10, 5), (50, 0)])
+def test_read_range(file_handler, offset, length):
+    file_handler.add_stream([DATA], 'root/data.bin')
+    assert file_handler.read_range('root/data.bin', offset, length) == DATA[offset:offset + length]
+
+
+def test_read_range_rejects_negative_bounds(file_handler):
+    file_handler.add_stream([DATA], 'root/data.bin')
+    with pytest.raises(ValueError):
+        file_handler.read_range('root/data.bin', -1, 10)
+    with pytest.raises(FileNotFoundError):
+        file_handler.read_range('root/missing.bin', 0, 10)
+
+
+def test_identical_content_shares_one_blob(file_handler, vault_dir, tmp_path):
+    source = tmp_path / 'data.bin'
+    source.write_bytes(DATA)
+    file_handler.add_file(str(source), 'root/a.bin')
+    file_handler.add_stream([DATA[:1000], DATA[1000:]], 'root/copies/b.bin')
+    file_handler.add_stream([b'other'], 'root/c.bin')
+    blob = file_handler.storage.get_entry('root/a.bin').blob
+    assert file_handler.storage.get_entry('root/copies/b.bin').blob == blob
+    assert file_handler.storage.refcount(blob) == 2
+    assert len(_blob_files(vault_dir)) == 2
+
+    file_handler.delete_file('root/a.bin')
+    assert file_handler.storage.refcount(blob) == 1
+    assert file_handler.read_file('root/copies/b.bin') == DATA
+
+    file_handler.move_file('root/copies/b.bin', 'root/b.bin')
+    file_handler.delete_directory('root/copies')
+    assert file_handler.read_file('root/b.bin') == DATA
+    file_handler.delete_file('root/b.bin')
+    assert file_handler.storage.refcount(blob) == 0
+    assert len(_blob_files(vault_dir)) == 1
+
+
+def test_refcounts_are_rebuilt_after_restart(file_handler, vault_dir):
+    file_handler.add_stream([DATA], 'root/a.bin')
+    file_handler.add_stream([DATA], 'root/b.bin')
+    file_handler.storage.compact()
+    blob = file_handler.storage.get_entry('root/a.bin').blob
+
+    reopened = SecureStorage(vault_dir, PASSWORD)
+    try:
+        assert reopened.refcount(blob) == 2
+    finally:
+        reopened.close()
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from file_operations.service import FileOperations
+
+PASSWORD = 'correct horse battery staple'
+
+
+def test_list_fresh_vault(file_handler):
+    listing = FileOperations(file_handler).list_directory()
+    assert listing == {"directory": "root", "entries": [], "next_cursor": None}
+    assert file_handler.storage.seq == 0
+    assert not file_handler.directory_exists("root")
+
+
+def test_list_after_add(file_handler, tmp_path):
+    source = tmp_path / 'note.txt'
+    source.write_bytes(b'hello')
+    ops = FileOperations(file_handler)
+    ops.add_file(str(source), 'note.txt')
+    entries = ops.list_directory()["entries"]
+    assert [(entry["name"], entry["size"]) for entry in entries] == [("note.txt", 5)]
+
+
+def _blob_files(vault_dir):
+    return [name for _, _, files in os.walk(os.path.join(vault_dir, 'blobs')) for name in files
+            if name.endswith('.enc')]
+
+
+def test_failed_batch_rolls_back(file_handler, vault_dir, tmp_path, monkeypatch):
+    source = tmp_path / 'tree'
+    (source / 'docs').mkdir(parents=True)
+    (source / 'a.txt').write_bytes(b'first')
+    (source / 'docs' / 'b.txt').write_bytes(b'second')
+    ops = FileOperations(file_handler)
+    add_file = file_handler.storage._add_file
+
+    def failing_add_file(file_path, *args):
+        if file_path.endswith('b.txt'):
+            raise OSError("disk full")
+        return add_file(file_path, *args)
+
+    monkeypatch.setattr(file_handler.storage, '_add_file', failing_add_file)
+    with pytest.raises(OSError):
+        ops.add_tree(str(source))
+    assert ops.list_directory()["entries"] == []
+    assert _blob_files(vault_dir) == []
+
+    monkeypatch.undo()
+    assert ops.add_tree(str(source)) == 2
+    assert ops.read_file('docs/b.txt') == b'second'
+    assert len(_blob_files(vault_dir)) == 2
+
+
+def test_add_batch_missing_directory_is_not_found(client, vault_dir, tmp_path):
+    client.post('/system_operations/deploy', data={'base_path': vault_dir, 'master_password': PASSWORD})
+    response = client.post('/file_operations/add_batch', data={'src_dir': str(tmp_path / 'missing')})
+    assert response.status_code == 404
+    assert response.get_json() == {"error": "Directory not found"}
+
+
+def test_stream_honours_range_and_etag(client, vault_dir):
+    client.post('/system_operations/deploy', data={'base_path': vault_dir, 'master_password': PASSWORD})
+    data = os.urandom(200 * 1024)
+    response = client.post('/file_operations/upload?file_id=data.bin', data=data,
+                           content_type='application/octet-stream')
+    assert response.status_code == 200
+
+    full = client.get('/file_operations/stream?file_id=data.bin')
+    assert full.status_code == 200 and full.data == data
+    etag = full.headers['ETag']
+
+    partial = client.get('/file_operations/stream?file_id=data.bin', headers={'Range': 'bytes=65530-65545'})
+    assert partial.status_code == 206 and partial.data == data[65530:65546]
+    assert partial.headers['Content-Range'] == f'bytes 65530-65545/{len(data)}'
+
+    assert client.get('/file_operations/stream?file_id=data.bin',
+                      headers={'If-None-Match': etag}).status_code == 304
+    stale = client.get('/file_operations/stream?file_id=data.bin',
+                       headers={'Range': 'bytes=0-9', 'If-Range': '"stale"'})
+    assert stale.status_code == 200 and stale.data == data
+    unsatisfiable = client.get('/file_operations/stream?file_id=data.bin',
+                               headers={'Range': f'bytes={len(data)}-'})
+    assert unsatisfiable.status_code == 416
+    assert client.get('/file_operations/stream?file_id=missing.bin').status_code == 404
@@ -0,0 +1,64 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from src.core import index_format
+from src.core.blob_store import blob_path
+from src.core.container import (ContainerHeader, ContainerReader, KEY_WRAP_VAULT_HKDF, StreamDecryptor,
+                                StreamEncryptor)
+from src.core.path_index import FILE, Entry, PathIndex
+
+KEY = bytes(32)
+BLOB_ROOT = '/vault/blobs'
+
+
+def _digest(name: str) -> str:
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def _index(dirs: int, files: int) -> PathIndex:
+    index = PathIndex()
+    for d in range(dirs):
+        for f in range(files):
+            path = f'root/dir{d:03d}/file{f:03d}.bin'
+            index.set_file(path, Entry(FILE, blob_path(BLOB_ROOT, _digest(path)), 1000 + f, _digest(path)))
+    return index
+
+
+def _reader(data: bytes) -> ContainerReader:
+    header = ContainerHeader(KEY_WRAP_VAULT_HKDF, os.urandom(16), index_format.PAGE_SIZE)
+    stream = StreamEncryptor(KEY, header)
+    container = stream.begin() + stream.update(data) + stream.finalize()
+    return ContainerReader(io.BytesIO(container), StreamDecryptor(KEY, header), len(container))
+
+
+def test_binary_snapshot_round_trip():
+    index = _index(3, 4)
+    index.set_file('root/legacy.txt', Entry(FILE, '/vault/legacy.txt.enc', None))
+    index.make_directories('root/empty')
+    seq, loaded = index_format.load(index_format.dump(index, 42, BLOB_ROOT), BLOB_ROOT)
+    assert seq == 42
+    assert loaded.to_tree() == index.to_tree()
+    assert sorted(loaded.iter_blobs()) == sorted(index.iter_blobs())
+
+
+def test_lookup_only_decrypts_the_pages_it_reaches():
+    data = index_format.dump(_index(200, 50), 7, BLOB_ROOT)
+    seq, loaded = index_format.load(_reader(data), BLOB_ROOT)
+    pages = loaded._source.pages
+    total = -(-pages.length // pages.page_size)
+    assert seq == 7 and total > 20
+
+    path = 'root/dir150/file042.bin'
+    assert loaded.get(path).blob == _digest(path)
+    assert pages.loads <= 6
+    loaded.set_file('root/dir001/new.bin', Entry(FILE, '/vault/new.enc', 1))
+    assert pages.loads < total // 2
+    assert len(loaded) == 1 + 200 + 200 * 50 + 1
+
+
+def test_wrong_magic_is_rejected():
+    with pytest.raises(ValueError):
+        index_format.load(b'JSON' + bytes(64), BLOB_ROOT)
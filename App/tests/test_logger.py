@@ -0,0 +1,150 @@
+import gc
+import logging
+import threading
+import time
+import weakref
+
+import pytest
+
+from src.LogSystem.LoggerSystem import QUEUE_DROP, Logger, _backend, _ErrorLimiter, configure_logging
+
+
+class _Capture(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+@pytest.fixture
+def captured():
+    handler = _Capture()
+    logging.getLogger('Logger').addHandler(handler)
+    yield handler.records
+    logging.getLogger('Logger').removeHandler(handler)
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / 'test.log'
+    yield path
+    _backend.shutdown()
+    configure_logging(use_json=True)
+
+
+def test_full_queue_drops_and_shutdown_drains(log_file, monkeypatch):
+    logger = configure_logging(str(log_file), async_mode=True, queue_size=2, queue_policy=QUEUE_DROP,
+                               level=logging.DEBUG)
+    file_handler = _backend.handlers[1]
+    release = threading.Event()
+    emit = file_handler.emit
+
+    def stalled_emit(record):
+        release.wait(5)
+        emit(record)
+
+    # The listener stalls on the first record, so everything after two more is dropped.
+    monkeypatch.setattr(file_handler, 'emit', stalled_emit)
+    for i in range(20):
+        logger.debug(f"record {i}")
+    dropped = _backend.dropped_records
+    assert dropped > 0
+
+    release.set()
+    _backend.shutdown()
+    lines = log_file.read_text().splitlines()
+    accepted = [line for line in lines if ' - DEBUG - record ' in line]
+    assert len(accepted) == 20 - dropped
+    assert f"{dropped} log records were dropped" in lines[-1]
+
+
+def test_summary_is_written_after_errors_stop(captured):
+    logger = Logger(use_json=True, error_threshold=1, error_summary_interval=0.1)
+    logger.error("Failed to read /vault/a.bin")
+    logger.error("Failed to read /vault/b.bin")
+    deadline = time.monotonic() + 5
+    while not any('1 similar errors suppressed' in record.getMessage() for record in captured):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_loggers_are_not_kept_alive():
+    logger = weakref.ref(Logger(use_json=True))
+    gc.collect()
+    assert logger() is None
+
+
+def test_extra_fields_reach_plain_records(captured):
+    logger = Logger(use_json=True)
+    logger.use_json = False
+    logger.info("uploaded", {"file_id": "a.txt", "message": "spoofed", "asctime": "never"})
+    record = captured[-1]
+    assert record.getMessage() == "uploaded"
+    assert record.file_id == "a.txt"
+    assert not hasattr(record, 'asctime')
+
+
+def test_conflicting_backend_settings_warn():
+    with pytest.warns(RuntimeWarning, match="configure_logging"):
+        Logger(use_json=True, max_log_size=1024)
+
+
+def test_records_do_not_propagate_to_root(captured):
+    root = _Capture()
+    logging.getLogger().addHandler(root)
+    try:
+        Logger(use_json=True).warning("once")
+    finally:
+        logging.getLogger().removeHandler(root)
+    assert [record.getMessage() for record in captured][-1].endswith('"once", "trace_id": null}')
+    assert root.records == []
+
+
+def test_tracing_is_off_until_configured(captured):
+    logger = Logger(use_json=True)
+    traced = logger.log_function()(lambda value: value)
+    traced(1)
+    assert not any('<lambda>' in record.getMessage() for record in captured)
+    try:
+        logger.configure_tracing(level='DEBUG')
+        traced(1)
+    finally:
+        _backend.logger.setLevel(logging.INFO)
+    assert any('<lambda>(value=1)' in record.getMessage() for record in captured)
+
+
+def test_traces_redact_secrets_and_describe_payloads(captured):
+    logger = Logger(use_json=True, trace_level=logging.INFO, max_arg_length=20)
+
+    def store(path, master_password, data, options):
+        return len(data)
+
+    logger.log_function()(store)('x' * 100, 'hunter2', b'secret bytes', {'content': b'\x00' * 10})
+    message = [record.getMessage() for record in captured if 'store(' in record.getMessage()][-1]
+    assert 'hunter2' not in message and 'secret bytes' not in message
+    assert 'master_password=<redacted>' in message
+    assert 'data=<redacted>' not in message and '<bytes len=12>' in message
+    assert "'" + 'x' * 100 not in message and '<bytes len=10>' in message
+
+
+def test_error_limiter_groups_by_template_and_summarizes():
+    limiter = _ErrorLimiter(threshold=2, window=10.0, capacity=2, summary_interval=5.0)
+    template = "Failed to read <path> after <n> tries"
+    assert limiter.admit("Failed to read /vault/a.bin after 3 tries", now=0.0) == (True, [])
+    assert limiter.admit("Failed to read /vault/b.bin after 4 tries", now=0.0) == (True, [])
+    assert limiter.admit("Failed to read /vault/c.bin after 5 tries", now=0.0) == (
+        False, [f"Suppressing similar errors for: {template}"])
+    assert limiter.admit("Failed to read /vault/d.bin after 6 tries", now=1.0) == (False, [])
+    assert limiter.due(now=4.0) == []
+    # Refilled after the window; the next admitted error carries what was suppressed.
+    assert limiter.admit("Failed to read /vault/e.bin after 7 tries", now=20.0) == (
+        True, [f"2 similar errors suppressed: {template}"])
+
+    for _ in range(3):
+        limiter.admit("Disk full", now=30.0)
+    assert limiter.due(now=34.0) == []
+    assert limiter.due(now=35.0) == ["1 similar errors suppressed: Disk full"]
+    limiter.admit("Permission denied", now=36.0)
+    assert len(limiter) == 2
@@ -0,0 +1,28 @@
+import io
+
+import pytest
+
+from src.core import metrics
+from src.core.metrics import BYTES_PROCESSED, PHASE_DISK_IO, _Metric
+from src.core.utils import write_chunks
+
+
+class _FailingFile(io.BytesIO):
+    def write(self, data):
+        if self.tell():
+            raise OSError("disk full")
+        return super().write(data)
+
+
+def test_write_chunks_counts_bytes_written_before_a_failure():
+    counter = BYTES_PROCESSED.labels(PHASE_DISK_IO, 'write')
+    before = counter.value
+    with pytest.raises(OSError):
+        write_chunks(_FailingFile(), [b'x' * 100, b'y' * 50])
+    assert counter.value - before == 100
+
+
+def test_metric_base_is_abstract():
+    with pytest.raises(TypeError):
+        _Metric('novelmind_test', 'Abstract.')
+    assert 'novelmind_bytes_total{phase="disk_io",direction="write"}' in metrics.render()
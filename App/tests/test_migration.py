@@ -0,0 +1,33 @@
+import os
+
+from src.core import migration
+from src.core.vault import open_vault
+from system_operations.service import SystemOperations
+
+PASSWORD = 'correct horse battery staple'
+
+
+def test_main_migrates_baseline_vault_with_its_own_keys(baseline_vault, monkeypatch):
+    monkeypatch.setattr(migration.getpass, 'getpass', lambda prompt: PASSWORD)
+    working_directory = sorted(os.listdir('.'))
+    assert migration.main([baseline_vault]) == 0
+    assert sorted(os.listdir('.')) == working_directory
+
+    encryptor = open_vault(baseline_vault, PASSWORD).encryptor
+    for name in ('note.txt.enc', 'index.enc'):
+        with open(os.path.join(baseline_vault, name), 'rb') as f:
+            assert not encryptor.is_legacy_format(f.read())
+    assert SystemOperations.deploy(baseline_vault, PASSWORD).read_file('note.txt') == b'hello'
+
+
+def test_main_leaves_working_directory_alone(vault_dir, tmp_path, monkeypatch):
+    SystemOperations.deploy(vault_dir, PASSWORD)
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    monkeypatch.setattr(migration.getpass, 'getpass', lambda prompt: PASSWORD)
+    vault_key = open(os.path.join(vault_dir, 'vault_key.enc'), 'rb').read()
+    assert migration.main([vault_dir]) == 0
+    assert os.listdir(elsewhere) == []
+    assert open(os.path.join(vault_dir, 'vault_key.enc'), 'rb').read() == vault_key
+
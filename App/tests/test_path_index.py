@@ -0,0 +1,57 @@
+import pytest
+
+from src.core.path_index import DIRECTORY, FILE, Entry, PathIndex
+
+
+def _file(size: int) -> Entry:
+    return Entry(FILE, f'/blobs/{size}.enc', size)
+
+
+def test_set_file_creates_parents_and_lists_children():
+    index = PathIndex()
+    index.set_file('root/docs/a.txt', _file(1))
+    index.set_file('/root//docs/b.txt/', _file(2))
+    assert index.is_directory('root/docs')
+    assert [(name, entry.size) for name, entry in index.children('root/docs')] == [('a.txt', 1), ('b.txt', 2)]
+    assert index.get('root/docs/b.txt').size == 2
+    assert 'root/docs/c.txt' not in index
+
+
+def test_move_directory_rekeys_the_subtree():
+    index = PathIndex()
+    index.set_file('root/a/b/c.txt', _file(3))
+    index.set_file('root/x.txt', _file(4))
+    index.move('root/a', 'root/z/a')
+    assert index.get('root/a') is None
+    assert index.get('root/z/a/b/c.txt').size == 3
+    assert sorted(path for path, _ in index.walk_files('root')) == ['root/x.txt', 'root/z/a/b/c.txt']
+    with pytest.raises(ValueError):
+        index.move('root/z', 'root/z/a/inner')
+
+
+def test_remove_directory_drops_descendants():
+    index = PathIndex()
+    index.set_file('root/a/b/c.txt', _file(3))
+    assert index.remove('root/a').kind == DIRECTORY
+    assert index.get('root/a/b/c.txt') is None
+    assert len(index) == 1
+    with pytest.raises(ValueError):
+        index.remove('')
+
+
+def test_file_in_the_way_of_a_directory_is_rejected():
+    index = PathIndex()
+    index.set_file('root/a', _file(1))
+    with pytest.raises(NotADirectoryError):
+        index.make_directories('root/a/b')
+
+
+def test_tree_round_trip():
+    index = PathIndex()
+    index.set_file('root/a/c.txt', _file(3))
+    index.make_directories('root/empty')
+    tree = index.to_tree()
+    assert tree == {"type": DIRECTORY, "contents": {"root": {"type": DIRECTORY, "contents": {
+        "a": {"type": DIRECTORY, "contents": {"c.txt": {"type": FILE, "path": '/blobs/3.enc', "size": 3}}},
+        "empty": {"type": DIRECTORY, "contents": {}}}}}}
+    assert PathIndex.from_tree(tree).to_tree() == tree
@@ -0,0 +1,56 @@
+import pytest
+
+from src.core.vault import open_vault
+
+PASSWORD = 'correct horse battery staple'
+
+
+def _deploy(client, vault_dir, **form):
+    return client.post('/system_operations/deploy',
+                       data={'base_path': vault_dir, 'master_password': PASSWORD, **form})
+
+
+def test_redeploy_applies_cache_budget(client, vault_dir):
+    assert _deploy(client, vault_dir).status_code == 200
+    handler = open_vault(vault_dir, PASSWORD).file_handler
+    assert handler.content_cache is None
+
+    assert _deploy(client, vault_dir, cache_bytes='4096').status_code == 200
+    assert open_vault(vault_dir, PASSWORD).file_handler is handler
+    assert handler.content_cache.max_bytes == 4096
+
+    assert _deploy(client, vault_dir, cache_bytes='0').status_code == 200
+    assert handler.content_cache is None
+
+
+@pytest.mark.parametrize('cache_bytes', ['lots', '-1'])
+def test_invalid_cache_budget_is_rejected(client, vault_dir, cache_bytes):
+    response = _deploy(client, vault_dir, cache_bytes=cache_bytes)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cache_bytes"}
+
+
+def test_deploy_applies_pool_settings(client, vault_dir):
+    assert _deploy(client, vault_dir, max_workers='3', max_in_flight_jobs='5').status_code == 200
+    handler = open_vault(vault_dir, PASSWORD).file_handler
+    assert (handler.workers.max_workers, handler.workers.max_in_flight_jobs) == (3, 5)
+
+    assert _deploy(client, vault_dir, max_workers='2').status_code == 200
+    assert (handler.workers.max_workers, handler.workers.max_in_flight_jobs) == (2, 4)
+
+
+@pytest.mark.parametrize('name', ['max_workers', 'max_in_flight_jobs'])
+def test_invalid_pool_settings_are_rejected(client, vault_dir, name):
+    response = _deploy(client, vault_dir, **{name: '0'})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": f"Invalid {name}"}
+
+
+def test_deploy_applies_durability_settings(client, vault_dir):
+    assert _deploy(client, vault_dir, fsync_policy='always', compact_threshold='50').status_code == 200
+    storage = open_vault(vault_dir, PASSWORD).file_handler.storage
+    assert (storage.journal.fsync_policy, storage.compact_threshold) == ('always', 50)
+
+    response = _deploy(client, vault_dir, fsync_policy='sometimes')
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid fsync_policy"}
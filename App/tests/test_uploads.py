@@ -0,0 +1,53 @@
+import pytest
+
+from src.core.uploads import UploadManager
+
+CHUNK_SIZE = 1024
+DATA = bytes(range(256)) * 10
+
+
+def _fail_store(file_handler, monkeypatch):
+    def store_blob(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(file_handler, 'store_blob', store_blob)
+
+
+def test_upload_resumes_after_restart(file_handler):
+    session = file_handler.uploads.create('root/data.bin', CHUNK_SIZE)
+    assert session.write([DATA[:2500]], 0) == 2500
+
+    manager = UploadManager(file_handler)
+    restored = manager.get(session.session_id)
+    # The buffered tail of an unfinished chunk was never written, so the client resends it.
+    assert restored.offset == 2 * CHUNK_SIZE
+    assert restored.write([DATA[restored.offset:]], restored.offset) == len(DATA)
+    assert manager.complete(session.session_id) == {"path": 'root/data.bin', "size": len(DATA)}
+    assert file_handler.read_file('root/data.bin') == DATA
+
+
+def test_failed_store_can_be_retried(file_handler, monkeypatch):
+    session = file_handler.uploads.create('root/data.bin', CHUNK_SIZE)
+    session.write([DATA], 0)
+    _fail_store(file_handler, monkeypatch)
+    with pytest.raises(OSError):
+        file_handler.uploads.complete(session.session_id)
+
+    monkeypatch.undo()
+    assert file_handler.uploads.complete(session.session_id) == {"path": 'root/data.bin', "size": len(DATA)}
+    assert file_handler.read_file('root/data.bin') == DATA
+
+
+def test_full_size_final_chunk_survives_restart(file_handler, monkeypatch):
+    data = DATA[:2 * CHUNK_SIZE]
+    session = file_handler.uploads.create('root/data.bin', CHUNK_SIZE)
+    session.write([data], 0)
+    _fail_store(file_handler, monkeypatch)
+    with pytest.raises(OSError):
+        file_handler.uploads.complete(session.session_id)
+
+    monkeypatch.undo()
+    manager = UploadManager(file_handler)
+    assert manager.get(session.session_id).offset == len(data)
+    assert manager.complete(session.session_id) == {"path": 'root/data.bin', "size": len(data)}
+    assert file_handler.read_file('root/data.bin') == data
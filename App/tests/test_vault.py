@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from src.core.encryption import AdvancedEncryptor
+from src.core.vault import open_vault
+from system_operations.service import SystemOperations
+
+PASSWORD = 'correct horse battery staple'
+
+
+def test_wrong_password_keeps_open_vault(vault_dir):
+    vault = open_vault(vault_dir, PASSWORD)
+    with pytest.raises(ValueError):
+        open_vault(vault_dir, 'wrong password')
+    assert open_vault(vault_dir, PASSWORD) is vault
+
+
+def test_baseline_vault_deploys_with_working_directory_keys(baseline_vault):
+    handler = SystemOperations.deploy(baseline_vault, PASSWORD)
+    assert handler.read_file('note.txt') == b'hello'
+    assert (open(os.path.join(baseline_vault, 'rsa_key.pem'), 'rb').read()
+            == open('rsa_key.pem', 'rb').read())
+
+
+def test_wrong_password_does_not_upgrade_baseline_vault(baseline_vault):
+    with pytest.raises(ValueError):
+        SystemOperations.deploy(baseline_vault, 'wrong password')
+    assert not os.path.exists(os.path.join(baseline_vault, 'vault_key.enc'))
+    assert SystemOperations.deploy(baseline_vault, PASSWORD).read_file('note.txt') == b'hello'
+
+
+def test_wrong_password_after_restart_does_not_lock_out(vault_dir, monkeypatch):
+    SystemOperations.deploy(vault_dir, PASSWORD)
+    monkeypatch.setattr('src.core.vault._vaults', {})
+    with pytest.raises(ValueError):
+        SystemOperations.deploy(vault_dir, 'wrong password')
+    SystemOperations.deploy(vault_dir, PASSWORD)
+
+
+def test_new_vault_does_not_adopt_working_directory_keys(tmp_path, monkeypatch):
+    legacy_dir = tmp_path / 'cwd'
+    legacy_dir.mkdir()
+    monkeypatch.chdir(legacy_dir)
+    AdvancedEncryptor().encrypt(b'payload', PASSWORD)
+
+    vault_dir = tmp_path / 'new-vault'
+    vault_dir.mkdir()
+    vault = open_vault(str(vault_dir), PASSWORD)
+    vault.warm_up()
+    assert (vault_dir / 'salt.key').read_bytes() != (legacy_dir / 'salt.key').read_bytes()